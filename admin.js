@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize charts
     initCharts();
+    
+    // Listen for new orders and status changes
+    connectOrderEvents();
 });
 
 function setupEventListeners() {
@@ -83,14 +86,14 @@ function showSection(sectionId) {
 
 async function loadDashboardData() {
     try {
-        // In a real app, we would fetch this data from the API
-        // For now, we'll use the data already in the page
+        const response = await fetch('/api/admin/stats');
+        const stats = await response.json();
         
         // Update stats with animated counters
-        animateCounter('Total Revenue', 24589, '$');
-        animateCounter('Total Orders', 156, '');
-        animateCounter('New Customers', 42, '');
-        animateCounter('Pending Orders', 8, '');
+        animateCounter('Total Revenue', stats.total_revenue, '$');
+        animateCounter('Total Orders', stats.total_orders, '');
+        animateCounter('Customers', stats.customers, '');
+        animateCounter('Pending Orders', stats.pending_orders, '');
         
     } catch (error) {
         console.error('Error loading dashboard data:', error);
@@ -98,8 +101,10 @@ async function loadDashboardData() {
 }
 
 function animateCounter(title, targetValue, prefix = '') {
-    const statCard = document.querySelector(`.stat-info h3:nth-child(1):not(:has(+ .stat-value))`);
-    const statElement = document.querySelector(`.stat-info h3:-soup-contains("${title}") ~ .stat-value`);
+    // Find the card by its heading text; CSS has no selector for that
+    const heading = Array.from(document.querySelectorAll('.stat-info h3'))
+        .find(h3 => h3.textContent.trim() === title);
+    const statElement = heading && heading.parentElement.querySelector('.stat-value');
     
     if (statElement) {
         let currentValue = 0;
@@ -121,6 +126,62 @@ function animateCounter(title, targetValue, prefix = '') {
     }
 }
 
+function connectOrderEvents() {
+    // The server pushes order changes; EventSource reconnects by itself and
+    // resumes after the last event it saw
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource('/api/events');
+    
+    source.addEventListener('order.created', function(e) {
+        const order = JSON.parse(e.data);
+        const list = document.querySelector('.orders-card .orders-list');
+        if (list) {
+            const item = document.createElement('div');
+            item.className = 'order-item';
+            item.innerHTML = `
+                <div class="order-info">
+                    <p class="order-id"></p>
+                    <p class="order-date"></p>
+                </div>
+                <div class="order-customer"></div>
+                <div class="order-amount"></div>
+                <div class="order-status"></div>
+            `;
+            item.querySelector('.order-id').textContent = '#' + order.order_number;
+            item.querySelector('.order-date').textContent = order.date;
+            item.querySelector('.order-customer').textContent = 'Customer #' + order.user_id;
+            item.querySelector('.order-amount').textContent = '$' + order.total.toFixed(2);
+            list.prepend(item);
+            setOrderStatus(item, order.status);
+        }
+        loadDashboardData();
+    });
+    
+    source.addEventListener('order.status', function(e) {
+        const order = JSON.parse(e.data);
+        document.querySelectorAll('.order-item').forEach(item => {
+            const orderId = item.querySelector('.order-id');
+            if (orderId && orderId.textContent === '#' + order.order_number) {
+                setOrderStatus(item, order.status);
+            }
+        });
+        loadDashboardData();
+    });
+    
+    // Sent when this dashboard missed events (e.g. it was offline too long)
+    source.addEventListener('resync', loadDashboardData);
+}
+
+function setOrderStatus(orderItem, status) {
+    const badge = orderItem.querySelector('.order-status');
+    if (badge) {
+        badge.className = 'order-status ' + status;
+        badge.textContent = status.charAt(0).toUpperCase() + status.slice(1);
+    }
+}
+
 function initCharts() {
     // In a real app, we would use a charting library like Chart.js
     // For this demo, we'll just add a placeholder
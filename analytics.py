@@ -0,0 +1,136 @@
+import heapq
+import threading
+import time
+from collections import Counter
+
+
+def _cents(amount):
+    return round(float(amount or 0) * 100)
+
+
+def _product_id(item):
+    # Orders placed from the cart carry 'id' rather than 'product_id'
+    return item.get('product_id', item.get('id'))
+
+
+class SalesStats:
+    """
+    Running sales aggregates for the admin dashboard.
+
+    record() folds each new order into revenue per day, units per product and
+    order counts by status, so the dashboard reads a handful of counters
+    instead of re-scanning every order. Money is summed in integer cents.
+    Cancelled orders keep their place in the status counts but add no
+    revenue or units; cancelled() takes back what an order added.
+
+    Workers sharing a store never see each other's record() calls, so
+    start_refresher() rebuilds from the order history on a background
+    thread; requests only ever read the counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+        self._reset()
+
+    def _reset(self):
+        self.order_count = 0
+        self.revenue_cents = 0
+        self.revenue_by_day = Counter()
+        self.units_by_product = Counter()
+        self.product_names = {}
+        self.orders_by_status = Counter()
+        self.built = time.monotonic()
+        self._top = None
+
+    def record(self, order):
+        """Fold one newly placed order into the aggregates"""
+        with self._lock:
+            self._add(order)
+
+    def _add(self, order):
+        self.order_count += 1
+        self.orders_by_status[order.get('status')] += 1
+        # Cancelled orders are counted, but earned nothing and sold nothing
+        if order.get('status') != 'cancelled':
+            self._sales(order, 1)
+
+    def _sales(self, order, sign):
+        cents = _cents(order.get('total'))
+        day = order.get('date')
+        self.revenue_cents += sign * cents
+        self.revenue_by_day[day] += sign * cents
+        if self.revenue_by_day[day] <= 0:
+            del self.revenue_by_day[day]
+        for item in order.get('items') or ():
+            product_id = _product_id(item)
+            self.units_by_product[product_id] += sign * int(item.get('quantity', 1))
+            if self.units_by_product[product_id] <= 0:
+                del self.units_by_product[product_id]
+            self.product_names.setdefault(product_id, item.get('name'))
+        self._top = None
+
+    def cancelled(self, order):
+        """Take a cancelled order's revenue and units back out of the aggregates"""
+        with self._lock:
+            self._sales(order, -1)
+
+    def status_changed(self, old_status, new_status, count=1):
+        """Move orders between status buckets"""
+        with self._lock:
+            self.orders_by_status[old_status] -= count
+            if self.orders_by_status[old_status] <= 0:
+                del self.orders_by_status[old_status]
+            self.orders_by_status[new_status] += count
+
+    def rebuild(self, orders):
+        """Recompute every aggregate from the full order history in one pass"""
+        fresh = SalesStats()
+        for order in orders:
+            fresh._add(order)
+        with self._lock:
+            self.__dict__.update({k: v for k, v in fresh.__dict__.items()
+                                  if k not in ('_lock', '_stop', '_refresher')})
+
+    def start_refresher(self, load, interval):
+        """Run rebuild(load()) every interval seconds on a background thread"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.rebuild(load())
+                except Exception:
+                    # Keep serving the last aggregates; the next round retries
+                    continue
+
+        self._refresher = threading.Thread(target=run, daemon=True, name='sales-stats-refresher')
+        self._refresher.start()
+        return self
+
+    def stop_refresher(self):
+        self._stop.set()
+
+    def top_products(self, limit=5):
+        with self._lock:
+            if self._top is None or len(self._top) < limit:
+                self._top = heapq.nlargest(limit, self.units_by_product.items(), key=lambda kv: kv[1])
+            return [
+                {"product_id": product_id, "name": self.product_names.get(product_id), "units": units}
+                for product_id, units in self._top[:limit]
+            ]
+
+    def snapshot(self, days=30):
+        """Return the dashboard payload"""
+        top = self.top_products()
+        with self._lock:
+            recent_days = sorted(d for d in self.revenue_by_day if d)[-days:]
+            return {
+                "total_orders": self.order_count,
+                "total_revenue": self.revenue_cents / 100,
+                "orders_by_status": dict(self.orders_by_status),
+                "pending_orders": self.orders_by_status.get('pending', 0),
+                "revenue_by_day": [
+                    {"date": day, "revenue": self.revenue_by_day[day] / 100} for day in recent_days
+                ],
+                "top_products": top
+            }
@@ -1,20 +1,76 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
+import io
 import json
 import os
 import hashlib
 import secrets
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import itertools
 import random
 import string
-from datetime import datetime, timedelta
+from datetime import datetime
 
-app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)  # Secure random key
+import click
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-# In-memory storage (in production, use a database)
-users = [
+import assets
+import bulk
+import records
+from jsonprovider import FastJSONProvider, compress_responses
+from analytics import SalesStats
+from cart import CartEngine
+from catalog import CatalogCache, CatalogIndex
+from checkout import Checkout, OrderError
+from events import EventBus, TooManySubscribers
+from history import OrderHistoryCache
+from mailer import Mailer, SMTPTransport
+from metrics import RequestMetrics
+from passwords import HasherBusy, PasswordHasher
+from ratelimit import RateLimited, RateLimiter
+from sessions import StoreSessionInterface, shared_secret
+from store import open_store
+from ttl import TTLStore
+from workflow import OrderWorkflow, TransitionError
+
+app = Flask(__name__, static_folder=None)
+
+# Behind reverse proxies, TRUSTED_PROXIES is how many of them add X-Forwarded-For
+# and X-Forwarded-Proto; request.remote_addr (which rate limits key on) is then
+# the client address the outermost trusted proxy saw. Headers are ignored with 0.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+# orjson-backed encoding that understands our record types (see jsonprovider.py)
+app.json = FastJSONProvider(app)
+
+# Built assets (see assets.py): hashed file names from the manifest get
+# immutable caching, and templates can look them up with asset_url(). The
+# pages and assets are built here when missing or stale, whatever server
+# imports the app.
+STATIC_DIR = os.path.join(app.root_path, 'static')
+TEMPLATE_DIR = os.path.join(app.root_path, app.template_folder)
+assets.ensure_built(app.root_path, STATIC_DIR, TEMPLATE_DIR)
+asset_manifest = {}
+hashed_assets = set()
+
+def load_asset_manifest():
+    asset_manifest.clear()
+    asset_manifest.update(assets.load_manifest(STATIC_DIR))
+    hashed_assets.clear()
+    hashed_assets.update(asset_manifest.values())
+
+load_asset_manifest()
+app.jinja_env.globals['asset_url'] = lambda name: f"/static/{asset_manifest.get(name, name)}"
+
+# Storage backend: memory:// (default), memory:///path/to/journal-dir to keep the
+# in-memory store across restarts, or sqlite:///path/to/guptas.db to also share
+# state across worker processes
+db = open_store(os.environ.get('STORE_URL', 'memory://'))
+
+# Signing key: SECRET_KEY if set, otherwise one generated once and kept in the
+# store, so restarts of a durable store and every worker sharing it agree
+app.secret_key = os.environ.get('SECRET_KEY') or shared_secret(db.table('settings', key='name'))
+
+users = db.table('users', unique=('email',), record_type=records.User, rows=[
     {
         "id": 1,
         "first_name": "John",
@@ -27,9 +83,9 @@ users = [
         "role": "user",
         "verified": True
     }
-]
+])
 
-admins = [
+admins = db.table('admins', unique=('username',), rows=[
     {
         "id": 1,
         "username": "admin",
@@ -37,9 +93,9 @@ admins = [
         "pin": hashlib.sha256("1234".encode()).hexdigest(),
         "last_login": "2023-06-15 10:30:00"
     }
-]
+])
 
-products = [
+products = db.table('products', record_type=records.Product, rows=[
     {
         "id": 1,
         "name": "Gulab Jamun",
@@ -76,9 +132,9 @@ products = [
         "image": "barfi.jpg",
         "in_stock": True
     }
-]
+])
 
-orders = [
+orders = db.table('orders', multi=('user_id', 'status'), ordered=('date',), record_type=records.Order, rows=[
     {
         "id": 1,
         "order_number": "ORD7821",
@@ -92,20 +148,139 @@ orders = [
         "date": "2023-06-15",
         "address": "123 Saffron Street, Delhi, India"
     }
-]
+])
+
+# Per-entity ID allocators, seeded past the highest existing ID so deleted
+# records never have their ID reused
+user_ids = db.sequence('users', start=max((u['id'] for u in users), default=0))
+product_ids = db.sequence('products', start=max((p['id'] for p in products), default=0))
+order_ids = db.sequence('orders', start=max((o['id'] for o in orders), default=0))
+order_numbers = db.sequence('order_numbers', start=9000)
+
+# Password hashing runs on a bounded pool; cost is 2**PASSWORD_HASH_COST scrypt rounds.
+# Seeded accounts still carry legacy SHA-256 hashes and are upgraded on first login.
+hasher = PasswordHasher(n=2 ** int(os.environ.get('PASSWORD_HASH_COST', 14)))
+
+# Storage for OTPs and password reset tokens. Entries expire on their own
+# (15 minutes for OTPs, 1 hour for reset links), a background sweeper drops
+# abandoned ones and a hard capacity bounds memory.
+OTP_TTL = 15 * 60
+RESET_TOKEN_TTL = 60 * 60
+otps = TTLStore(db.table('otps', key='email'), ttl=OTP_TTL, capacity=50000).start_sweeper(db.shared)
+password_reset_tokens = TTLStore(db.table('password_reset_tokens', key='email', unique=('token',)),
+                                 ttl=RESET_TOKEN_TTL, capacity=50000).start_sweeper(db.shared)
+
+# Sessions live server-side in the store (the cookie only holds a random id), so
+# workers sharing the store share sessions and logout revokes them.
+# SESSION_BACKEND=cookie keeps Flask's signed-cookie sessions instead.
+SESSION_TTL = 7 * 24 * 60 * 60
+sessions = None
+if os.environ.get('SESSION_BACKEND', 'store') == 'store':
+    sessions = TTLStore(db.table('sessions', key='sid'), ttl=SESSION_TTL, capacity=1000000).start_sweeper(db.shared)
+    app.session_interface = StoreSessionInterface(sessions, ttl=SESSION_TTL)
+
+# Throttles for login, registration and OTP/reset endpoints, checked before any
+# hashing or email work. Buckets are per action and client IP, and per action and
+# email (or admin username); workers sharing a store share the buckets too.
+ip_limiter = RateLimiter(burst=20, per=60, table=db.table('rate_limits_ip', key='key') if db.shared else None)
+account_limiter = RateLimiter(burst=5, per=300, table=db.table('rate_limits_account', key='key') if db.shared else None)
+
+def throttle(action, account=None):
+    """Count one attempt at action, raising RateLimited if the client or account is over its limit"""
+    ip_limiter.check(f"{action}:{request.remote_addr}")
+    if account:
+        account_limiter.check(f"{action}:{str(account).strip().lower()}")
+
+# Pre-serialised product list, rebuilt only after admin catalog changes
+catalog = CatalogCache(products.all, dumps=app.json.dumps_bytes, max_age=5 if db.shared else None)
+# Category, price, stock and text indexes behind /api/products queries
+catalog_index = CatalogIndex(products.all, max_age=5 if db.shared else None)
+# Reprices orders from the index and reserves counted stock
+checkout = Checkout(products, catalog_index)
+# Validates CSV/NDJSON catalog imports and applies each one as a single batch
+product_import = bulk.ProductImport(products, catalog_index, product_ids.next)
+
+# Order status state machine (pending -> processing -> shipped -> delivered, or cancelled)
+order_workflow = OrderWorkflow(orders)
 
-# In-memory storage for OTPs and password reset tokens
-otps = {}
-password_reset_tokens = {}
+# Dashboard aggregates, seeded from order history and updated as orders arrive.
+# Workers sharing a store only see their own new orders, so they also rebuild
+# every STATS_REFRESH seconds in the background, never on a request.
+sales_stats = SalesStats()
+sales_stats.rebuild(orders.scan())
+STATS_REFRESH = 60
+if db.shared:
+    sales_stats.start_refresher(orders.scan, STATS_REFRESH)
+
+# Server-side carts, keyed by user id; kept in the store when workers share it
+carts = CartEngine(catalog_index.prices, table=db.table('carts', key='user_id') if db.shared else None,
+                   max_quantity=checkout.max_quantity)
+
+# Encoded /api/user/orders bodies; a user's entry is dropped when they place an
+# order or one of their orders changes status
+order_history = OrderHistoryCache(lambda user_id: orders.find('user_id', user_id), app.json.dumps_bytes,
+                                  max_age=5 if db.shared else None)
+
+# Order events pushed to dashboards over /api/events: admins hear about every
+# order, customers about their own (topic "user:<id>")
+events = EventBus(dumps=app.json.dumps_bytes)
+
+def publish_order(event, order):
+    """Push an order change to the admin dashboards and the customer's own"""
+    summary = {key: order[key] for key in ('id', 'order_number', 'user_id', 'total', 'status', 'date')}
+    events.publish(('admin', f"user:{order['user_id']}"), event, summary)
+
+# Request latency/count metrics and store sizes, scraped from /metrics
+request_metrics = RequestMetrics()
+request_metrics.init_app(app)
+for name, sized in (('users', users), ('products', products), ('orders', orders), ('otps', otps),
+                    ('password_reset_tokens', password_reset_tokens), ('carts', carts)):
+    request_metrics.gauge(f'store_{name}', f'Number of {name.replace("_", " ")} held.', sized.__len__)
+if sessions is not None:
+    request_metrics.gauge('store_sessions', 'Number of sessions held.', sessions.__len__)
+# Runtime state of the caches, limiters and queues, one gauge per stats() field
+request_metrics.gauges('order_history_cache', 'Order history cache', order_history.stats)
+request_metrics.gauges('event', 'Dashboard event streams', events.stats)
+request_metrics.gauges('rate_limit_ip', 'Per-IP attempt throttle', ip_limiter.stats)
+request_metrics.gauges('rate_limit_account', 'Per-account attempt throttle', account_limiter.stats)
+request_metrics.gauges('otp_store', 'OTP store', otps.stats)
+request_metrics.gauges('reset_token_store', 'Password reset token store', password_reset_tokens.stats)
+if sessions is not None:
+    request_metrics.gauges('session_store', 'Session store', sessions.stats)
+
+# Large JSON bodies are compressed for clients that accept it (COMPRESS_JSON=0 turns this off)
+if os.environ.get('COMPRESS_JSON', '1') != '0':
+    compress_responses(app, min_size=1024)
+
+# With a journaled store, answer only once the request's writes are on disk.
+# Registered after the metrics hooks so it runs first and is timed with the request.
+@app.after_request
+def sync_store(response):
+    db.sync()
+    return response
+
+if db.journal is not None:
+    request_metrics.gauge('journal_queued', 'Store changes waiting for the next group commit.',
+                          lambda: db.journal.stats()['queued'])
 
 # Email configuration (for demo purposes)
 EMAIL_CONFIG = {
     "smtp_server": "smtp.gmail.com",
     "smtp_port": 587,
     "email": "noreply.guptassweets@gmail.com",
-    "password": "your-app-password"
+    "password": "your-app-password",
+    "use_tls": True
 }
 
+# Emails are printed unless EMAIL_BACKEND=smtp, in which case each delivery
+# worker keeps its own SMTP connection to EMAIL_CONFIG's server
+if os.environ.get('EMAIL_BACKEND') == 'smtp':
+    mailer = Mailer(EMAIL_CONFIG['email'], transport_factory=lambda: SMTPTransport(EMAIL_CONFIG))
+else:
+    mailer = Mailer(EMAIL_CONFIG['email'])
+request_metrics.gauge('mail_queue_depth', 'Emails waiting for delivery.', mailer.pending)
+request_metrics.gauges('password_hashes', 'Password hasher', hasher.stats)
+
 def generate_otp():
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
@@ -116,15 +291,22 @@ def generate_token():
 
 def send_email(to_email, subject, body):
     """
-    Send email function
-    In a real application, you would use a proper email service
-    For this demo, we'll just print the email content
+    Queue an email for background delivery
+    Raises queue.Full when the delivery backlog is at capacity
     """
-    print(f"EMAIL TO: {to_email}")
-    print(f"SUBJECT: {subject}")
-    print(f"BODY: {body}")
-    print("-" * 50)
-    return True
+    return mailer.send(to_email, subject, body)
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    response = jsonify({"success": False, "message": "Server is busy, please try again shortly."})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.errorhandler(RateLimited)
+def rate_limited(e):
+    response = jsonify({"success": False, "message": "Too many attempts, please try again later."})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
 
 @app.route('/')
 def index():
@@ -162,14 +344,8 @@ def reset_password(token):
         return redirect(url_for('index'))
     
     # Check if token is valid
-    for email, data in password_reset_tokens.items():
-        if data['token'] == token:
-            if datetime.now() < data['expires']:
-                return render_template('reset-password.html', token=token)
-            else:
-                # Token expired
-                del password_reset_tokens[email]
-                break
+    if password_reset_tokens.get_by('token', token):
+        return render_template('reset-password.html', token=token)
     
     return "Invalid or expired reset link", 400
 
@@ -187,15 +363,25 @@ def user():
 
 @app.route('/api/login', methods=['POST'])
 def api_login():
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "message": "Invalid request"}), 400
     user_type = data.get('user_type')  # 'user' or 'admin'
+    required = ('password',) if user_type == 'user' else ('password', 'pin')
+    if not all(isinstance(data.get(field), str) for field in required):
+        return jsonify({"success": False, "message": "Invalid request"}), 400
     
+    # Unknown accounts still cost one hash, so timing does not reveal which accounts exist
     if user_type == 'user':
         email = data.get('email')
-        password = hashlib.sha256(data.get('password').encode()).hexdigest()
+        throttle('login', email)
         
-        user = next((u for u in users if u['email'] == email and u['password'] == password), None)
-        if user:
+        user = users.get_by('email', email)
+        matches, new_hash = hasher.verify(data['password'], user['password']) if user else hasher.reject(data['password'])
+        if matches:
+            # Upgrade legacy or outdated hashes now that we know the password
+            if new_hash:
+                users.update(user['id'], {'password': new_hash})
             if not user['verified']:
                 return jsonify({"success": False, "message": "Please verify your email address before logging in"}), 401
                 
@@ -211,18 +397,23 @@ def api_login():
     
     elif user_type == 'admin':
         username = data.get('username')
-        password = hashlib.sha256(data.get('password').encode()).hexdigest()
-        pin = hashlib.sha256(data.get('pin').encode()).hexdigest()
+        throttle('admin-login', username)
         
-        admin = next((a for a in admins if a['username'] == username and a['password'] == password and a['pin'] == pin), None)
-        if admin:
+        admin = admins.get_by('username', username)
+        password_ok, new_password_hash = (hasher.verify(data['password'], admin['password']) if admin
+                                          else hasher.reject(data['password']))
+        pin_ok, new_pin_hash = hasher.verify(data['pin'], admin['pin']) if password_ok else (False, None)
+        if password_ok and pin_ok:
+            upgrades = {'password': new_password_hash, 'pin': new_pin_hash}
+            if any(upgrades.values()):
+                admins.update(admin['id'], {k: v for k, v in upgrades.items() if v})
             session['user'] = {
                 'id': admin['id'],
                 'username': admin['username'],
                 'role': 'admin'
             }
             # Update last login
-            admin['last_login'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            admins.update(admin['id'], {'last_login': datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
             return jsonify({"success": True, "redirect": "/admin", "message": "Admin login successful!"})
         else:
             return jsonify({"success": False, "message": "Invalid credentials"}), 401
@@ -232,18 +423,19 @@ def api_login():
 @app.route('/api/register', methods=['POST'])
 def api_register():
     data = request.json
+    throttle('register', data.get('email'))
     
     # Check if email already exists
-    if any(u['email'] == data['email'] for u in users):
+    if users.get_by('email', data['email']):
         return jsonify({"success": False, "message": "Email already registered"}), 400
     
-    # Generate OTP
+    # Generate OTP; the pending registration only ever holds the password hash
     otp = generate_otp()
-    otps[data['email']] = {
+    otps.put({
+        'email': data['email'],
         'otp': otp,
-        'data': data,
-        'created': datetime.now()
-    }
+        'data': dict(data, password=hasher.hash(data['password']))
+    })
     
     # Send OTP email
     subject = "Verify Your Email Address - Gupta's Sweets"
@@ -276,27 +468,28 @@ def verify_email():
     data = request.json
     email = data.get('email')
     otp = data.get('otp')
+    # Six-digit codes must not be guessable by brute force
+    throttle('verify-email', email)
     
     # Check if OTP exists and is valid
-    if email not in otps:
+    otp_data = otps.get(email, include_expired=True)
+    if not otp_data:
         return jsonify({"success": False, "message": "No verification request found for this email"}), 400
     
-    otp_data = otps[email]
-    
     # Check if OTP has expired (15 minutes)
-    if datetime.now() > otp_data['created'] + timedelta(minutes=15):
-        del otps[email]
+    if otps.expired(otp_data):
+        otps.delete(email)
         return jsonify({"success": False, "message": "Verification code has expired. Please register again."}), 400
     
     # Verify OTP
     if otp_data['otp'] == otp:
         # Create new user
         new_user = {
-            "id": len(users) + 1,
+            "id": user_ids.next(),
             "first_name": otp_data['data']['first_name'],
             "last_name": otp_data['data']['last_name'],
             "email": email,
-            "password": hashlib.sha256(otp_data['data']['password'].encode()).hexdigest(),
+            "password": otp_data['data']['password'],
             "phone": otp_data['data']['phone'],
             "address": otp_data['data']['address'],
             "dob": otp_data['data']['dob'],
@@ -304,9 +497,9 @@ def verify_email():
             "verified": True
         }
         
-        users.append(new_user)
+        users.insert(new_user)
         # Remove OTP
-        del otps[email]
+        otps.delete(email)
         
         return jsonify({"success": True, "message": "Email verified successfully! You can now login.", "redirect": "/login"})
     else:
@@ -316,17 +509,17 @@ def verify_email():
 def resend_otp():
     data = request.json
     email = data.get('email')
+    throttle('resend-otp', email)
     
     if email not in otps:
         return jsonify({"success": False, "message": "No pending verification for this email"}), 400
     
     # Generate new OTP
     new_otp = generate_otp()
-    otps[email]['otp'] = new_otp
-    otps[email]['created'] = datetime.now()
+    otp_data = otps.update(email, {'otp': new_otp}, ttl=OTP_TTL)
     
     # Send new OTP
-    user_data = otps[email]['data']
+    user_data = otp_data['data']
     subject = "New Verification Code - Gupta's Sweets"
     body = f"""
     Hello {user_data['first_name']},
@@ -352,20 +545,19 @@ def resend_otp():
 def api_forgot_password():
     data = request.json
     email = data.get('email')
+    throttle('forgot-password', email)
     
     # Check if user exists
-    user = next((u for u in users if u['email'] == email), None)
+    user = users.get_by('email', email)
     if not user:
         return jsonify({"success": False, "message": "If an account exists with this email, we've sent a password reset link."})
     
     # Generate reset token
     token = generate_token()
-    expires = datetime.now() + timedelta(hours=1)
-    
-    password_reset_tokens[email] = {
-        'token': token,
-        'expires': expires
-    }
+    password_reset_tokens.put({
+        'email': email,
+        'token': token
+    })
     
     # Send reset email
     reset_link = f"http://127.0.0.1:5000/reset-password/{token}"
@@ -399,26 +591,24 @@ def api_reset_password():
     data = request.json
     token = data.get('token')
     new_password = data.get('new_password')
+    throttle('reset-password')
     
     # Find user by token
     target_email = None
-    for email, token_data in password_reset_tokens.items():
-        if token_data['token'] == token:
-            if datetime.now() < token_data['expires']:
-                target_email = email
-            break
+    token_data = password_reset_tokens.get_by('token', token)
+    if token_data:
+        target_email = token_data['email']
     
     if not target_email:
         return jsonify({"success": False, "message": "Invalid or expired reset link"}), 400
     
     # Update user password
-    for user in users:
-        if user['email'] == target_email:
-            user['password'] = hashlib.sha256(new_password.encode()).hexdigest()
-            break
+    user = users.get_by('email', target_email)
+    if user:
+        users.update(user['id'], {'password': hasher.hash(new_password)})
     
     # Remove token
-    del password_reset_tokens[target_email]
+    password_reset_tokens.delete(target_email)
     
     return jsonify({"success": True, "message": "Password reset successful! You can now login with your new password.", "redirect": "/login"})
 
@@ -429,11 +619,32 @@ def logout():
 
 @app.route('/api/products')
 def get_products():
-    return jsonify(products)
+    # Without query parameters the whole catalog comes from the pre-encoded cache
+    if not request.args:
+        return catalog.serve(request)
+    
+    args = request.args
+    in_stock = args.get('in_stock')
+    try:
+        items, next_cursor = catalog_index.query(
+            category=args.get('category'),
+            min_price=args.get('min_price', type=float),
+            max_price=args.get('max_price', type=float),
+            in_stock=None if in_stock is None else in_stock.lower() in ('1', 'true', 'yes'),
+            text=args.get('q'),
+            sort=args.get('sort', 'id'),
+            descending=args.get('order') == 'desc',
+            limit=min(max(args.get('limit', 20, type=int), 1), 100),
+            cursor=args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"products": items, "next_cursor": next_cursor})
 
 @app.route('/api/products/<int:product_id>')
 def get_product(product_id):
-    product = next((p for p in products if p['id'] == product_id), None)
+    product = products.get(product_id)
     if product:
         return jsonify(product)
     else:
@@ -444,22 +655,44 @@ def place_order():
     if 'user' not in session:
         return jsonify({"error": "Unauthorized"}), 401
         
-    order_data = request.json
+    order_data = request.get_json(silent=True)
     user_id = session['user']['id']
     
-    # Create order
-    new_order = {
-        "id": len(orders) + 1,
-        "order_number": f"ORD{9000 + len(orders)}",
-        "user_id": user_id,
-        "items": order_data['items'],
-        "total": order_data['total'],
-        "status": "pending",
-        "date": datetime.now().strftime("%Y-%m-%d"),
-        "address": order_data['address']
-    }
+    # The whole body is checked before any stock is taken
+    if not isinstance(order_data, dict):
+        return jsonify({"error": "Order details must be a JSON object"}), 400
+    address = order_data.get('address')
+    if not isinstance(address, str) or not address.strip():
+        return jsonify({"error": "A delivery address is required"}), 400
+    
+    # Prices, names and the total come from the catalog, never the client
+    try:
+        items, total_cents = checkout.quote(order_data.get('items'))
+        reserved = checkout.reserve(items)
+    except OrderError as e:
+        return jsonify({"error": str(e)}), e.status
     
-    orders.append(new_order)
+    # Anything failing from here on hands the reserved stock back
+    try:
+        new_order = {
+            "id": order_ids.next(),
+            "order_number": f"ORD{order_numbers.next()}",
+            "user_id": user_id,
+            "items": items,
+            "total": total_cents / 100,
+            "status": "pending",
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "address": address.strip()
+        }
+        orders.insert(new_order)
+    except Exception:
+        checkout.release(items)
+        raise
+    carts.clear(user_id)
+    sales_stats.record(new_order)
+    order_history.invalidate(user_id)
+    refresh_stock(reserved)
+    publish_order('order.created', new_order)
     
     response = {
         "success": True,
@@ -469,23 +702,20 @@ def place_order():
     }
     return jsonify(response)
 
+def refresh_stock(changed):
+    """Re-index products whose stock count changed at checkout or cancellation"""
+    for product in changed:
+        catalog_index.upsert(product)
+    # The listing carries each product's stock count, so any change makes it stale
+    if changed:
+        catalog.invalidate()
+
 @app.route('/api/cart', methods=['GET'])
 def get_cart():
     if 'user' not in session:
         return jsonify({"items": [], "count": 0, "total": 0})
     
-    user_id = session['user']['id']
-    if user_id not in carts:
-        carts[user_id] = []
-    
-    cart_items = carts[user_id]
-    total = sum(item['price'] * item['quantity'] for item in cart_items)
-    
-    return jsonify({
-        "items": cart_items,
-        "count": len(cart_items),
-        "total": round(total, 2)
-    })
+    return jsonify(carts.get(session['user']['id']))
 
 @app.route('/api/cart', methods=['POST'])
 def update_cart():
@@ -493,56 +723,52 @@ def update_cart():
         return jsonify({"error": "Unauthorized"}), 401
     
     user_id = session['user']['id']
-    if user_id not in carts:
-        carts[user_id] = []
-    
     data = request.json
-    action = data.get('action')
-    item = data.get('item')
-    
-    if action == 'add':
-        # Check if item already in cart
-        existing_item = next((i for i in carts[user_id] if i['id'] == item['id']), None)
-        if existing_item:
-            existing_item['quantity'] += 1
-        else:
-            carts[user_id].append({
-                'id': item['id'],
-                'name': item['name'],
-                'price': item['price'],
-                'quantity': 1
-            })
-    
-    elif action == 'remove':
-        carts[user_id] = [i for i in carts[user_id] if i['id'] != item['id']]
-    
-    elif action == 'update':
-        for cart_item in carts[user_id]:
-            if cart_item['id'] == item['id']:
-                cart_item['quantity'] = item['quantity']
-                if cart_item['quantity'] <= 0:
-                    carts[user_id].remove(cart_item)
-                break
-    
-    # Calculate new totals
-    cart_items = carts[user_id]
-    total = sum(item['price'] * item['quantity'] for item in cart_items)
-    
-    return jsonify({
-        "items": cart_items,
-        "count": len(cart_items),
-        "total": round(total, 2)
-    })
+    
+    # A batch carries many add/remove/update operations in one request
+    if data.get('action') == 'batch':
+        ops = data.get('ops') or []
+    else:
+        ops = [{'action': data.get('action'), 'item': data.get('item')}]
+    
+    try:
+        return jsonify(carts.apply(user_id, ops))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route('/api/user/orders')
 def user_orders():
     if 'user' not in session:
         return jsonify({"error": "Unauthorized"}), 401
     
-    user_id = session['user']['id']
-    user_orders = [order for order in orders if order['user_id'] == user_id]
+    return Response(order_history.get(session['user']['id']), mimetype='application/json')
+
+@app.route('/api/events')
+def event_stream():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
     
-    return jsonify(user_orders)
+    user = session['user']
+    topics = ['admin'] if user['role'] == 'admin' else [f"user:{user['id']}"]
+    # EventSource sends the id of the last event it saw when it reconnects
+    try:
+        subscription = events.subscribe(topics, request.headers.get('Last-Event-ID', type=int))
+    except TooManySubscribers:
+        response = jsonify({"error": "Too many open event streams, try again shortly"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    if request.environ.get('serve.async'):
+        # serve.py's async mode iterates this on its event loop, so the open
+        # stream holds no worker thread
+        response = Response(events.stream_async(subscription), mimetype='text/event-stream',
+                            direct_passthrough=True)
+    else:
+        response = Response(events.stream(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/user/profile')
 def user_profile():
@@ -550,13 +776,11 @@ def user_profile():
         return jsonify({"error": "Unauthorized"}), 401
     
     user_id = session['user']['id']
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = users.get(user_id)
     
     if user:
-        # Remove password from response
-        safe_user = user.copy()
-        safe_user.pop('password', None)
-        return jsonify(safe_user)
+        # User records encode without their password hash
+        return jsonify(user)
     else:
         return jsonify({"error": "User not found"}), 404
 
@@ -568,49 +792,236 @@ def update_profile():
     user_id = session['user']['id']
     data = request.json
     
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = users.get(user_id)
     if user:
-        user['first_name'] = data.get('first_name', user['first_name'])
-        user['last_name'] = data.get('last_name', user['last_name'])
-        user['phone'] = data.get('phone', user['phone'])
-        user['address'] = data.get('address', user['address'])
-        user['dob'] = data.get('dob', user['dob'])
+        users.update(user_id, {
+            'first_name': data.get('first_name', user['first_name']),
+            'last_name': data.get('last_name', user['last_name']),
+            'phone': data.get('phone', user['phone']),
+            'address': data.get('address', user['address']),
+            'dob': data.get('dob', user['dob'])
+        })
         
         return jsonify({"success": True, "message": "Profile updated successfully!"})
     else:
         return jsonify({"error": "User not found"}), 404
 
+def ranged_order_scan(args):
+    """
+    Whether an order listing walks the sorted date index: when it has a
+    date_from/date_to range and no user_id or exact date to narrow it more
+    """
+    return (bool(args.get('date_from') or args.get('date_to'))
+            and args.get('user_id') is None and args.get('date') is None)
+
+def order_cursor(order, ranged):
+    """Position of an order in a listing: its id, or date:id when ordered by date"""
+    return f"{order['date']}:{order['id']}" if ranged else order['id']
+
+def decode_order_cursor(cursor, ranged):
+    try:
+        if ranged:
+            date, order_id = cursor.rsplit(':', 1)
+            return date, int(order_id)
+        return int(cursor)
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+
+def scan_orders(args, cursor=None, descending=False):
+    """
+    Return an iterator over orders matching the user_id/status/date/date_from/
+    date_to filters in args, resuming after cursor. A date range without a
+    user or exact date is read from the orders' date index in (date, id) order;
+    anything else walks the most selective indexed filter in id order. Raises
+    ValueError for a non-numeric user_id or a cursor that does not fit the listing.
+    """
+    user_id = args.get('user_id')
+    if user_id is not None:
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            raise ValueError("user_id must be a number") from None
+    filters = {
+        'user_id': user_id,
+        'date': args.get('date'),
+        'status': args.get('status')
+    }
+    date_from = args.get('date_from') or None
+    date_to = args.get('date_to') or None
+    ranged = ranged_order_scan(args)
+    after = None if cursor is None else decode_order_cursor(cursor, ranged)
+    if ranged:
+        matches = orders.scan_range('date', date_from, date_to, after=after, descending=descending)
+    else:
+        # Walk the most selective indexed filter and check the rest per order
+        field = next((name for name, value in filters.items() if value is not None), None)
+        matches = orders.scan(field, filters.get(field), after=after, descending=descending)
+    
+    def wanted(order):
+        if any(value is not None and order[name] != value for name, value in filters.items()):
+            return False
+        return not (date_from and order['date'] < date_from or date_to and order['date'] > date_to)
+    
+    return filter(wanted, matches)
+
 @app.route('/api/admin/orders')
 def admin_orders():
     if 'user' not in session or session['user']['role'] != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    return jsonify(orders)
+    args = request.args
+    descending = args.get('order', 'desc') != 'asc'
+    try:
+        matches = scan_orders(args, args.get('cursor'), descending)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # NDJSON export streams every matching order without building the body in memory
+    if args.get('format') == 'ndjson':
+        return Response((app.json.dumps_bytes(order) + b'\n' for order in matches), mimetype='application/x-ndjson')
+    
+    limit = min(max(args.get('limit', 50, type=int), 1), 500)
+    page = list(itertools.islice(matches, limit + 1))
+    next_cursor = order_cursor(page[limit - 1], ranged_order_scan(args)) if len(page) > limit else None
+    
+    return jsonify({"orders": page[:limit], "next_cursor": next_cursor})
+
+@app.route('/api/admin/orders/statuses')
+def admin_order_statuses():
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    # Each queue is listed with /api/admin/orders?status=<status>
+    return jsonify({"counts": order_workflow.counts(),
+                    "transitions": {status: list(nexts) for status, nexts in order_workflow.transitions.items()}})
+
+@app.route('/api/admin/orders/<int:order_id>/status', methods=['POST'])
+def admin_order_status(order_id):
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        changed, errors, moved = order_workflow.transition([order_id], data.get('status'), data.get('from'))
+    except TransitionError as e:
+        return jsonify({"error": str(e)}), e.status
+    if errors:
+        error = errors[order_id]
+        return jsonify({"error": error}), 404 if error == "Order not found" else 409
+    order_status_changed(changed, moved)
+    return jsonify({"success": True, "order": changed[0]})
+
+@app.route('/api/admin/orders/status', methods=['POST'])
+def admin_bulk_order_status():
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    # Either explicit ids, or the oldest `limit` orders in the `from` queue
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    try:
+        if ids is None and data.get('from'):
+            order_workflow.check_status(data['from'])
+            limit = min(max(int(data.get('limit', 100)), 1), order_workflow.max_batch)
+            ids = [order['id'] for order in itertools.islice(orders.scan('status', data['from']), limit)]
+            if not ids:
+                return jsonify({"success": True, "changed": 0, "errors": {}})
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({"error": "Expected ids as a list of order ids, or a from status"}), 400
+        changed, errors, moved = order_workflow.transition(ids, data.get('status'), data.get('from'))
+    except TransitionError as e:
+        return jsonify({"error": str(e)}), e.status
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit must be a number"}), 400
+    order_status_changed(changed, moved)
+    return jsonify({"success": not errors, "changed": len(changed), "errors": errors})
+
+def order_status_changed(changed, moved):
+    """Update counters, caches, stock and dashboards after orders changed status"""
+    for old_status, count in moved.items():
+        sales_stats.status_changed(old_status, changed[0]['status'], count)
+    for order in changed:
+        order_history.invalidate(order['user_id'])
+        publish_order('order.status', order)
+        # A cancelled order's counted stock goes back on sale, and its sales are undone
+        if order['status'] == 'cancelled':
+            sales_stats.cancelled(order)
+            refresh_stock(checkout.release(order['items']))
+
+@app.route('/api/admin/stats')
+def admin_stats():
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    stats = sales_stats.snapshot()
+    stats['customers'] = len(users)
+    return jsonify(stats)
+
+@app.route('/api/admin/stats/rebuild', methods=['POST'])
+def admin_rebuild_stats():
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    sales_stats.rebuild(orders.scan())
+    return jsonify({"success": True, "message": "Statistics rebuilt from order history"})
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute sales statistics from the full order history and print them"""
+    sales_stats.rebuild(orders.scan())
+    print(json.dumps(sales_stats.snapshot(), indent=2))
+
+@app.cli.command('snapshot-store')
+def snapshot_store_command():
+    """Write a snapshot of the journaled in-memory store and drop the journal it replaces"""
+    if db.journal is None:
+        print("The store is not journaled (STORE_URL=memory:///path/to/dir enables it)")
+        return
+    db.journal.snapshot()
+    print(json.dumps(db.journal.stats(), indent=2))
 
 @app.route('/api/admin/products', methods=['GET'])
 def admin_get_products():
     if 'user' not in session or session['user']['role'] != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    return jsonify(products)
+    return catalog.serve(request)
 
 @app.route('/api/admin/products', methods=['POST'])
 def admin_add_product():
     if 'user' not in session or session['user']['role'] != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Product details must be a JSON object"}), 400
+    missing = [field for field in bulk.REQUIRED if data.get(field) is None]
+    if missing:
+        return jsonify({"error": f"A new product needs {', '.join(missing)}"}), 400
+    # Bad numbers would break the catalog index for every later rebuild
+    try:
+        price = bulk.convert('price', data['price'])
+        stock = None if data.get('stock') is None else bulk.convert('stock', data['stock'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     new_product = {
-        "id": len(products) + 1,
+        "id": product_ids.next(),
         "name": data['name'],
         "description": data['description'],
-        "price": data['price'],
+        "price": price,
         "category": data['category'],
         "image": data.get('image', 'default.jpg'),
         "in_stock": data.get('in_stock', True)
     }
-    
-    products.append(new_product)
+    # Products with a stock count sell out automatically at checkout
+    if stock is not None:
+        new_product['stock'] = stock
+        new_product['in_stock'] = data.get('in_stock', stock > 0)
+    
+    products.insert(new_product)
+    catalog.invalidate()
+    catalog_index.upsert(new_product)
     return jsonify({"success": True, "message": "Product added successfully!", "product": new_product})
 
 @app.route('/api/admin/products/<int:product_id>', methods=['PUT'])
@@ -618,15 +1029,30 @@ def admin_update_product(product_id):
     if 'user' not in session or session['user']['role'] != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    data = request.json
-    product = next((p for p in products if p['id'] == product_id), None)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Product details must be a JSON object"}), 400
+    try:
+        price = None if data.get('price') is None else bulk.convert('price', data['price'])
+        stock = None if data.get('stock') is None else bulk.convert('stock', data['stock'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    product = products.get(product_id)
     
     if product:
-        product['name'] = data.get('name', product['name'])
-        product['description'] = data.get('description', product['description'])
-        product['price'] = data.get('price', product['price'])
-        product['category'] = data.get('category', product['category'])
-        product['in_stock'] = data.get('in_stock', product['in_stock'])
+        changes = {
+            'name': data.get('name', product['name']),
+            'description': data.get('description', product['description']),
+            'price': product['price'] if price is None else price,
+            'category': data.get('category', product['category']),
+            'in_stock': data.get('in_stock', product['in_stock'])
+        }
+        if stock is not None:
+            changes['stock'] = stock
+            changes['in_stock'] = data.get('in_stock', stock > 0)
+        product = products.update(product_id, changes)
+        catalog.invalidate()
+        catalog_index.upsert(product)
         
         return jsonify({"success": True, "message": "Product updated successfully!", "product": product})
     else:
@@ -637,54 +1063,107 @@ def admin_delete_product(product_id):
     if 'user' not in session or session['user']['role'] != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    global products
-    product = next((p for p in products if p['id'] == product_id), None)
+    product = products.delete(product_id)
     
     if product:
-        products = [p for p in products if p['id'] != product_id]
+        catalog.invalidate()
+        catalog_index.remove(product_id)
         return jsonify({"success": True, "message": "Product deleted successfully!"})
     else:
         return jsonify({"error": "Product not found"}), 404
 
+def apply_product_changes(changed, removed):
+    """Refresh the catalog cache and indexes once after a bulk import"""
+    if changed or removed:
+        catalog.invalidate()
+        catalog_index.apply(changed, removed)
+
+@app.route('/api/admin/products/export')
+def admin_export_products():
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": f"Unknown format {fmt!r}"}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    # Streamed in id order straight from the table, never built whole in memory
+    response = Response(bulk.export_rows(products.scan(), fmt, app.json.dumps_bytes), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+    return response
+
+@app.route('/api/admin/products/bulk', methods=['POST'])
+def admin_bulk_products():
+    if 'user' not in session or session['user']['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    # Rows come as an uploaded file, a raw CSV/NDJSON body or {"rows": [...]}
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = request.args.get('format') or bulk.detect_format(upload.filename, upload.mimetype)
+        stream = upload.stream
+    elif request.is_json:
+        fmt = 'json'
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('rows'), list):
+            return jsonify({"error": "Expected {\"rows\": [...]}"}), 400
+        rows = [(number, row, None) if isinstance(row, dict) else (number, None, "Each row must be an object")
+                for number, row in enumerate(data['rows'], 1)]
+    else:
+        fmt = request.args.get('format') or bulk.detect_format(mimetype=request.mimetype)
+        stream = request.stream
+    if fmt not in bulk.FORMATS + ('json',):
+        return jsonify({"error": f"Unknown import format (expected one of {', '.join(bulk.FORMATS)})"}), 400
+    if fmt != 'json':
+        rows = bulk.read_rows(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), fmt)
+    
+    try:
+        report, changed, removed = product_import.run(rows, dry_run=request.args.get('dry_run') in ('1', 'true'))
+    except UnicodeDecodeError:
+        return jsonify({"error": "Imports must be UTF-8 text"}), 400
+    apply_product_changes(changed, removed)
+    report["success"] = not report["errors"]
+    return jsonify(report), 200 if report["success"] else 422
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), help="Defaults to the file extension")
+@click.option('--dry-run', is_flag=True, help="Validate the file without changing the catalog")
+def import_products_command(path, fmt, dry_run):
+    """Add, update and delete products from a CSV or NDJSON file, all or nothing"""
+    fmt = fmt or bulk.detect_format(path)
+    if fmt is None:
+        raise click.UsageError("Cannot tell the format from the file name; pass --format")
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report, changed, removed = product_import.run(bulk.read_rows(f, fmt), dry_run=dry_run)
+    apply_product_changes(changed, removed)
+    db.sync()
+    print(json.dumps(report, indent=2))
+    if report["errors"]:
+        raise SystemExit(1)
+
+@app.cli.command('export-products')
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), help="Defaults to the file extension, else csv")
+def export_products_command(path, fmt):
+    """Write every product to a CSV or NDJSON file (or stdout)"""
+    fmt = fmt or bulk.detect_format(path) or 'csv'
+    with click.open_file(path, 'wb') as f:
+        for chunk in bulk.export_rows(products.scan(), fmt, app.json.dumps_bytes):
+            f.write(chunk)
+
+@app.route('/static/<path:filename>', endpoint='static')
+def static_asset(filename):
+    return assets.serve_asset(STATIC_DIR, filename, request, hashed_assets)
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify, hash and precompress front-end assets and regenerate templates"""
+    for source, built in assets.build(app.root_path, STATIC_DIR, TEMPLATE_DIR).items():
+        print(f"{source} -> static/{built}")
+
 if __name__ == '__main__':
-    # Create templates folder if it doesn't exist
-    if not os.path.exists('templates'):
-        os.makedirs('templates')
-    
-    # Copy HTML files to templates folder
-    template_files = ['index.html', 'login.html', 'register.html', 'admin.html', 'user.html', 'forgot-password.html', 'reset-password.html', 'verify-email.html']
-    for file in template_files:
-        if os.path.exists(file):
-            with open(file, 'r') as f:
-                content = f.read()
-            with open(f'templates/{file}', 'w') as f:
-                f.write(content)
-    
-    # Create static folders
-    if not os.path.exists('static'):
-        os.makedirs('static')
-    if not os.path.exists('static/css'):
-        os.makedirs('static/css')
-    if not os.path.exists('static/js'):
-        os.makedirs('static/js')
-    
-    # Copy CSS files
-    css_files = ['style.css', 'auth.css', 'admin.css', 'user.css']
-    for file in css_files:
-        if os.path.exists(file):
-            with open(file, 'r') as f:
-                content = f.read()
-            with open(f'static/css/{file}', 'w') as f:
-                f.write(content)
-    
-    # Copy JS files
-    js_files = ['script.js', 'auth.js', 'admin.js', 'user.js']
-    for file in js_files:
-        if os.path.exists(file):
-            with open(file, 'r') as f:
-                content = f.read()
-            with open(f'static/js/{file}', 'w') as f:
-                f.write(content)
-    
-    # Run the Flask app
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Run the Flask development server. The reloader would start a second
+    # process on the same journal, so it is off when the store is journaled.
+    # In production use serve.py (or any WSGI server) instead.
+    app.run(debug=True, port=5000, use_reloader=db.journal is None)
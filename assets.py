@@ -0,0 +1,235 @@
+"""
+Static asset pipeline
+
+Builds the front end once instead of copying files on every launch:
+minifies CSS and JS, writes them under static/ with content-hashed names,
+precompresses .gz (and .br when brotli is installed) siblings, records the
+mapping in static/manifest.json and writes the HTML pages into templates/
+with their asset references pointing at the hashed files.
+
+static/ and templates/ are build output and are not tracked. Importing the
+app builds them when they are missing or older than their sources, so any
+WSGI server can serve a fresh checkout.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import abort, send_file
+
+from compression import brotli
+
+TEMPLATE_FILES = ['index.html', 'login.html', 'register.html', 'admin.html', 'user.html',
+                  'forgot-password.html', 'reset-password.html', 'verify-email.html']
+CSS_FILES = ['style.css', 'auth.css', 'admin.css', 'user.css']
+JS_FILES = ['script.js', 'auth.js', 'admin.js', 'user.js', 'register.js',
+            'forgot-password.js', 'reset-password.js', 'verify-email.js']
+
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def minify_css(source):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def _scan_js(line, state):
+    """
+    Scan one line of script starting in state (None for code, '`' inside a
+    template literal, '/*' inside a block comment). Returns the state at the
+    end of the line and whether it held anything besides comments, so
+    backticks in comments and quoted strings never open a template.
+    """
+    has_code = state == '`'
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        pair = line[i:i + 2]
+        if state == '/*':
+            if pair == '*/':
+                state = None
+                i += 1
+        elif state == '`':
+            if char == '\\':
+                i += 1
+            elif char == '`':
+                state = None
+        elif quote is not None:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif pair == '//':
+            break
+        elif pair == '/*':
+            state = '/*'
+            i += 1
+        elif not char.isspace():
+            has_code = True
+            if char in '\'"':
+                quote = char
+            elif char == '`':
+                state = '`'
+        i += 1
+    return state, has_code
+
+
+def minify_js(source):
+    """
+    Conservatively shrink a script: drop comment-only lines, indentation and
+    blank lines. Line breaks are kept so automatic semicolon insertion still
+    behaves, and lines inside template literals are left untouched.
+    """
+    lines = []
+    state = None
+    for line in source.splitlines():
+        start = state
+        state, has_code = _scan_js(line, start)
+        if start == '`':
+            lines.append(line)
+        elif has_code:
+            # Trailing spaces of a line that opens a template are part of it
+            lines.append(line.lstrip() if state == '`' else line.strip())
+    return '\n'.join(lines) + '\n'
+
+
+def _write(path, data):
+    # Write then rename, so a worker building at the same time never serves half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _emit(static_dir, name, data):
+    """Write a hashed asset plus its compressed siblings; returns its static-relative path"""
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    relative = f"{ext[1:]}/{stem}.{digest}{ext}"
+    path = os.path.join(static_dir, relative)
+    _write(path, data)
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data))
+    return relative
+
+
+def build(source_dir='.', static_dir='static', template_dir='templates'):
+    """Run the whole pipeline and return the manifest"""
+    manifest = {}
+    for names, minify in ((CSS_FILES, minify_css), (JS_FILES, minify_js)):
+        for name in names:
+            source_path = os.path.join(source_dir, name)
+            if not os.path.exists(source_path):
+                continue
+            with open(source_path, encoding='utf-8') as f:
+                data = minify(f.read()).encode('utf-8')
+            manifest[name] = _emit(static_dir, name, data)
+
+    # Pages reference assets as "style.css", "/static/css/style.css" and so on
+    reference = re.compile(r'''((?:href|src)=["'])(?:/static/(?:css|js)/)?([\w.-]+\.(?:css|js))(["'])''')
+
+    def rewrite(match):
+        hashed = manifest.get(match.group(2))
+        if hashed is None:
+            return match.group(0)
+        return f"{match.group(1)}/static/{hashed}{match.group(3)}"
+
+    for name in TEMPLATE_FILES:
+        source_path = os.path.join(source_dir, name)
+        if not os.path.exists(source_path):
+            continue
+        with open(source_path, encoding='utf-8') as f:
+            html = reference.sub(rewrite, f.read())
+        _write(os.path.join(template_dir, name), html.encode('utf-8'))
+
+    _write(os.path.join(static_dir, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def is_stale(source_dir='.', static_dir='static', template_dir='templates'):
+    """
+    True when there is no manifest, a page was never generated or any
+    source file is newer than the manifest
+    """
+    manifest_path = os.path.join(static_dir, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return True
+    built = os.path.getmtime(manifest_path)
+    for name in TEMPLATE_FILES + CSS_FILES + JS_FILES:
+        path = os.path.join(source_dir, name)
+        if os.path.exists(path) and os.path.getmtime(path) > built:
+            return True
+    return any(os.path.exists(os.path.join(source_dir, name)) and not os.path.exists(os.path.join(template_dir, name))
+               for name in TEMPLATE_FILES)
+
+
+def ensure_built(source_dir='.', static_dir='static', template_dir='templates'):
+    """
+    Build the front end if it is missing or older than its sources. Returns
+    the new manifest, or None when the existing build is current; raises
+    RuntimeError when a build is needed but cannot be written.
+    """
+    if not is_stale(source_dir, static_dir, template_dir):
+        return None
+    try:
+        return build(source_dir, static_dir, template_dir)
+    except OSError as e:
+        raise RuntimeError(f"The front end is not built and building it failed ({e}); "
+                           f"run 'flask build-assets' from a writable checkout") from None
+
+
+def load_manifest(static_dir='static'):
+    try:
+        with open(os.path.join(static_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def serve_asset(static_dir, filename, request, hashed_paths):
+    """
+    Send a built asset, preferring a precompressed sibling the client accepts.
+    Content-hashed files are cached for a year; anything else is revalidated.
+    """
+    path = os.path.realpath(os.path.join(static_dir, filename))
+    if not path.startswith(os.path.realpath(static_dir) + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    encoding = None
+    for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding, path = name, path + suffix
+            break
+
+    response = send_file(path, download_name=filename, conditional=True, etag=True,
+                         mimetype=_mimetype(filename))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE if filename in hashed_paths else 'no-cache'
+    return response
+
+
+def _mimetype(filename):
+    if filename.endswith('.css'):
+        return 'text/css'
+    if filename.endswith('.js'):
+        return 'text/javascript'
+    if filename.endswith('.json'):
+        return 'application/json'
+    return None
+
+
+if __name__ == '__main__':
+    for source, built in build().items():
+        print(f"{source} -> static/{built}")
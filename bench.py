@@ -0,0 +1,875 @@
+"""
+Benchmarks for the Gupta's Sweets API
+
+Usage:
+    python bench.py orders [--threads 32] [--orders 5000] [--min-rate 0]
+    python bench.py suite [--products 1000] [--orders 100000] [--server testclient|wsgi]
+                          [--requests 2000] [--concurrency 8] [--scenarios browse,cart,...]
+                          [--save-baseline FILE] [--baseline FILE] [--tolerance 20]
+    python bench.py records [--orders 200000]
+    python bench.py json [--products 1000] [--orders 500]
+    python bench.py bulk [--products 5000] [--changes 500]
+    python bench.py events [--subscribers 1000] [--events 2000]
+    python bench.py cluster [--workers 4] [--threads 8]
+    python bench.py serving [--threads 16] [--concurrency 16] [--streams 200] [--duration 3]
+
+Every scenario drives the real Flask app, either through its test client or
+over HTTP against a local threaded WSGI server, so the numbers include
+routing, session handling and JSON encoding. The suite seeds the store to
+the requested size first; `--products 10000 --orders 1000000` reproduces
+the large-catalog, long-history case.
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+DEMO_USER = {'user_type': 'user', 'email': 'john.doe@email.com', 'password': 'password123'}
+DEMO_ADMIN = {'user_type': 'admin', 'username': 'admin', 'password': 'admin123', 'pin': '1234'}
+DEFAULT_BASELINE = 'bench_baseline.json'
+
+
+def disable_throttles(app):
+    # Every benchmark client logs in from one address as the same account
+    app.ip_limiter.enabled = app.account_limiter.enabled = False
+
+
+def logged_in_client(app, credentials=DEMO_USER):
+    """Return a test client with a logged-in session"""
+    client = app.app.test_client()
+    response = client.post('/api/login', json=credentials)
+    assert response.status_code == 200, response.get_json()
+    return client
+
+
+def bench_orders(args):
+    """Fire orders from many threads at once and check every ID is unique"""
+    import app
+    disable_throttles(app)
+
+    per_thread = max(1, args.orders // args.threads)
+    total = per_thread * args.threads
+    before = len(app.orders)
+    order = {
+        'items': [{'product_id': 1, 'name': 'Gulab Jamun', 'quantity': 1, 'price': 12.99}],
+        'total': 12.99,
+        'address': '123 Saffron Street, Delhi, India'
+    }
+    clients = [logged_in_client(app) for _ in range(args.threads)]
+    barrier = threading.Barrier(args.threads + 1)
+    placed = [[] for _ in range(args.threads)]
+    errors = []
+
+    def worker(index):
+        client = clients[index]
+        barrier.wait()
+        for _ in range(per_thread):
+            response = client.post('/api/order', json=order)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+            placed[index].append(response.get_json()['order_id'])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    order_numbers = [number for chunk in placed for number in chunk]
+    new_orders = app.orders.all()[before:]
+    ids = [o['id'] for o in new_orders]
+    rate = total / elapsed
+
+    print(f"orders placed:   {len(order_numbers)} / {total} ({len(errors)} errors)")
+    print(f"elapsed:         {elapsed:.3f}s with {args.threads} threads")
+    print(f"throughput:      {rate:,.0f} orders/s")
+
+    assert not errors, f"{len(errors)} requests failed"
+    assert len(set(order_numbers)) == total, "duplicate order numbers"
+    assert len(new_orders) == total, f"expected {total} stored orders, found {len(new_orders)}"
+    assert len(set(ids)) == total, "duplicate order ids"
+    assert rate >= args.min_rate, f"throughput {rate:,.0f}/s below --min-rate {args.min_rate:,.0f}/s"
+    print("OK: all order ids and numbers unique")
+
+
+def seed(app, product_count, user_count, order_count, rng):
+    """Grow the store to the requested size with deterministic fake data"""
+    categories = ['classic', 'premium', 'seasonal']
+    words = ['saffron', 'pistachio', 'rose', 'cardamom', 'milk', 'syrup', 'ghee', 'almond', 'coconut', 'jaggery']
+    for _ in range(max(0, product_count - len(app.products))):
+        product_id = app.product_ids.next()
+        app.products.insert({
+            "id": product_id,
+            "name": f"{rng.choice(words).title()} Sweet {product_id}",
+            "description": ' '.join(rng.sample(words, 4)),
+            "price": round(rng.uniform(3, 40), 2),
+            "category": rng.choice(categories),
+            "image": "default.jpg",
+            "in_stock": rng.random() < 0.9
+        })
+    app.catalog.invalidate()
+    app.catalog_index.rebuild()
+
+    password = hashlib.sha256(b"bench-password").hexdigest()
+    user_ids = [1]
+    for _ in range(max(0, user_count - len(app.users))):
+        user_id = app.user_ids.next()
+        user_ids.append(user_id)
+        app.users.insert({
+            "id": user_id, "first_name": "Bench", "last_name": str(user_id),
+            "email": f"bench{user_id}@example.com", "password": password,
+            "phone": "", "address": "1 Bench Lane", "dob": "1990-01-01",
+            "role": "user", "verified": True
+        })
+
+    product_ids = [p['id'] for p in app.products.all()[:200]]
+    statuses = ['pending', 'delivered', 'delivered', 'delivered']
+    for _ in range(max(0, order_count - len(app.orders))):
+        order_id = app.order_ids.next()
+        items = [
+            {"product_id": pid, "name": f"Sweet {pid}", "quantity": rng.randint(1, 3), "price": 9.99}
+            for pid in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 3)))
+        ]
+        app.orders.insert({
+            "id": order_id,
+            "order_number": f"ORD{app.order_numbers.next()}",
+            "user_id": rng.choice(user_ids),
+            "items": items,
+            "total": round(sum(i['price'] * i['quantity'] for i in items), 2),
+            "status": rng.choice(statuses),
+            "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "address": "1 Bench Lane"
+        })
+    app.sales_stats.rebuild(app.orders.scan())
+
+
+class TestClientDriver:
+    """Sends requests through Flask's in-process test client"""
+
+    def __init__(self, app, credentials):
+        self.client = logged_in_client(app, credentials)
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        response.close()
+        return response.status_code
+
+
+class HTTPDriver:
+    """Sends requests over a real socket to the local WSGI server"""
+
+    def __init__(self, port, credentials):
+        self.port = port
+        self.cookie = None
+        status, headers = self._send('POST', '/api/login', credentials)
+        assert status == 200, status
+        self.cookie = headers.get('Set-Cookie', '').split(';')[0]
+
+    def _send(self, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return response.status, dict(response.getheaders())
+
+    def request(self, method, path, body=None):
+        return self._send(method, path, body)[0]
+
+
+def start_wsgi_server(flask_app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def scenario_requests(name, rng, product_count):
+    """Return a function producing the (method, path, body) of the next request"""
+    def product():
+        product_id = rng.randint(1, 4)
+        return {'id': product_id, 'name': f'Sweet {product_id}', 'price': 9.99, 'quantity': 1}
+
+    if name == 'browse':
+        categories = ['classic', 'premium', 'seasonal']
+        return lambda: rng.choice([
+            ('GET', '/api/products', None),
+            ('GET', f'/api/products?category={rng.choice(categories)}&sort=price&limit=20', None),
+            ('GET', f'/api/products/{rng.randint(1, product_count)}', None)
+        ])
+    if name == 'cart':
+        return lambda: ('POST', '/api/cart', {'action': 'add', 'item': product()})
+    if name == 'checkout':
+        return lambda: ('POST', '/api/order', {
+            'items': [dict(product(), product_id=rng.randint(1, 4))],
+            'total': 9.99,
+            'address': '1 Bench Lane'
+        })
+    if name == 'history':
+        return lambda: ('GET', '/api/user/orders', None)
+    if name == 'admin_orders':
+        return lambda: rng.choice([
+            ('GET', '/api/admin/orders?limit=50', None),
+            ('GET', '/api/admin/orders?status=pending&limit=50', None)
+        ])
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+SCENARIO_CREDENTIALS = {'browse': DEMO_USER, 'cart': DEMO_USER, 'checkout': DEMO_USER, 'history': DEMO_USER,
+                        'admin_orders': DEMO_ADMIN}
+
+
+def run_scenario(name, make_driver, args, product_count):
+    per_worker = max(1, args.requests // args.concurrency)
+    drivers = [make_driver(SCENARIO_CREDENTIALS[name]) for _ in range(args.concurrency)]
+    latencies = [[] for _ in range(args.concurrency)]
+    errors = [0] * args.concurrency
+    barrier = threading.Barrier(args.concurrency + 1)
+
+    def worker(index):
+        rng = random.Random(index)
+        next_request = scenario_requests(name, rng, product_count)
+        driver = drivers[index]
+        barrier.wait()
+        for _ in range(per_worker):
+            method, path, body = next_request()
+            started = time.perf_counter()
+            status = driver.request(method, path, body)
+            latencies[index].append(time.perf_counter() - started)
+            if status >= 400 and status != 404:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(latency for chunk in latencies for latency in chunk)
+    return {
+        "requests": len(samples),
+        "errors": sum(errors),
+        "throughput": round(len(samples) / elapsed, 1),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3)
+    }
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison against a stored baseline; returns the regressed scenarios"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        throughput_change = (current['throughput'] - previous['throughput']) / previous['throughput'] * 100
+        p99_change = (current['p99_ms'] - previous['p99_ms']) / previous['p99_ms'] * 100 if previous['p99_ms'] else 0
+        regressed = throughput_change < -tolerance or p99_change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<14} throughput {throughput_change:+6.1f}%  p99 {p99_change:+6.1f}%"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def bench_suite(args):
+    """Run the realistic scenarios at the requested data size"""
+    import app
+    disable_throttles(app)
+
+    rng = random.Random(42)
+    started = time.perf_counter()
+    seed(app, args.products, args.users, args.orders, rng)
+    print(f"seeded {len(app.products)} products, {len(app.users)} users, {len(app.orders)} orders "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    server = None
+    if args.server == 'wsgi':
+        server = start_wsgi_server(app.app)
+        make_driver = lambda credentials: HTTPDriver(server.server_port, credentials)
+    else:
+        make_driver = lambda credentials: TestClientDriver(app, credentials)
+
+    results = {
+        "config": {
+            "server": args.server, "products": len(app.products), "orders": len(app.orders),
+            "requests": args.requests, "concurrency": args.concurrency
+        },
+        "scenarios": {}
+    }
+    print(f"{'scenario':<14} {'requests':>8} {'errors':>6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for name in args.scenarios.split(','):
+        stats = run_scenario(name, make_driver, args, len(app.products))
+        results['scenarios'][name] = stats
+        print(f"{name:<14} {stats['requests']:>8} {stats['errors']:>6} {stats['throughput']:>10,.1f} "
+              f"{stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+    results['peak_rss_mb'] = peak_rss_mb()
+    print(f"peak RSS: {results['peak_rss_mb']} MB")
+
+    if server is not None:
+        server.shutdown()
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.baseline} (tolerance {args.tolerance}%):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit(f"regressions in: {', '.join(regressions)}")
+
+
+def sample_order(order_id, rng):
+    items = [
+        {"product_id": product_id, "name": f"Sweet {product_id}", "quantity": rng.randint(1, 3), "price": 9.99}
+        for product_id in rng.sample(range(1, 200), rng.randint(1, 3))
+    ]
+    return {
+        "id": order_id,
+        "order_number": f"ORD{9000 + order_id}",
+        "user_id": rng.randint(1, 1000),
+        "items": items,
+        "total": round(sum(i['price'] * i['quantity'] for i in items), 2),
+        "status": rng.choice(['pending', 'delivered']),
+        "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "address": "1 Bench Lane"
+    }
+
+
+def json_providers():
+    """Flask's stdlib provider and ours, bound to a bare app"""
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    from jsonprovider import FastJSONProvider
+
+    flask_app = Flask('bench')
+    return DefaultJSONProvider(flask_app), FastJSONProvider(flask_app)
+
+
+def bench_records(args):
+    """Compare resident memory and encoding time of dict orders against slotted records"""
+    import jsonprovider
+    import records
+
+    stdlib, fast = json_providers()
+
+    def build(make):
+        rng = random.Random(7)
+        tracemalloc.start()
+        rows = [make(sample_order(i, rng)) for i in range(args.orders)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return rows, size
+
+    dicts, dict_bytes = build(lambda order: order)
+    compact, record_bytes = build(records.Order)
+
+    def timed(fn, rows):
+        started = time.perf_counter()
+        body = fn(rows)
+        return time.perf_counter() - started, len(body)
+
+    dict_seconds, dict_size = timed(lambda rows: stdlib.dumps(rows, separators=(',', ':')), dicts)
+    record_seconds, record_size = timed(fast.dumps_bytes, compact)
+
+    print(f"{'orders':<18} {args.orders:,}")
+    print(f"{'dict bytes/order':<18} {dict_bytes / args.orders:,.0f}")
+    print(f"{'record bytes/order':<18} {record_bytes / args.orders:,.0f} "
+          f"({(1 - record_bytes / dict_bytes) * 100:.0f}% less)")
+    print(f"{'dict encode':<18} {dict_seconds * 1000:,.0f} ms ({dict_size:,} bytes)")
+    print(f"{'record encode':<18} {record_seconds * 1000:,.0f} ms ({record_size:,} bytes, "
+          f"{'orjson' if jsonprovider.orjson else 'json'})")
+
+
+def bench_json(args):
+    """Time stdlib and fast JSON encoding, plus compression, of the catalog and order list payloads"""
+    import gzip
+    import records
+
+    stdlib, fast = json_providers()
+    rng = random.Random(11)
+    catalog = [records.Product({
+        "id": product_id,
+        "name": f"Sweet {product_id}",
+        "description": "Soft dough balls soaked in rose-scented sugar syrup",
+        "price": round(rng.uniform(3, 40), 2),
+        "category": rng.choice(['classic', 'premium', 'seasonal']),
+        "image": "default.jpg",
+        "in_stock": rng.random() < 0.9
+    }) for product_id in range(1, args.products + 1)]
+    order_list = {"orders": [records.Order(sample_order(i, rng)) for i in range(args.orders)], "next_cursor": None}
+
+    def best_of(fn, repeat=5):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000, result
+
+    print(f"{'payload':<12} {'encoder':<8} {'ms':>9} {'bytes':>12} {'gzip ms':>9} {'gzip bytes':>11}")
+    for name, payload in (('catalog', catalog), ('orders', order_list)):
+        for label, encode in (('stdlib', lambda: stdlib.dumps(payload, default=fast.default,
+                                                              separators=(',', ':')).encode('utf-8')),
+                              ('fast', lambda: fast.dumps_bytes(payload))):
+            encode_ms, body = best_of(encode)
+            gzip_ms, compressed = best_of(lambda: gzip.compress(body, compresslevel=6, mtime=0))
+            print(f"{name:<12} {label:<8} {encode_ms:>9.2f} {len(body):>12,} {gzip_ms:>9.2f} {len(compressed):>11,}")
+
+
+def bench_bulk(args):
+    """Time repricing a slice of the catalog with one PUT per product vs one bulk CSV import"""
+    import app
+    disable_throttles(app)
+
+    seed(app, args.products, 0, 0, random.Random(5))
+    client = logged_in_client(app, DEMO_ADMIN)
+    ids = [p['id'] for p in app.products.all()]
+    changes = min(args.changes, len(ids) // 2)
+    one_by_one, batched = ids[:changes], ids[changes:2 * changes]
+
+    started = time.perf_counter()
+    for product_id in one_by_one:
+        response = client.put(f'/api/admin/products/{product_id}', json={'price': 9.99})
+        assert response.status_code == 200, response.get_json()
+    single_s = time.perf_counter() - started
+
+    body = 'id,price\n' + ''.join(f'{product_id},9.99\n' for product_id in batched)
+    started = time.perf_counter()
+    response = client.post('/api/admin/products/bulk', data=body, content_type='text/csv')
+    assert response.status_code == 200, response.get_json()
+    bulk_s = time.perf_counter() - started
+
+    print(f"{'method':<12} {'products':>9} {'requests':>9} {'total ms':>10} {'ms/product':>11}")
+    for label, requests, seconds in (('one-by-one', changes, single_s), ('bulk', 1, bulk_s)):
+        print(f"{label:<12} {changes:>9} {requests:>9} {seconds * 1000:>10.1f} {seconds * 1000 / changes:>11.3f}")
+
+
+def bench_events(args):
+    """Time publishing order events to many open dashboard streams"""
+    from events import EventBus
+    from jsonprovider import FastJSONProvider
+    import flask
+
+    bus = EventBus(dumps=FastJSONProvider(flask.Flask(__name__)).dumps_bytes,
+                   max_subscribers=args.subscribers + 1)
+    # One admin stream per ten customer streams; every event reaches the
+    # admins and one customer
+    admins = [bus.subscribe(['admin']) for _ in range(args.subscribers // 10)]
+    customers = [bus.subscribe([f'user:{i}']) for i in range(args.subscribers - len(admins))]
+    order = sample_order(1, random.Random(3))
+    summary = {key: order[key] for key in ('id', 'order_number', 'user_id', 'total', 'status', 'date')}
+
+    delivered = 0
+    started = time.perf_counter()
+    for i in range(args.events):
+        bus.publish(('admin', f'user:{i % max(1, len(customers))}'), 'order.created', summary)
+        # Drain like the streaming threads would, so buffers never overflow
+        if i % 100 == 99:
+            for subscription in admins + customers:
+                delivered += len(subscription.next(0))
+    for subscription in admins + customers:
+        delivered += len(subscription.next(0))
+    elapsed = time.perf_counter() - started
+
+    print(f"subscribers:     {len(admins)} admin, {len(customers)} customer")
+    print(f"events:          {args.events} ({delivered} frames delivered, {bus.stats()['dropped']} dropped)")
+    print(f"publish+drain:   {elapsed * 1e6 / args.events:.1f} us per event")
+
+
+def run_worker(port, env):
+    """Serve the app on port in this (spawned) process, as one worker of a cluster"""
+    os.environ.update(env)
+    sys.stdout = open(os.devnull, 'w')  # the console mailer prints every email
+    import app
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    make_server('127.0.0.1', port, app.app, threaded=True, request_handler=QuietHandler).serve_forever()
+
+
+class ClusterClient:
+    """A browser-like client (one cookie) whose requests can go to any worker"""
+
+    def __init__(self, ports):
+        self.ports = ports
+        self.cookie = None
+
+    def call(self, worker, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.ports[worker % len(self.ports)], timeout=60)
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            value = cookie.split(';')[0]
+            self.cookie = None if value.endswith('=') else value
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+
+
+def bench_cluster(args):
+    """
+    Run several worker processes on one shared SQLite store and check that
+    sessions, carts, OTPs, rate limits and stock stay consistent whichever
+    worker serves each request
+    """
+    import multiprocessing
+    import shutil
+    import socket
+    import tempfile
+    import records
+    from store import open_store
+
+    directory = tempfile.mkdtemp(prefix='guptas-cluster-')
+    url = f"sqlite:///{os.path.join(directory, 'shared.db')}"
+    env = {'STORE_URL': url, 'PASSWORD_HASH_COST': '10'}
+    stock = 50
+
+    # Give Rasgulla a stock count before any worker indexes the catalog
+    os.environ.update(env)
+    import app as seeded
+    seeded.products.update(2, {'stock': stock, 'in_stock': True})
+    db = open_store(url)
+    otps = db.table('otps', key='email')
+    products = db.table('products', record_type=records.Product)
+
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    context = multiprocessing.get_context('spawn')
+    ports = [free_port() for _ in range(args.workers)]
+    workers = {}
+
+    def start(worker):
+        workers[worker] = context.Process(target=run_worker, args=(ports[worker], env), daemon=True)
+        workers[worker].start()
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if ClusterClient(ports).call(worker, 'GET', '/api/products/1')[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise SystemExit(f"worker {worker} did not start")
+
+    failures = []
+
+    def check(name, ok, detail=''):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail and not ok else ''}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        started = time.perf_counter()
+        for worker in range(args.workers):
+            start(worker)
+        print(f"started {args.workers} workers on {url} in {time.perf_counter() - started:.1f}s")
+
+        # A session created by one worker is valid on every other
+        user = ClusterClient(ports)
+        status, _ = user.call(0, 'POST', '/api/login', DEMO_USER)
+        profiles = [user.call(worker, 'GET', '/api/user/profile') for worker in range(args.workers)]
+        check("session shared by all workers", status == 200 and all(
+            code == 200 and body['email'] == DEMO_USER['email'] for code, body in profiles), profiles)
+
+        # Concurrent cart additions spread over the workers all land in one cart
+        per_thread = 10
+        item = {'id': 1, 'name': 'Gulab Jamun', 'price': 12.99, 'quantity': 1}
+
+        def add_to_cart(thread):
+            for i in range(per_thread):
+                user.call(thread + i, 'POST', '/api/cart', {'action': 'add', 'item': item})
+
+        threads = [threading.Thread(target=add_to_cart, args=(t,)) for t in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        carts = [user.call(worker, 'GET', '/api/cart')[1] for worker in range(args.workers)]
+        expected = args.threads * per_thread
+        check("cart updates from every worker are kept", all(
+            cart['items'] and cart['items'][0]['quantity'] == expected for cart in carts),
+            [cart['items'] for cart in carts])
+
+        # Register on one worker, verify the emailed OTP on another, log in on a third
+        email = f"cluster{os.getpid()}@example.com"
+        newcomer = ClusterClient(ports)
+        newcomer.call(0, 'POST', '/api/register', {
+            'first_name': 'Cluster', 'last_name': 'Test', 'email': email, 'password': 'cluster-pass-1',
+            'phone': '', 'address': '1 Bench Lane', 'dob': '1990-01-01'})
+        otp = otps.get(email)
+        status, body = newcomer.call(1, 'POST', '/api/verify-email', {'email': email, 'otp': otp and otp['otp']})
+        login_status, _ = newcomer.call(2, 'POST', '/api/login',
+                                        {'user_type': 'user', 'email': email, 'password': 'cluster-pass-1'})
+        check("OTP issued by one worker verifies on another", status == 200 and login_status == 200, body)
+
+        # Failed logins count against one shared budget
+        attacker = ClusterClient(ports)
+        codes = [attacker.call(i, 'POST', '/api/login', dict(DEMO_USER, email='nobody@example.com'))[0]
+                 for i in range(8)]
+        check("rate limits shared by all workers", codes[:5] == [401] * 5 and set(codes[5:]) == {429}, codes)
+
+        # Many tabs racing for the last units across workers never oversell
+        outcomes = []
+
+        def buy(thread):
+            buyer = ClusterClient(ports)
+            buyer.cookie = user.cookie
+            for i in range(2 * stock // args.threads + 1):
+                outcomes.append(buyer.call(thread + i, 'POST', '/api/order', {
+                    'items': [{'product_id': 2, 'quantity': 1}], 'address': '1 Bench Lane'}))
+
+        threads = [threading.Thread(target=buy, args=(t,)) for t in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sold = [body['order_id'] for code, body in outcomes if code == 200]
+        refused = sum(1 for code, _ in outcomes if code == 409)
+        left = products.get(2)['stock']
+        check("stock never oversold", len(sold) == stock and left == 0 and refused == len(outcomes) - stock,
+              f"{len(sold)} sold, {refused} refused, {left} left")
+        check("order numbers unique across workers", len(set(sold)) == len(sold))
+
+        # Sessions and the signing key survive a worker restart
+        workers[0].terminate()
+        workers[0].join()
+        start(0)
+        check("session survives a worker restart", user.call(0, 'GET', '/api/user/profile')[0] == 200)
+
+        # Logging out on one worker ends the session on all of them, even for
+        # a client that kept the old cookie
+        cookie = user.cookie
+        user.call(1, 'POST', '/api/logout')
+        user.cookie = cookie
+        check("logout revokes the session everywhere",
+              all(user.call(worker, 'GET', '/api/user/profile')[0] == 401 for worker in range(args.workers)))
+    finally:
+        for process in workers.values():
+            process.terminate()
+        db.close()
+        seeded.db.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if failures:
+        sys.exit(f"{len(failures)} consistency checks failed: {', '.join(failures)}")
+    print(f"all checks passed across {args.workers} workers")
+
+
+def bench_serving(args):
+    """
+    Serve the app with serve.py in sync and then async mode, with the same
+    number of threads, and measure catalog browsing throughput and latency
+    first on its own, then while dashboards hold event streams open
+    """
+    import socket
+    import subprocess
+
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def browse(port, duration):
+        latencies = [[] for _ in range(args.concurrency)]
+        errors = [0] * args.concurrency
+        deadline = time.perf_counter() + duration
+
+        def client(index):
+            rng = random.Random(index)
+            next_request = scenario_requests('browse', rng, 4)
+            # http.client reconnects by itself after a response that closed
+            # the connection, so keep-alive is used wherever the server allows
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=args.timeout)
+            while time.perf_counter() < deadline:
+                method, path, _ = next_request()
+                started = time.perf_counter()
+                try:
+                    conn.request(method, path)
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status < 400 or response.status == 404
+                except OSError:
+                    conn.close()
+                    ok = False
+                if ok:
+                    latencies[index].append(time.perf_counter() - started)
+                else:
+                    errors[index] += 1
+            conn.close()
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        samples = sorted(latency for chunk in latencies for latency in chunk)
+
+        def percentile(q):
+            return f"{samples[min(len(samples) - 1, int(len(samples) * q))] * 1000:.2f}" if samples else '-'
+
+        return len(samples) / elapsed, percentile(0.5), percentile(0.99), sum(errors)
+
+    def open_streams(port, cookie, count):
+        streams = []
+        for _ in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f"GET /api/events HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n"
+                         f"Accept: text/event-stream\r\n\r\n".encode('latin-1'))
+            streams.append(sock)
+        return streams
+
+    def answered(streams):
+        count = 0
+        for sock in streams:
+            sock.setblocking(False)
+            try:
+                count += bool(sock.recv(65536))
+            except BlockingIOError:
+                pass
+        return count
+
+    env = dict(os.environ, PASSWORD_HASH_COST='10', STORE_URL='memory://')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+    print(f"{args.threads} threads per server, {args.concurrency} browsing clients, "
+          f"{args.timeout:g}s client timeout\n")
+    print(f"{'mode':<6} {'streams':>8} {'answered':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode in ('sync', 'async'):
+        port = free_port()
+        server = subprocess.Popen([sys.executable, script, '--bind', f'127.0.0.1:{port}', '--mode', mode,
+                                   '--threads', str(args.threads), '--timeout', str(args.timeout)],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        streams = []
+        try:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    admin = HTTPDriver(port, DEMO_ADMIN)
+                    break
+                except OSError:
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        raise SystemExit(f"serve.py --mode {mode} did not start")
+                    time.sleep(0.1)
+
+            rate, p50, p99, errors = browse(port, args.duration)
+            print(f"{mode:<6} {0:>8} {'-':>9} {rate:>9.1f} {p50:>8} {p99:>8} {errors:>7}")
+
+            streams = open_streams(port, admin.cookie, args.streams)
+            time.sleep(0.5)
+            rate, p50, p99, errors = browse(port, args.duration)
+            served = f"{answered(streams)}/{len(streams)}"
+            print(f"{mode:<6} {len(streams):>8} {served:>9} {rate:>9.1f} {p50:>8} {p99:>8} {errors:>7}")
+        finally:
+            for sock in streams:
+                sock.close()
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    orders = commands.add_parser('orders', help='concurrent order placement stress test')
+    orders.add_argument('--threads', type=int, default=32)
+    orders.add_argument('--orders', type=int, default=5000)
+    orders.add_argument('--min-rate', type=float, default=0, help='fail below this many orders/s')
+    orders.set_defaults(run=bench_orders)
+
+    suite = commands.add_parser('suite', help='browse/cart/checkout/admin scenarios with latency percentiles')
+    suite.add_argument('--products', type=int, default=1000)
+    suite.add_argument('--users', type=int, default=1000)
+    suite.add_argument('--orders', type=int, default=100000)
+    suite.add_argument('--server', choices=['testclient', 'wsgi'], default='testclient')
+    suite.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    suite.add_argument('--concurrency', type=int, default=8)
+    suite.add_argument('--scenarios', default='browse,cart,checkout,history,admin_orders')
+    suite.add_argument('--save-baseline', metavar='FILE')
+    suite.add_argument('--baseline', metavar='FILE', help=f'compare against a saved run, e.g. {DEFAULT_BASELINE}')
+    suite.add_argument('--tolerance', type=float, default=20, help='allowed regression in percent')
+    suite.set_defaults(run=bench_suite)
+
+    encoders = commands.add_parser('json', help='stdlib vs fast JSON encoding and compression of API payloads')
+    encoders.add_argument('--products', type=int, default=1000)
+    encoders.add_argument('--orders', type=int, default=500, help='orders in the order list payload')
+    encoders.set_defaults(run=bench_json)
+
+    memory = commands.add_parser('records', help='memory and encoding cost of dict orders vs slotted records')
+    memory.add_argument('--orders', type=int, default=200000)
+    memory.set_defaults(run=bench_records)
+
+    catalog = commands.add_parser('bulk', help='per-product admin edits vs one bulk catalog import')
+    catalog.add_argument('--products', type=int, default=5000)
+    catalog.add_argument('--changes', type=int, default=500, help='products repriced by each method')
+    catalog.set_defaults(run=bench_bulk)
+
+    push = commands.add_parser('events', help='order event fan-out to open dashboard streams')
+    push.add_argument('--subscribers', type=int, default=1000)
+    push.add_argument('--events', type=int, default=2000)
+    push.set_defaults(run=bench_events)
+
+    cluster = commands.add_parser('cluster', help='multi-process consistency checks on a shared SQLite store')
+    cluster.add_argument('--workers', type=int, default=4)
+    cluster.add_argument('--threads', type=int, default=8, help='concurrent clients in the racing checks')
+    cluster.set_defaults(run=bench_cluster)
+
+    serving = commands.add_parser('serving', help='serve.py sync vs async mode with event streams held open')
+    serving.add_argument('--threads', type=int, default=16, help='request threads in each server')
+    serving.add_argument('--concurrency', type=int, default=16, help='browsing clients')
+    serving.add_argument('--streams', type=int, default=200, help='event streams opened for the second run')
+    serving.add_argument('--duration', type=float, default=3, help='seconds each run lasts')
+    serving.add_argument('--timeout', type=float, default=5, help='client and server socket timeout')
+    serving.set_defaults(run=bench_serving)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import csv
+import io
+import json
+
+from store import BatchError
+
+# Columns of a product export, in order; imports accept the same columns plus 'op'
+FIELDS = ('id', 'name', 'description', 'price', 'category', 'image', 'in_stock', 'stock')
+FORMATS = ('csv', 'ndjson')
+REQUIRED = ('name', 'description', 'price', 'category')
+
+_TRUE = ('1', 'true', 'yes', 'y')
+_FALSE = ('0', 'false', 'no', 'n')
+
+
+def detect_format(name=None, mimetype=None):
+    """Guess csv or ndjson from a file name or content type; None if neither says"""
+    name = (name or '').lower()
+    mimetype = (mimetype or '').lower()
+    if name.endswith('.csv') or mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
+
+
+def read_rows(lines, fmt):
+    """
+    Yield (row_number, row, error) for each row of a CSV or NDJSON text
+    stream; row is a dict, or None when the line could not be parsed.
+    Row numbers count data rows from 1, so a CSV header is not counted.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for number, row in enumerate(reader, 1):
+            if None in row:
+                yield number, None, "More values than columns"
+                continue
+            # An empty CSV cell means "not given", not an empty value
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}, None
+    elif fmt == 'ndjson':
+        number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            if isinstance(row, dict):
+                yield number, row, None
+            else:
+                yield number, None, "Each line must be a JSON object"
+    else:
+        raise ValueError(f"Unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+
+
+def export_rows(products, fmt, dumps=None):
+    """Yield a CSV or NDJSON export of products, one encoded chunk per row"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(FIELDS)
+        for product in products:
+            writer.writerow(['true' if value is True else 'false' if value is False else value
+                             for value in (product.get(field) for field in FIELDS)])
+            if buffer.tell() > 16384:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+    elif fmt == 'ndjson':
+        dumps = dumps or (lambda value: json.dumps(value, sort_keys=True).encode('utf-8'))
+        for product in products:
+            yield dumps({field: product.get(field) for field in FIELDS if product.get(field) is not None}) + b'\n'
+    else:
+        raise ValueError(f"Unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"not a true/false value: {value!r}")
+
+
+def _price(value):
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        price = round(float(value), 2)
+    except ValueError:
+        raise ValueError("must be a number") from None
+    if not price >= 0:
+        raise ValueError("must be zero or more")
+    return price
+
+
+def _count(value):
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        count = int(value)
+    except ValueError:
+        raise ValueError("must be a whole number") from None
+    if count < 0:
+        raise ValueError("must be zero or more")
+    return count
+
+
+def _text(value):
+    if not isinstance(value, str):
+        raise ValueError("must be text")
+    text = value.strip()
+    if not text:
+        raise ValueError("must not be empty")
+    return text
+
+
+CONVERTERS = {
+    'id': _count,
+    'name': _text,
+    'description': _text,
+    'price': _price,
+    'category': _text,
+    'image': _text,
+    'in_stock': _boolean,
+    'stock': _count,
+}
+
+
+def convert(field, value):
+    """Validate and normalise one product field as an import row would"""
+    try:
+        return CONVERTERS[field](value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid {field}: {e}") from None
+
+
+class ProductImport:
+    """
+    Bulk catalog changes from CSV or NDJSON rows.
+
+    Each row is an upsert (a row without an id adds a product, one with an
+    id updates that product's given fields) or, with op=delete, a delete.
+    Every row is validated first and all errors are reported together with
+    their row numbers; only a batch with no errors is applied, as a single
+    products.apply() call, so the catalog never holds half an import.
+    Existing ids are checked against the catalog index's id map rather than
+    the table, and the store re-checks them inside the batch.
+    """
+
+    def __init__(self, products, index, next_id, max_rows=10000):
+        self.products = products
+        self.index = index
+        self.next_id = next_id
+        self.max_rows = max_rows
+
+    def plan(self, rows):
+        """
+        Return (ops, row_numbers, errors) for rows of (row_number, row, error)
+        as produced by read_rows(). New products get no id until the batch
+        is applied, so a rejected import does not use any up.
+        """
+        known = self.index.prices()
+        ops = []
+        numbers = []
+        errors = []
+        seen = {}
+        for number, row, error in rows:
+            if len(numbers) + len(errors) >= self.max_rows:
+                errors.append({"row": number, "error": f"Imports are limited to {self.max_rows} rows"})
+                break
+            if error is None:
+                try:
+                    op = self._row_op(row, known)
+                except ValueError as e:
+                    error = str(e)
+            if error is None and op[0] != 'insert':
+                if op[1] in seen:
+                    error = f"Product {op[1]} already changed by row {seen[op[1]]}"
+                else:
+                    seen[op[1]] = number
+            if error is not None:
+                errors.append({"row": number, "error": error})
+                continue
+            ops.append(op)
+            numbers.append(number)
+        return ops, numbers, errors
+
+    def _row_op(self, row, known):
+        action = str(row.get('op') or 'upsert').strip().lower()
+        unknown = sorted(set(row) - set(FIELDS) - {'op'})
+        if unknown:
+            raise ValueError(f"Unknown column {', '.join(unknown)}")
+        fields = {}
+        for field, value in row.items():
+            if field == 'op' or value is None:
+                continue
+            fields[field] = convert(field, value)
+
+        product_id = fields.pop('id', None)
+        if action == 'delete':
+            if product_id is None:
+                raise ValueError("A delete needs an id")
+            if product_id not in known:
+                raise ValueError(f"Unknown product {product_id}")
+            return ('delete', product_id)
+        if action != 'upsert':
+            raise ValueError(f"Unknown op {action!r} (expected upsert or delete)")
+        # Products with a stock count sell out automatically, as in the admin form
+        if 'stock' in fields and 'in_stock' not in fields:
+            fields['in_stock'] = fields['stock'] > 0
+        if product_id is not None:
+            if product_id not in known:
+                raise ValueError(f"Unknown product {product_id} (leave id empty to add a product)")
+            if not fields:
+                raise ValueError("Nothing to update")
+            return ('update', product_id, fields)
+        missing = [field for field in REQUIRED if field not in fields]
+        if missing:
+            raise ValueError(f"A new product needs {', '.join(missing)}")
+        fields.setdefault('image', 'default.jpg')
+        fields.setdefault('in_stock', True)
+        return ('insert', fields)
+
+    def run(self, rows, dry_run=False):
+        """
+        Validate and apply rows; returns (report, changed products, removed ids).
+
+        The report counts inserted, updated and deleted products and lists
+        per-row errors. Nothing is applied if any row has an error, if
+        dry_run is set, or if the store rejects the batch.
+        """
+        ops, numbers, errors = self.plan(rows)
+        report = {"rows": len(ops) + len(errors), "inserted": 0, "updated": 0, "deleted": 0,
+                  "errors": errors, "applied": False}
+        changed, removed = [], []
+        for op in ops:
+            report[{'insert': 'inserted', 'update': 'updated', 'delete': 'deleted'}[op[0]]] += 1
+        if errors or dry_run or not ops:
+            return report, changed, removed
+
+        ops = [('insert', dict(op[1], id=self.next_id())) if op[0] == 'insert' else op for op in ops]
+        try:
+            results = self.products.apply(ops)
+        except BatchError as e:
+            report["errors"] = [{"row": numbers[e.index], "error": str(e)}]
+            return report, changed, removed
+        for op, record in zip(ops, results):
+            if op[0] == 'delete':
+                removed.append(record['id'])
+            else:
+                changed.append(record)
+        report["applied"] = True
+        return report, changed, removed
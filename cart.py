@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import OrderedDict
+
+from store import modify_or_insert
+
+
+def validate_op(op, max_quantity=None):
+    """Raise ValueError unless op is a well-formed cart operation"""
+    item = op.get('item') if isinstance(op, dict) else None
+    if not isinstance(item, dict) or 'id' not in item:
+        raise ValueError("Each cart operation needs an item with an id")
+    if op.get('action') == 'update' and 'quantity' not in item:
+        raise ValueError("Cart updates need a quantity")
+    try:
+        if isinstance(item['id'], bool):
+            raise ValueError
+        int(item['id'])
+        quantity = int(item.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise ValueError("Cart product ids and quantities must be numbers") from None
+    if max_quantity is not None and quantity > max_quantity:
+        raise ValueError(f"Cart quantities are limited to {max_quantity}")
+
+
+class Cart:
+    """
+    One user's cart.
+
+    Items are keyed by product id and the total is kept in integer cents and
+    adjusted on every change, so no operation re-sums or searches the cart.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.total_cents = 0
+        self.lock = threading.Lock()
+
+    def add(self, item, quantity=1, max_quantity=None):
+        """Add a catalog item (id, name, price_cents) to the cart"""
+        existing = self.items.get(item['id'])
+        if max_quantity is not None and (existing['quantity'] if existing else 0) + quantity > max_quantity:
+            raise ValueError(f"At most {max_quantity} of {item['name']} per cart")
+        if existing:
+            existing['quantity'] += quantity
+            self.total_cents += existing['price_cents'] * quantity
+        else:
+            price_cents = item['price_cents']
+            self.items[item['id']] = {
+                'id': item['id'],
+                'name': item['name'],
+                'price': price_cents / 100,
+                'quantity': quantity,
+                'price_cents': price_cents
+            }
+            self.total_cents += price_cents * quantity
+
+    def remove(self, product_id):
+        existing = self.items.pop(product_id, None)
+        if existing:
+            self.total_cents -= existing['price_cents'] * existing['quantity']
+
+    def update(self, product_id, quantity):
+        existing = self.items.get(product_id)
+        if not existing:
+            return
+        if quantity <= 0:
+            self.remove(product_id)
+            return
+        self.total_cents += existing['price_cents'] * (quantity - existing['quantity'])
+        existing['quantity'] = quantity
+
+    def apply(self, action, item, max_quantity=None):
+        """Apply one add/remove/update operation; unknown actions are ignored"""
+        if action == 'add':
+            self.add(item, max(1, int(item.get('quantity', 1))), max_quantity)
+        elif action == 'remove':
+            self.remove(item['id'])
+        elif action == 'update':
+            self.update(item['id'], int(item['quantity']))
+
+    def to_row(self):
+        """Return the cart as a storable dict (see CartEngine's shared mode)"""
+        return {'items': list(self.items.values()), 'total_cents': self.total_cents}
+
+    @classmethod
+    def from_row(cls, row):
+        cart = cls()
+        cart.items = {item['id']: dict(item) for item in row['items']}
+        cart.total_cents = row['total_cents']
+        return cart
+
+    def to_dict(self):
+        return {
+            "items": [
+                {'id': i['id'], 'name': i['name'], 'price': i['price'], 'quantity': i['quantity']}
+                for i in self.items.values()
+            ],
+            "count": len(self.items),
+            "total": self.total_cents / 100
+        }
+
+
+class CartEngine:
+    """
+    All server-side carts, keyed by user id.
+
+    Each cart has its own lock so concurrent tabs of one user serialise while
+    different users never block each other. Carts idle for longer than ttl
+    seconds are evicted; because carts are kept in least-recently-used order,
+    each sweep only looks at the carts it actually removes.
+
+    Given a storage table the carts live there instead, one row per user
+    updated atomically with Table.modify(), so a user's cart is the same
+    whichever worker serves them; rows idle past the TTL are purged every
+    purge_every changes.
+
+    Names and prices of added items come from prices() (the catalog index's
+    id -> PriceEntry map), never from the client, one batch may carry at
+    most max_ops operations and no line may hold more than max_quantity of a
+    product (the most one order may buy).
+    """
+
+    def __init__(self, prices, ttl=2 * 24 * 3600, sweep_interval=60, table=None, purge_every=1000,
+                 max_ops=100, max_quantity=1000):
+        self.prices = prices
+        self.max_ops = max_ops
+        self.max_quantity = max_quantity
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.table = table
+        self.purge_every = purge_every
+        self._carts = OrderedDict()
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._changes = 0
+
+    def __len__(self):
+        return len(self.table) if self.table is not None else len(self._carts)
+
+    def _cart(self, user_id, create=True):
+        now = time.monotonic()
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None:
+                if not create:
+                    return None
+                cart = self._carts[user_id] = Cart()
+            else:
+                self._carts.move_to_end(user_id)
+            self._touched[user_id] = now
+            if now - self._last_sweep >= self.sweep_interval:
+                self._evict(now)
+            return cart
+
+    def _evict(self, now):
+        self._last_sweep = now
+        while self._carts:
+            user_id = next(iter(self._carts))
+            if now - self._touched[user_id] < self.ttl:
+                break
+            del self._carts[user_id]
+            del self._touched[user_id]
+
+    def evict_expired(self):
+        """Drop every cart idle for longer than the TTL"""
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def get(self, user_id):
+        """Return the user's cart as a response dict"""
+        if self.table is not None:
+            row = self.table.get(user_id)
+            if row is None or row['touched'] <= time.time() - self.ttl:
+                return {"items": [], "count": 0, "total": 0}
+            return Cart.from_row(row).to_dict()
+        cart = self._cart(user_id, create=False)
+        if cart is None:
+            return {"items": [], "count": 0, "total": 0}
+        with cart.lock:
+            return cart.to_dict()
+
+    def apply(self, user_id, ops):
+        """Apply a list of {'action', 'item'} operations atomically and return the cart"""
+        if not isinstance(ops, list):
+            raise ValueError("Cart operations must be a list")
+        if len(ops) > self.max_ops:
+            raise ValueError(f"A cart batch is limited to {self.max_ops} operations")
+        for op in ops:
+            validate_op(op, self.max_quantity)
+        ops = self._resolve(ops)
+        if self.table is not None:
+            return self._apply_shared(user_id, ops)
+        cart = self._cart(user_id)
+        with cart.lock:
+            # Adds can still overflow a line, so the batch runs on a copy first
+            staged = Cart.from_row(cart.to_row())
+            for op in ops:
+                staged.apply(op.get('action'), op.get('item'), self.max_quantity)
+            cart.items, cart.total_cents = staged.items, staged.total_cents
+            return cart.to_dict()
+
+    def _resolve(self, ops):
+        """Return ops with numeric ids and catalog names and prices on every add"""
+        prices = self.prices()
+        resolved = []
+        for op in ops:
+            action, item = op.get('action'), op['item']
+            product_id = int(item['id'])
+            if action == 'add':
+                entry = prices.get(product_id)
+                if entry is None:
+                    raise ValueError(f"Unknown product {product_id}")
+                item = {'id': product_id, 'name': entry.name, 'price_cents': entry.price_cents,
+                        'quantity': item.get('quantity', 1)}
+            else:
+                item = dict(item, id=product_id)
+            resolved.append({'action': action, 'item': item})
+        return resolved
+
+    def _apply_shared(self, user_id, ops):
+        now = time.time()
+
+        def apply_ops(cart):
+            for op in ops:
+                cart.apply(op.get('action'), op.get('item'), self.max_quantity)
+            return dict(cart.to_row(), touched=now), cart.to_dict()
+
+        def change(row):
+            return apply_ops(Cart.from_row(row) if row['touched'] > now - self.ttl else Cart())
+
+        def create():
+            row, cart = apply_ops(Cart())
+            return dict(row, user_id=user_id), cart
+
+        cart = modify_or_insert(self.table, user_id, change, create)
+
+        with self._lock:
+            self._changes += 1
+            purge = self._changes % self.purge_every == 0
+        if purge:
+            self.purge(now)
+        return cart
+
+    def purge(self, now=None):
+        """Drop shared carts idle for longer than the TTL; returns how many"""
+        if self.table is None:
+            return 0
+        cutoff = (now or time.time()) - self.ttl
+        stale = [row[self.table.key] for row in self.table.scan() if row['touched'] <= cutoff]
+        for user_id in stale:
+            self.table.delete(user_id)
+        return len(stale)
+
+    def clear(self, user_id):
+        if self.table is not None:
+            self.table.delete(user_id)
+            return
+        with self._lock:
+            self._carts.pop(user_id, None)
+            self._touched.pop(user_id, None)
@@ -0,0 +1,312 @@
+import base64
+import bisect
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import namedtuple
+
+from flask import Response
+
+from compression import brotli
+
+CatalogEntry = namedtuple('CatalogEntry', 'version tag body variants built')
+PriceEntry = namedtuple('PriceEntry', 'price_cents name in_stock stock')
+
+
+class CatalogCache:
+    """
+    Pre-serialised product catalog.
+
+    The JSON body, its gzip/brotli variants and a content hash are built once
+    per catalog version and reused for every request until an admin change
+    calls invalidate(). Clients that send back the ETag get a bodyless 304.
+
+    With a shared storage backend another worker may change the catalog, so
+    max_age bounds how long an entry is trusted without rebuilding.
+    """
+
+    def __init__(self, load, dumps=json.dumps, max_age=None):
+        self._load = load
+        self._dumps = dumps
+        self.max_age = max_age
+        self._version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the cached catalog; the next request rebuilds it"""
+        with self._lock:
+            self._version += 1
+            self._entry = None
+
+    def get(self):
+        entry = self._entry
+        if entry is not None and not self._stale(entry):
+            return entry
+        with self._lock:
+            entry = self._entry
+            if entry is None or self._stale(entry):
+                entry = self._entry = self._build()
+            return entry
+
+    def _stale(self, entry):
+        return self.max_age is not None and time.monotonic() - entry.built > self.max_age
+
+    def _build(self):
+        body = self._dumps(self._load())
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        tag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        variants = {}
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body)
+            if len(compressed) < len(body):
+                variants['br'] = compressed
+        return CatalogEntry(self._version, tag, body, variants, time.monotonic())
+
+    def serve(self, request):
+        """Return the catalog response for request, honouring If-None-Match"""
+        entry = self.get()
+        encoding = None
+        for name in ('br', 'gzip'):
+            if name in entry.variants and request.accept_encodings[name]:
+                encoding = name
+                break
+        # Each encoding is a different representation and gets its own strong ETag
+        etag = f"{entry.tag}-{encoding}" if encoding else entry.tag
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(entry.variants[encoding] if encoding else entry.body,
+                                mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens"""
+    return set(_TOKEN_RE.findall(str(text or '').lower()))
+
+
+_CURSOR_TYPES = {'id': (int,), 'price': (int, float), 'name': (str,)}
+
+
+def _encode_cursor(sort, descending, position):
+    key, product_id = position
+    data = json.dumps([sort, descending, key, product_id])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, sort, descending):
+    """
+    Return the (key, id) position a cursor resumes after. The cursor must have
+    been issued for the same sort key and direction, so a cursor reused with
+    different query parameters is rejected instead of being compared against
+    keys of another type.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_descending, key, product_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor") from None
+    if (cursor_sort != sort or cursor_descending is not bool(descending)
+            or not isinstance(key, _CURSOR_TYPES[sort]) or isinstance(key, bool)
+            or not isinstance(product_id, int) or isinstance(product_id, bool)):
+        raise ValueError("Invalid cursor")
+    return key, product_id
+
+
+class CatalogIndex:
+    """
+    Query indexes over the product catalog.
+
+    Keeps category and in-stock id sets, sorted (key, id) lists for each sort
+    key (the price list doubles as the price-range index), an inverted token
+    index over name and description and the id -> price/stock map checkout
+    reprices orders from. Admin edits update the indexes for just the product
+    that changed.
+    """
+
+    SORT_KEYS = {
+        'id': lambda p: p['id'],
+        'price': lambda p: float(p['price']),
+        'name': lambda p: str(p['name']).lower()
+    }
+
+    def __init__(self, load, max_age=None):
+        self._load = load
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-index the whole catalog from the loader"""
+        with self._lock:
+            self._products = {}
+            self._prices = {}
+            self._categories = {}
+            self._in_stock = set()
+            self._tokens = {}
+            self._sorted = {key: [] for key in self.SORT_KEYS}
+            for product in self._load():
+                self._add(product)
+            self._built = time.monotonic()
+
+    def _add(self, product):
+        product_id = product['id']
+        self._products[product_id] = dict(product)
+        self._prices[product_id] = PriceEntry(
+            round(float(product['price']) * 100), product.get('name'),
+            bool(product.get('in_stock')), product.get('stock'))
+        self._categories.setdefault(product.get('category'), set()).add(product_id)
+        if product.get('in_stock'):
+            self._in_stock.add(product_id)
+        for token in tokenize(product.get('name')) | tokenize(product.get('description')):
+            self._tokens.setdefault(token, set()).add(product_id)
+        for key, keyfunc in self.SORT_KEYS.items():
+            bisect.insort(self._sorted[key], (keyfunc(product), product_id))
+
+    def _discard(self, product_id):
+        product = self._products.pop(product_id, None)
+        if product is None:
+            return
+        del self._prices[product_id]
+        self._categories.get(product.get('category'), set()).discard(product_id)
+        self._in_stock.discard(product_id)
+        for token in tokenize(product.get('name')) | tokenize(product.get('description')):
+            ids = self._tokens.get(token)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._tokens[token]
+        for key, keyfunc in self.SORT_KEYS.items():
+            entries = self._sorted[key]
+            i = bisect.bisect_left(entries, (keyfunc(product), product_id))
+            if i < len(entries) and entries[i][1] == product_id:
+                del entries[i]
+
+    def _refresh(self):
+        if self.max_age is not None and time.monotonic() - self._built > self.max_age:
+            self.rebuild()
+
+    def prices(self):
+        """
+        Return the id -> PriceEntry map. Entries are replaced, never mutated,
+        so callers can read the returned map without holding the lock.
+        """
+        with self._lock:
+            self._refresh()
+            return self._prices
+
+    def upsert(self, product):
+        """Index a new or edited product"""
+        with self._lock:
+            self._discard(product['id'])
+            self._add(product)
+
+    def remove(self, product_id):
+        """Drop a deleted product from every index"""
+        with self._lock:
+            self._discard(product_id)
+
+    def apply(self, changed=(), removed=()):
+        """
+        Re-index a batch of new or edited products and drop removed ids under
+        one lock, so queries see the whole batch or none of it. Large batches
+        rebuild from the loader instead of editing the sorted indexes one by one.
+        """
+        changed = list(changed)
+        removed = list(removed)
+        with self._lock:
+            if len(changed) + len(removed) > max(64, len(self._products) // 4):
+                self.rebuild()
+                return
+            for product_id in removed:
+                self._discard(product_id)
+            for product in changed:
+                self._discard(product['id'])
+                self._add(product)
+
+    def query(self, category=None, min_price=None, max_price=None, in_stock=None,
+              text=None, sort='id', descending=False, limit=20, cursor=None):
+        """
+        Return (products, next_cursor) for one page of matching products.
+
+        Filters are intersected starting from the smallest id set; results are
+        ordered by (sort key, id) and next_cursor resumes after the last one.
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort}")
+        with self._lock:
+            self._refresh()
+
+            sets = []
+            if category is not None:
+                sets.append(self._categories.get(category, set()))
+            if in_stock is not None:
+                sets.append(self._in_stock if in_stock else set(self._products) - self._in_stock)
+            for token in tokenize(text):
+                sets.append(self._tokens.get(token, set()))
+            if (min_price is not None or max_price is not None) and sort != 'price':
+                lo, hi = self._price_bounds(min_price, max_price)
+                sets.append({product_id for _, product_id in self._sorted['price'][lo:hi]})
+
+            candidates = None
+            for ids in sorted(sets, key=len):
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    break
+
+            ordered = self._sorted[sort]
+            if sort == 'price':
+                lo, hi = self._price_bounds(min_price, max_price)
+            else:
+                lo, hi = 0, len(ordered)
+            if candidates is not None and len(candidates) * 8 < hi - lo:
+                # Few matches: sorting them beats walking the whole sort index
+                keyfunc = self.SORT_KEYS[sort]
+                ordered = sorted((keyfunc(self._products[i]), i) for i in candidates)
+                if sort == 'price':
+                    ordered = [entry for entry in ordered
+                               if (min_price is None or entry[0] >= min_price)
+                               and (max_price is None or entry[0] <= max_price)]
+                lo, hi = 0, len(ordered)
+                candidates = None
+
+            if cursor is not None:
+                position = _decode_cursor(cursor, sort, descending)
+                if descending:
+                    hi = bisect.bisect_left(ordered, position, lo, hi)
+                else:
+                    lo = bisect.bisect_right(ordered, position, lo, hi)
+
+            page = []
+            for i in (range(hi - 1, lo - 1, -1) if descending else range(lo, hi)):
+                entry = ordered[i]
+                if candidates is None or entry[1] in candidates:
+                    page.append(entry)
+                    if len(page) > limit:
+                        break
+
+            next_cursor = _encode_cursor(sort, descending, page[limit - 1]) if len(page) > limit else None
+            return [dict(self._products[i]) for _, i in page[:limit]], next_cursor
+
+    def _price_bounds(self, min_price, max_price):
+        entries = self._sorted['price']
+        lo = 0 if min_price is None else bisect.bisect_left(entries, (min_price, float('-inf')))
+        hi = len(entries) if max_price is None else bisect.bisect_right(entries, (max_price, float('inf')))
+        return lo, hi
@@ -0,0 +1,116 @@
+class OrderError(ValueError):
+    """An order that cannot be placed as submitted; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Checkout:
+    """
+    Server-side order pricing and stock reservation.
+
+    Orders are repriced from the catalog index's id -> price/stock map, so
+    validating an order is O(items) and never scans the products table; the
+    client's prices and total are ignored. Repeated lines for one product are
+    merged first.
+
+    Products without a 'stock' count are limited only by their in_stock flag
+    and need no write at checkout. For counted products the whole order is
+    reserved with one products.modify() call: one lock (or one transaction
+    on a shared store) however many lines the order has, and either every
+    line is reserved or none is.
+    """
+
+    def __init__(self, products, index, max_quantity=1000):
+        self.products = products
+        self.index = index
+        self.max_quantity = max_quantity
+
+    def quote(self, items):
+        """
+        Return (lines, total_cents) for the submitted items, raising OrderError
+        for malformed lines, unknown products or products out of stock
+        """
+        if not isinstance(items, list) or not items:
+            raise OrderError("An order needs at least one item")
+        quantities = {}
+        for item in items:
+            if not isinstance(item, dict):
+                raise OrderError("Each order item must be an object")
+            try:
+                product_id = int(item.get('product_id', item.get('id')))
+                quantity = int(item.get('quantity', 1))
+            except (TypeError, ValueError):
+                raise OrderError("Order items need a numeric product id and quantity") from None
+            if quantity < 1:
+                raise OrderError("Order quantities must be at least 1")
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+        prices = self.index.prices()
+        lines = []
+        total_cents = 0
+        for product_id, quantity in quantities.items():
+            entry = prices.get(product_id)
+            if entry is None:
+                raise OrderError(f"Unknown product {product_id}")
+            if quantity > self.max_quantity:
+                raise OrderError(f"At most {self.max_quantity} of {entry.name} per order")
+            if not entry.in_stock:
+                raise OrderError(f"{entry.name} is out of stock", 409)
+            if entry.stock is not None and quantity > entry.stock:
+                raise OrderError(f"Only {entry.stock} of {entry.name} left", 409)
+            lines.append({
+                "product_id": product_id,
+                "name": entry.name,
+                "quantity": quantity,
+                "price": entry.price_cents / 100
+            })
+            total_cents += entry.price_cents * quantity
+        return lines, total_cents
+
+    def reserve(self, lines):
+        """
+        Take the ordered quantities out of stock, all or nothing.
+
+        Returns the products whose stock changed so the caller can refresh
+        its indexes; raises OrderError if another order got there first.
+        """
+        prices = self.index.prices()
+        wanted = {line['product_id']: line['quantity'] for line in lines
+                  if prices.get(line['product_id']) is None or prices[line['product_id']].stock is not None}
+        if not wanted:
+            return []
+
+        def take(records):
+            changes = {}
+            for product_id, quantity in wanted.items():
+                product = records.get(product_id)
+                if product is None:
+                    raise OrderError(f"Unknown product {product_id}")
+                stock = product.get('stock')
+                if stock is None:
+                    continue
+                if not product.get('in_stock') or stock < quantity:
+                    raise OrderError(f"Only {stock} of {product['name']} left", 409)
+                changes[product_id] = {'stock': stock - quantity, 'in_stock': stock > quantity}
+            return changes
+
+        return self.products.modify(wanted, take)
+
+    def release(self, lines):
+        """Put reserved quantities back, e.g. when the order could not be stored"""
+        def give_back(records):
+            changes = {}
+            for line in lines:
+                product = records.get(line['product_id'])
+                if product is None or product.get('stock') is None:
+                    continue
+                # Only a product this order sold out comes back in stock
+                changes[line['product_id']] = {
+                    'stock': product['stock'] + line['quantity'],
+                    'in_stock': product.get('in_stock') or product['stock'] == 0
+                }
+            return changes
+
+        return self.products.modify([line['product_id'] for line in lines], give_back)
@@ -0,0 +1,11 @@
+"""
+Optional compression codecs
+
+brotli is used when it is installed, for precompressed assets, the cached
+catalog and large JSON responses; gzip from the standard library is always
+available, so callers check `brotli is not None` before offering br.
+"""
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
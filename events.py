@@ -0,0 +1,268 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+# Tells a client it missed events and should refetch what it shows
+RESYNC = b'event: resync\ndata: {}\n\n'
+KEEPALIVE = b': keep-alive\n\n'
+
+
+def _call_soon(loop, callback):
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass  # the loop has shut down; nobody is waiting any more
+
+
+class TooManySubscribers(Exception):
+    """Raised when the bus already has max_subscribers open streams"""
+
+
+class Subscription:
+    """
+    One open event stream: the topics it listens to and a bounded buffer
+    of encoded frames waiting to be sent.
+
+    A subscriber that falls more than `size` frames behind (a stalled
+    client, a slow network) has its buffer dropped and gets a single resync
+    event instead, so a slow reader costs at most `size` frames of memory
+    and never holds up publishers.
+    """
+
+    def __init__(self, topics, size):
+        self.topics = frozenset(topics)
+        self.size = size
+        self.dropped = 0
+        self.closed = False
+        self._frames = deque()
+        self._overflowed = False
+        self._ready = threading.Condition(threading.Lock())
+        # Set while an event loop awaits this subscription (see next_async)
+        self._wake = None
+
+    def push(self, frame):
+        with self._ready:
+            if self._overflowed:
+                self.dropped += 1
+            elif len(self._frames) >= self.size:
+                self.dropped += len(self._frames) + 1
+                self._frames.clear()
+                self._overflowed = True
+            else:
+                self._frames.append(frame)
+            self._ready.notify()
+            if self._wake is not None:
+                self._wake()
+
+    def resync(self):
+        """Ask the client to refetch, e.g. when events it asked to replay are gone"""
+        with self._ready:
+            self._frames.clear()
+            self._overflowed = True
+            self._ready.notify()
+            if self._wake is not None:
+                self._wake()
+
+    def _pending(self):
+        return bool(self._frames) or self._overflowed or self.closed
+
+    def _take(self):
+        frames = list(self._frames)
+        self._frames.clear()
+        if self._overflowed:
+            # Everything queued after the overflow is newer than the
+            # refetch it triggers, so it still applies
+            self._overflowed = False
+            frames.insert(0, RESYNC)
+        return frames
+
+    def next(self, timeout):
+        """Return the frames waiting, blocking up to timeout seconds; [] on timeout"""
+        with self._ready:
+            if not self._pending():
+                self._ready.wait(timeout)
+            return self._take()
+
+    async def next_async(self, timeout):
+        """Like next(), but waits on the running event loop instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        with self._ready:
+            if self._pending():
+                return self._take()
+            self._wake = lambda: _call_soon(loop, woken.set)
+        try:
+            await asyncio.wait_for(woken.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._ready:
+                self._wake = None
+        with self._ready:
+            return self._take()
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+            if self._wake is not None:
+                self._wake()
+
+
+class EventBus:
+    """
+    In-process publish/subscribe feeding Server-Sent Event streams.
+
+    publish() encodes an event once into an SSE frame and hands the same
+    bytes to every subscriber of its topics, so fan-out costs one append
+    per subscriber, not one encoding. Event ids increase monotonically and
+    the last `history` frames are kept, so a client that reconnects with
+    Last-Event-ID gets what it missed replayed (or a resync if it is gone).
+
+    Only events published in this process are seen; with several workers
+    each dashboard hears about changes made through its own worker.
+    """
+
+    def __init__(self, dumps=None, buffer_size=256, max_subscribers=1000, history=1000):
+        self._dumps = dumps or (lambda data: json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._topics = {}
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def publish(self, topics, event, data):
+        """Send event with data to every subscriber of any of topics; returns its id"""
+        body = self._dumps(data)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        topics = frozenset(topics)
+        with self._lock:
+            event_id = self._last_id = next(self._ids)
+            frame = b'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, event.encode('ascii'), body)
+            self._history.append((event_id, topics, frame))
+            # Delivered under the lock, so every stream sees events in id order
+            delivered = set()
+            for topic in topics:
+                for subscription in self._topics.get(topic, ()):
+                    if subscription not in delivered:
+                        delivered.add(subscription)
+                        subscription.push(frame)
+            self.published += 1
+        return event_id
+
+    def subscribe(self, topics, last_event_id=None):
+        """
+        Open a subscription to topics, replaying events after last_event_id
+        if given; raises TooManySubscribers when the bus is full
+        """
+        subscription = Subscription(topics, self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"{len(self._subscribers)} event streams already open")
+            self._subscribers.add(subscription)
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+            if last_event_id is not None and last_event_id < self._last_id:
+                oldest = self._history[0][0] if self._history else self._last_id + 1
+                if last_event_id + 1 < oldest:
+                    subscription.resync()
+                else:
+                    for event_id, topics, frame in self._history:
+                        if event_id > last_event_id and topics & subscription.topics:
+                            subscription.push(frame)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            self._subscribers.discard(subscription)
+            for topic in subscription.topics:
+                listeners = self._topics.get(topic)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._topics[topic]
+
+    def stream(self, subscription, heartbeat=15, retry_ms=3000):
+        """Return the SSE body for subscription (see EventStream)"""
+        return EventStream(self, subscription, heartbeat, retry_ms)
+
+    def stream_async(self, subscription, heartbeat=15, retry_ms=3000):
+        """stream() for an asyncio server (see serve.py and AsyncEventStream)"""
+        return AsyncEventStream(self, subscription, heartbeat, retry_ms)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "topics": len(self._topics),
+                "published": self.published,
+                "dropped": sum(subscription.dropped for subscription in self._subscribers)
+            }
+
+
+class EventStream:
+    """
+    The SSE body of one subscription, yielded until the client goes away.
+    A comment line is sent every heartbeat seconds of silence so proxies
+    keep the connection open and a dead client is noticed on the next write.
+
+    Closing the stream (WSGI servers close every response body) unsubscribes,
+    whether or not it was ever iterated: a HEAD request, or a client gone
+    before the first chunk, must not leave a subscriber behind.
+    """
+
+    def __init__(self, bus, subscription, heartbeat, retry_ms):
+        self.bus = bus
+        self.subscription = subscription
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+        self._started = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._started:
+            self._started = True
+            return b'retry: %d\n\n' % self.retry_ms
+        if self.subscription.closed:
+            raise StopIteration
+        frames = self.subscription.next(self.heartbeat)
+        return b''.join(frames) if frames else KEEPALIVE
+
+    def close(self):
+        self.bus.unsubscribe(self.subscription)
+
+
+class AsyncEventStream(EventStream):
+    """
+    EventStream for an asyncio server: waiting for events happens on the
+    event loop, so an open stream holds no thread
+    """
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._started:
+            self._started = True
+            return b'retry: %d\n\n' % self.retry_ms
+        if self.subscription.closed:
+            raise StopAsyncIteration
+        frames = await self.subscription.next_async(self.heartbeat)
+        return b''.join(frames) if frames else KEEPALIVE
+
+    async def aclose(self):
+        self.close()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class OrderHistoryCache:
+    """
+    Encoded order-history responses, one per user, in least-recently-used order.
+
+    A miss loads the user's orders through the per-user index and encodes
+    them once; later dashboard loads send the cached bytes until that user
+    places an order or one of their orders changes, which drops just their
+    entry. A fill that raced with an invalidation is not stored, so a stale
+    body can never be cached.
+
+    With a shared storage backend another worker may change the orders, so
+    max_age bounds how long an entry is trusted.
+    """
+
+    def __init__(self, load, encode, capacity=10000, max_age=None):
+        self._load = load
+        self._encode = encode
+        self.capacity = capacity
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        """Return the encoded order history of user_id"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and (self.max_age is None or now - entry[1] <= self.max_age):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        body = self._encode(self._load(user_id))
+        with self._lock:
+            if self._generation == generation:
+                self._entries[user_id] = (body, now)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return body
+
+    def invalidate(self, user_id):
+        """Forget the cached history of user_id after one of their orders changed"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "invalidations": self.invalidations
+            }
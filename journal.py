@@ -0,0 +1,325 @@
+"""
+Write-ahead journal for the in-memory store
+
+Every table mutation is appended to a journal segment as a length- and
+CRC-framed pickle; a batch from Table.apply() is a single frame, so it is
+replayed whole or not at all. A single writer thread flushes whatever has
+accumulated with one write and one fsync (group commit), so a burst of
+concurrent requests shares a disk sync instead of paying for one each.
+Callers that need their writes durable before replying wait for the writer
+with wait(); nothing is written to disk on the request thread.
+
+Snapshots bound replay time: the journal rotates to a new segment, every
+table is written out in chunks to snapshot.bin and older segments are
+deleted. The snapshot is taken while writes continue, so it may already
+contain some changes from the new segment; replay is idempotent (inserts
+are puts, updates set fields, deletes ignore missing rows), so applying
+the segment on top converges to the same state.
+
+At startup the snapshot is memory-mapped and decoded chunk by chunk, then
+the remaining segments are replayed. A torn frame at the end of the last
+segment (a crash mid-write) ends replay there and is truncated away.
+"""
+import fcntl
+import mmap
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+
+_FRAME = struct.Struct('<II')  # payload length, crc32
+_MAGIC = b'GSNAP1\n'
+SNAPSHOT = 'snapshot.bin'
+SNAPSHOT_CHUNK = 1000
+
+
+def _frame(entry):
+    payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(data, start=0):
+    """Yield (entry, end_offset) for each intact frame; stops at the first torn one"""
+    offset = start
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        begin = offset + _FRAME.size
+        payload = data[begin:begin + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        offset = begin + length
+        yield pickle.loads(payload), offset
+
+
+def _mapped(path):
+    """Return a read-only mapping of path (empty bytes for an empty file) and the open file"""
+    f = open(path, 'rb')
+    if os.fstat(f.fileno()).st_size == 0:
+        return b'', f
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f
+
+
+class Journal:
+    """
+    Append-only journal of store mutations in a directory.
+
+    commit_delay holds each group commit open briefly so more writers can
+    join it; snapshot_every starts a background snapshot once that many
+    entries have been journaled since the last one.
+    """
+
+    def __init__(self, directory, commit_delay=0.002, snapshot_every=100000):
+        self.directory = directory
+        self.commit_delay = commit_delay
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        # Two processes appending to one journal would interleave their histories
+        self._lockfile = open(os.path.join(directory, 'LOCK'), 'a')
+        try:
+            fcntl.flock(self._lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lockfile.close()
+            raise RuntimeError(f"Journal {directory} is in use by another process") from None
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._has_data = threading.Condition(self._lock)
+        self._synced = threading.Condition(self._lock)
+        self._snapshot_lock = threading.Lock()
+        self._local = threading.local()
+        self._buffer = []
+        self._lsn = 0
+        self._durable = 0
+        self._since_snapshot = 0
+        self._closed = False
+        self._tables = {}
+        self.sequences = {}
+        self.commits = 0
+        self.snapshots = 0
+        self.state, self._segment = self._recover()
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._writer = threading.Thread(target=self._run, daemon=True, name='journal-writer')
+        self._writer.start()
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'journal.{number:08d}.log')
+
+    def _segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r'journal\.(\d+)\.log', name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    # Recovery
+
+    def _recover(self):
+        """Load the snapshot and replay later segments; returns ({table: {pk: row}}, next segment)"""
+        state = {}
+        first = 0
+        path = os.path.join(self.directory, SNAPSHOT)
+        if os.path.exists(path):
+            data, f = _mapped(path)
+            try:
+                if data[:len(_MAGIC)] != _MAGIC:
+                    raise ValueError(f"{path} is not a store snapshot")
+                for entry, _ in _read_frames(data, len(_MAGIC)):
+                    kind = entry[0]
+                    if kind == 'header':
+                        first = entry[1]
+                    elif kind == 'rows':
+                        _, table, key, rows = entry
+                        target = state.setdefault(table, {})
+                        for row in rows:
+                            target[row[key]] = row
+                    elif kind == 'seq':
+                        self.sequences[entry[1]] = entry[2]
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+                f.close()
+
+        segments = [n for n in self._segments() if n >= first]
+        for number in segments:
+            segment_path = self._segment_path(number)
+            data, f = _mapped(segment_path)
+            end = 0
+            try:
+                for entry, end in _read_frames(data):
+                    self._apply(state, entry)
+                torn = end < len(data)
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+                f.close()
+            if torn:
+                if number != segments[-1]:
+                    raise ValueError(f"{segment_path} is corrupt at byte {end}")
+                os.truncate(segment_path, end)
+            if end == 0:
+                # Nothing was ever committed to it (e.g. a read-only run)
+                os.remove(segment_path)
+        # New writes always start a fresh segment
+        return state, (segments[-1] + 1 if segments else first)
+
+    def _apply(self, state, entry):
+        kind = entry[0]
+        if kind == 'put':
+            _, table, pk, record = entry
+            state.setdefault(table, {})[pk] = record
+        elif kind == 'set':
+            _, table, pk, changes = entry
+            record = state.get(table, {}).get(pk)
+            if record is not None:
+                record.update(changes)
+        elif kind == 'del':
+            _, table, pk = entry
+            state.get(table, {}).pop(pk, None)
+        elif kind == 'batch':
+            _, table, entries = entry
+            for sub in entries:
+                self._apply(state, (sub[0], table) + tuple(sub[1:]))
+        elif kind == 'seq':
+            _, name, value = entry
+            self.sequences[name] = max(value, self.sequences.get(name, 0))
+
+    def recovered(self, table):
+        """Return the recovered rows of table (None if it was never journaled), once"""
+        rows = self.state.pop(table, None)
+        return None if rows is None else list(rows.values())
+
+    # Writing
+
+    def attach(self, table):
+        """Include table in snapshots"""
+        self._tables[table.name] = table
+
+    def append(self, *entry):
+        """Queue one mutation; it reaches disk with the next group commit"""
+        frame = _frame(entry)
+        with self._lock:
+            self._buffer.append(frame)
+            self._lsn += 1
+            self._local.lsn = self._lsn
+            self._has_data.notify()
+
+    def lease(self, name, value):
+        """Record that sequence name may hand out values up to value"""
+        self.sequences[name] = value
+        self.append('seq', name, value)
+
+    def wait(self):
+        """Block until everything this thread appended is on disk"""
+        lsn = getattr(self._local, 'lsn', 0)
+        if not lsn:
+            return
+        with self._lock:
+            while self._durable < lsn and not self._closed:
+                self._synced.wait()
+        self._local.lsn = 0
+
+    def _flush(self):
+        # Callers hold _io_lock, so batches reach the file in append order
+        with self._lock:
+            frames, self._buffer = self._buffer, []
+            lsn = self._lsn
+        if frames:
+            self._file.write(b''.join(frames))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        with self._lock:
+            self._durable = lsn
+            self._since_snapshot += len(frames)
+            self.commits += 1 if frames else 0
+            self._synced.notify_all()
+        return len(frames)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._buffer and not self._closed:
+                    self._has_data.wait()
+                if self._closed and not self._buffer:
+                    return
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self._io_lock:
+                self._flush()
+            if (self.snapshot_every and self._since_snapshot >= self.snapshot_every
+                    and not self._snapshot_lock.locked()):
+                threading.Thread(target=self.snapshot, daemon=True, name='journal-snapshot').start()
+
+    # Snapshots
+
+    def snapshot(self):
+        """Write every attached table to a new snapshot and drop the segments it covers"""
+        if not self._snapshot_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._io_lock:
+                self._flush()
+                self._file.close()
+                self._segment += 1
+                first = self._segment
+                self._file = open(self._segment_path(first), 'ab')
+                with self._lock:
+                    self._since_snapshot = 0
+
+            path = os.path.join(self.directory, SNAPSHOT)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(_MAGIC)
+                f.write(_frame(('header', first)))
+                for name, value in list(self.sequences.items()):
+                    f.write(_frame(('seq', name, value)))
+                for table in list(self._tables.values()):
+                    # An empty frame still records that the table exists, so
+                    # an emptied table is not re-seeded on restart
+                    f.write(_frame(('rows', table.name, table.key, [])))
+                    for rows in table.dump_chunks(SNAPSHOT_CHUNK):
+                        f.write(_frame(('rows', table.name, table.key, rows)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            _fsync_directory(self.directory)
+
+            for number in self._segments():
+                if number < first:
+                    os.remove(self._segment_path(number))
+            self.snapshots += 1
+            return True
+        finally:
+            self._snapshot_lock.release()
+
+    def close(self):
+        """Flush what is queued and stop the writer"""
+        with self._lock:
+            self._closed = True
+            self._has_data.notify()
+        self._writer.join()
+        with self._io_lock:
+            self._flush()
+            self._file.close()
+        self._lockfile.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segment": self._segment,
+                "appended": self._lsn,
+                "durable": self._durable,
+                "queued": len(self._buffer),
+                "group_commits": self.commits,
+                "since_snapshot": self._since_snapshot,
+                "snapshots": self.snapshots
+            }
+
+
+def _fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,97 @@
+"""
+JSON encoding for API responses
+
+FastJSONProvider replaces Flask's default provider. It encodes with orjson
+when it is installed and falls back to the stdlib json module otherwise
+(and for the few values orjson refuses, such as integers beyond 64 bits).
+Compact slotted records (records.py) are encoded straight from their
+public fields, so handlers can return a user or order without copying it
+into a dict first, and hidden fields such as password hashes never leave
+the server.
+
+compress_responses() gzips (or brotli-compresses) JSON bodies above a size
+threshold for clients that accept it.
+"""
+import gzip
+import json
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider, _default
+
+from compression import brotli
+import records
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is the fallback
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider with an orjson fast path and direct record encoding"""
+
+    default = staticmethod(records.json_default(_default))
+
+    def dumps_bytes(self, obj, indent=False):
+        """Serialise obj to UTF-8 JSON bytes, compact unless indent is set"""
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except orjson.JSONEncodeError:
+                pass  # e.g. integers beyond 64 bits; the stdlib copes
+        layout = {'indent': 2} if indent else {'separators': (',', ':')}
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii,
+                          sort_keys=self.sort_keys, **layout).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        # Explicit json.dumps options (indent, separators...) take the stdlib path
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass  # the stdlib also accepts NaN and Infinity; let it decide
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+def compress_responses(app, min_size=1024, level=6, mimetypes=('application/json',)):
+    """Compress responses of the given types once their body reaches min_size bytes"""
+    @app.after_request
+    def compress(response):
+        if (response.mimetype not in mimetypes or response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        if brotli is not None and request.accept_encodings['br']:
+            encoding, data = 'br', brotli.compress(body, quality=min(level, 11))
+        elif request.accept_encodings['gzip']:
+            encoding, data = 'gzip', gzip.compress(body, compresslevel=level, mtime=0)
+        else:
+            return response
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        # A strong validator must differ between encodings of one resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{encoding}")
+        return response
+
+    return compress
@@ -0,0 +1,225 @@
+import atexit
+import queue
+import smtplib
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+
+
+class ConsoleTransport:
+    """Transport that prints messages instead of sending them (the demo default)"""
+
+    def open(self):
+        pass
+
+    def send(self, sender, to_email, message):
+        print(f"EMAIL TO: {to_email}")
+        print(f"SUBJECT: {message['Subject']}")
+        print(f"BODY: {message.get_payload(decode=True).decode('utf-8', 'replace')}")
+        print("-" * 50)
+
+    def close(self):
+        pass
+
+
+class SMTPTransport:
+    """
+    Transport holding one SMTP connection open across messages.
+
+    The TLS handshake and login happen once per connection rather than per
+    email; a dropped connection is reopened on the next send.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._smtp = None
+
+    def open(self):
+        if self._smtp is not None:
+            return
+        smtp = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'], timeout=30)
+        if self.config.get('use_tls', True):
+            smtp.starttls()
+        if self.config.get('password'):
+            smtp.login(self.config['email'], self.config['password'])
+        self._smtp = smtp
+
+    def send(self, sender, to_email, message):
+        self.open()
+        try:
+            self._smtp.sendmail(sender, [to_email], message.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+
+class Mailer:
+    """
+    Background email delivery.
+
+    send() only puts the message on a bounded queue, so request handlers never
+    wait on the mail server. Worker threads each own a transport (one pooled
+    SMTP connection per worker, closed after idle_timeout seconds without
+    mail), drain up to batch_size messages per wake-up and retry failures
+    with exponential backoff.
+    """
+
+    def __init__(self, sender, transport_factory=ConsoleTransport, workers=2,
+                 queue_size=1000, batch_size=20, max_retries=3, backoff=1.0, idle_timeout=30):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = [
+            threading.Thread(target=self._run, args=(transport_factory(),), daemon=True, name=f"mailer-{i}")
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+
+    def send(self, to_email, subject, body):
+        """Queue an email for delivery; raises queue.Full if the backlog is at capacity"""
+        message = MIMEText(body)
+        message['From'] = self.sender
+        message['To'] = to_email
+        message['Subject'] = subject
+        self._queue.put_nowait((to_email, message))
+        return True
+
+    def _run(self, transport):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                # Idle long enough that the server would drop us anyway
+                transport.close()
+                continue
+            # A None tells one worker to stop, so never drain past it
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is None:
+                    transport.close()
+                    self._queue.task_done()
+                    return
+                self._deliver(transport, *item)
+                self._queue.task_done()
+
+    def _deliver(self, transport, to_email, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                transport.send(self.sender, to_email, message)
+                self.sent += 1
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                transport.close()
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    print(f"Email sending failed: {e}")
+                    return
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def pending(self):
+        """Number of emails waiting in the queue"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every queued email has been handled"""
+        self._queue.join()
+
+    def close(self):
+        """Deliver what is queued, then stop the workers"""
+        if not any(worker.is_alive() for worker in self._workers):
+            return
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=30)
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 localhost sink ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply("250 localhost")
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(' <>'), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip(' <>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                self.server.messages.append({
+                    'from': sender,
+                    'to': recipients,
+                    'data': b"".join(lines).decode('utf-8', 'replace')
+                })
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server that records every message it receives.
+
+    Point an SMTPTransport at it (use_tls False, no password) to exercise the
+    real delivery path without a mail provider.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _SinkHandler)
+        self.messages = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
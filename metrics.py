@@ -0,0 +1,188 @@
+import bisect
+import threading
+import time
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    """Counters written by exactly one thread, so updating them needs no lock"""
+
+    __slots__ = ('requests', 'errors', 'latency', 'in_flight')
+
+    def __init__(self):
+        self.requests = {}
+        self.errors = {}
+        self.latency = {}
+        self.in_flight = 0
+
+
+class RequestMetrics:
+    """
+    Per-route request metrics in the Prometheus text format.
+
+    Each thread records into its own shard, so the request path never takes
+    a lock; /metrics sums the shards when scraped. Histograms use fixed
+    bucket bounds, so an observation is one bisect and two increments.
+    Shards of finished threads are folded into a retired total so
+    thread-per-request servers do not grow the shard list without bound.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+        self._gauges = []
+        self._gauge_groups = []
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) % 64 == 0:
+                    self._retire()
+            return shard
+
+    def _retire(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge(self._retired, shard, len(self.buckets))
+        self._shards = live
+
+    def gauge(self, name, help_text, fn):
+        """Report fn() as a gauge on every scrape"""
+        self._gauges.append((name, help_text, fn))
+
+    def gauges(self, prefix, help_text, fn):
+        """
+        Report every number in the dict fn() returns (a component's stats())
+        as a gauge named prefix_<key>; fn is called once per scrape
+        """
+        self._gauge_groups.append((prefix, help_text, fn))
+
+    def start(self):
+        self._shard().in_flight += 1
+
+    def finish(self):
+        self._shard().in_flight -= 1
+
+    def observe(self, route, method, status, seconds):
+        shard = self._shard()
+        key = (route, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        if status >= 500:
+            shard.errors[(route, method)] = shard.errors.get((route, method), 0) + 1
+        histogram = shard.latency.get((route, method))
+        if histogram is None:
+            # One slot per bucket plus +Inf, then the sum
+            histogram = shard.latency[(route, method)] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def _totals(self):
+        total = _Shard()
+        with self._lock:
+            self._retire()
+            _merge(total, self._retired, len(self.buckets))
+            for _, shard in self._shards:
+                _merge(total, shard, len(self.buckets))
+        return total
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        total = self._totals()
+        lines = [
+            "# HELP http_requests_total Requests handled, by route, method and status.",
+            "# TYPE http_requests_total counter"
+        ]
+        for (route, method, status), count in sorted(total.requests.items()):
+            lines.append(f'http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_errors_total Requests that ended in a 5xx, by route and method.",
+            "# TYPE http_request_errors_total counter"
+        ]
+        for (route, method), count in sorted(total.errors.items()):
+            lines.append(f'http_request_errors_total{{route="{route}",method="{method}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency, by route and method.",
+            "# TYPE http_request_duration_seconds histogram"
+        ]
+        for (route, method), histogram in sorted(total.latency.items()):
+            labels = f'route="{route}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram[-1]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {total.in_flight}"
+        ]
+        for name, help_text, fn in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {fn()}"]
+        for prefix, help_text, fn in self._gauge_groups:
+            for key, value in fn().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"{prefix}_{key}"
+                    lines += [f"# HELP {name} {help_text}: {key.replace('_', ' ')}.", f"# TYPE {name} gauge",
+                              f"{name} {value}"]
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app, path='/metrics'):
+        """Time every request of app and serve the metrics at path"""
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+            self.start()
+
+        @app.after_request
+        def record(response):
+            self._record(response.status_code)
+            return response
+
+        @app.teardown_request
+        def stop_timer(exc):
+            if 'metrics_started' not in g:
+                return
+            # after_request is skipped when the view raised
+            if not g.get('metrics_recorded'):
+                self._record(500)
+            self.finish()
+
+        @app.route(path)
+        def metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def _record(self, status):
+        if 'metrics_started' not in g or g.get('metrics_recorded'):
+            return
+        g.metrics_recorded = True
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        self.observe(route, request.method, status, time.perf_counter() - g.metrics_started)
+
+
+def _merge(into, shard, bucket_count):
+    for key, count in list(shard.requests.items()):
+        into.requests[key] = into.requests.get(key, 0) + count
+    for key, count in list(shard.errors.items()):
+        into.errors[key] = into.errors.get(key, 0) + count
+    for key, histogram in list(shard.latency.items()):
+        target = into.latency.setdefault(key, [0] * (bucket_count + 1) + [0.0])
+        for i, value in enumerate(histogram):
+            target[i] += value
+    into.in_flight += shard.in_flight
@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HasherBusy(Exception):
+    """Raised when every hashing slot is taken and none frees up in time"""
+
+
+def hash_password(password, n=2 ** 14, r=8, p=1):
+    """Hash a password with scrypt; the parameters are stored alongside the hash"""
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=32)
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def check_password(password, stored):
+    """
+    Return (matches, params) for a stored hash.
+
+    params is the (n, r, p) the hash was made with, or None for a legacy
+    unsalted SHA-256 hex digest.
+    """
+    if stored.startswith('scrypt$'):
+        _, n, r, p, salt, digest = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p, dklen=32)
+        return hmac.compare_digest(candidate.hex(), digest), (n, r, p)
+    candidate = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(candidate, stored), None
+
+
+class PasswordHasher:
+    """
+    Password hashing off the request path.
+
+    scrypt releases the GIL, so hashes run in parallel on a small thread pool.
+    At most max_pending hashes may be queued or running; past that a caller
+    waits up to `wait` seconds for a slot and then gets HasherBusy, so a login
+    storm is shed instead of tying up every request thread. Latency of each
+    hash is recorded for monitoring.
+    """
+
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=4, max_pending=32, wait=2.0):
+        self.params = (n, r, p)
+        self.wait = wait
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hasher')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._dummy_hash = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy("Password hashing is saturated")
+        started = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            elapsed = time.perf_counter() - started
+            self._slots.release()
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def hash(self, password):
+        """Hash a password with the current cost"""
+        n, r, p = self.params
+        return self._run(hash_password, password, n, r, p)
+
+    def verify(self, password, stored):
+        """
+        Check a password against its stored hash.
+
+        Returns (matches, new_hash). new_hash is set when the password matched
+        but the stored hash is legacy SHA-256 or uses an outdated cost, so the
+        caller can save the upgraded hash.
+        """
+        matches, params = self._run(check_password, password, stored)
+        if matches and params != self.params:
+            return True, self.hash(password)
+        return matches, None
+
+    def reject(self, password):
+        """
+        Check a password for an account that does not exist. Runs the same
+        scrypt work as verify() against a fixed hash and always returns
+        (False, None), so response times do not reveal which accounts exist.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash('')
+        self._run(check_password, password, self._dummy_hash)
+        return False, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "avg_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0,
+                "max_ms": round(self.max_seconds * 1000, 2)
+            }
@@ -0,0 +1,108 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from store import modify_or_insert
+
+
+class RateLimited(Exception):
+    """Raised when a key has used up its attempts; retry_after is in whole seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket per key: up to `burst` attempts at once, refilled at
+    burst/per attempts a second.
+
+    Each key costs one (tokens, timestamp) pair. In process the buckets live
+    in an LRU of at most `capacity` keys, so memory stays bounded however
+    many addresses or emails an attacker cycles through; a key pushed out is
+    simply forgotten. Given a storage table the buckets live there instead,
+    updated atomically with Table.modify(), so every worker sharing the
+    store sees the same counts; rows whose bucket has refilled are purged
+    every purge_every checks.
+    """
+
+    def __init__(self, burst, per, capacity=100000, table=None, purge_every=1000):
+        self.burst = burst
+        self.per = per
+        self.rate = burst / per
+        self.capacity = capacity
+        self.table = table
+        self.purge_every = purge_every
+        self.enabled = True
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._checks = 0
+
+    def _take(self, tokens, stamp, now):
+        """Return (tokens left, seconds until the next token) after one attempt"""
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / self.rate
+
+    def check(self, key):
+        """Count one attempt for key, raising RateLimited once the bucket is empty"""
+        if not self.enabled:
+            return
+        now = time.time()
+        wait = self._check_shared(key, now) if self.table is not None else self._check_local(key, now)
+        if wait:
+            with self._lock:
+                self.limited += 1
+            raise RateLimited(max(1, math.ceil(wait)))
+
+    def _check_local(self, key, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.capacity:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            tokens, wait = self._take(bucket[0], bucket[1], now)
+            # A refused attempt does not push the refill back
+            if not wait:
+                bucket[0], bucket[1] = tokens, now
+            return wait
+
+    def _check_shared(self, key, now):
+        def take(record):
+            tokens, wait = self._take(record['tokens'], record['stamp'], now)
+            return ({} if wait else {'tokens': tokens, 'stamp': now}), wait
+
+        def create():
+            return {'key': key, 'tokens': self.burst - 1, 'stamp': now}, 0
+
+        wait = modify_or_insert(self.table, key, take, create)
+
+        with self._lock:
+            self._checks += 1
+            purge = self._checks % self.purge_every == 0
+        if purge:
+            self.purge(now)
+        return wait
+
+    def purge(self, now=None):
+        """Drop shared buckets that have refilled completely; returns how many"""
+        if self.table is None:
+            return 0
+        cutoff = (now or time.time()) - self.per
+        stale = [record['key'] for record in self.table.scan() if record['stamp'] < cutoff]
+        for key in stale:
+            self.table.delete(key)
+        return len(stale)
+
+    def __len__(self):
+        return len(self.table) if self.table is not None else len(self._buckets)
+
+    def stats(self):
+        return {"keys": len(self), "capacity": self.capacity, "limited": self.limited}
@@ -0,0 +1,188 @@
+"""
+Compact entity records
+
+Users, products, orders and order items are held in memory as slotted
+objects instead of dicts: a fixed set of attribute slots costs a fraction
+of a per-instance hash table, order items are stored as a tuple, and
+repeated strings (statuses, dates, product names) are interned so millions
+of orders share one copy of each.
+
+Records still read like the dicts they replace - record['id'],
+record.get('stock'), dict(record), record.update(changes) - so code written
+against plain dict records keeps working; order.items is the items tuple,
+not a dict method. Fields outside a type's schema go in a small overflow
+dict that only exists when needed.
+"""
+import sys
+
+
+class Record:
+    """Base class; subclasses list their schema in FIELDS"""
+
+    __slots__ = ('_extra',)
+
+    FIELDS = ()
+    # fields holding a sequence of records
+    NESTED = ()
+    # field -> function applied to values on the way in
+    CONVERT = {}
+    # string fields whose values repeat across many records
+    INTERN = ()
+    # fields kept out of API responses (but not out of storage)
+    HIDDEN = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+        for field in cls.INTERN:
+            cls.CONVERT = dict(cls.CONVERT, **{field: _intern})
+        # Generated once per type, so encoding a record is one dict display
+        # with no reflection over the schema. Keys come out sorted, so the
+        # encoder never needs sort_keys to give stable output.
+        cls.to_dict = _generate(cls, cls.FIELDS, 'to_dict')
+        if cls.HIDDEN:
+            cls.public = _generate(cls, [f for f in cls.FIELDS if f not in cls.HIDDEN], 'public')
+        else:
+            cls.public = cls.to_dict
+
+    def __init__(self, data):
+        convert = self.CONVERT
+        for field in self.FIELDS:
+            value = data.get(field)
+            if field in convert and value is not None:
+                value = convert[field](value)
+            setattr(self, field, value)
+        extra = {key: value for key, value in data.items() if key not in self._field_set}
+        self._extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict (or return data as is if it already is one)"""
+        return data if isinstance(data, cls) else cls(data)
+
+    def to_dict(self):
+        """Return every field as a plain dict, as stored"""
+        raise NotImplementedError
+
+    def public(self):
+        """Return the plain dict sent to clients: to_dict() without the HIDDEN fields"""
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key)
+        if self._extra:
+            return self._extra.get(key, default)
+        return default
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            if key in self.CONVERT and value is not None:
+                value = self.CONVERT[key](value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in self._field_set or bool(self._extra and key in self._extra)
+
+    def keys(self):
+        return list(self.FIELDS) + list(self._extra or ())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.FIELDS) + len(self._extra or ())
+
+    def update(self, changes):
+        for key, value in changes.items():
+            self[key] = value
+
+    def copy(self):
+        """Return a plain dict copy, like dict.copy() on the old records"""
+        return self.to_dict()
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _generate(cls, fields, name):
+    entries = ', '.join(
+        f"{field!r}: [item.{name}() for item in self.{field}]" if field in cls.NESTED
+        else f"{field!r}: self.{field}"
+        for field in sorted(fields)
+    )
+    hidden = repr(set(cls.HIDDEN)) if name == 'public' and cls.HIDDEN else 'set()'
+    namespace = {}
+    exec(
+        f"def {name}(self):\n"
+        f"    data = {{{entries}}}\n"
+        f"    if self._extra:\n"
+        f"        data.update((k, v) for k, v in self._extra.items() if k not in {hidden})\n"
+        f"        return dict(sorted(data.items()))\n"
+        f"    return data\n",
+        namespace
+    )
+    return namespace[name]
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class OrderItem(Record):
+    __slots__ = ('product_id', 'name', 'quantity', 'price')
+    FIELDS = __slots__
+    INTERN = ('name',)
+
+
+def _order_items(items):
+    return tuple(OrderItem.from_dict(item) for item in items)
+
+
+class Order(Record):
+    __slots__ = ('id', 'order_number', 'user_id', 'items', 'total', 'status', 'date', 'address')
+    FIELDS = __slots__
+    NESTED = ('items',)
+    CONVERT = {'items': _order_items}
+    INTERN = ('status', 'date', 'address')
+
+
+class Product(Record):
+    __slots__ = ('id', 'name', 'description', 'price', 'category', 'image', 'in_stock')
+    FIELDS = __slots__
+    INTERN = ('category',)
+
+
+class User(Record):
+    __slots__ = ('id', 'first_name', 'last_name', 'email', 'password', 'phone', 'address', 'dob',
+                 'role', 'verified')
+    FIELDS = __slots__
+    INTERN = ('role',)
+    HIDDEN = ('password',)
+
+
+def json_default(fallback):
+    """Wrap a JSON default hook so records encode as their public dicts"""
+    def default(value):
+        if isinstance(value, Record):
+            return value.public()
+        return fallback(value)
+    return default
@@ -127,8 +127,26 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Cart operations are queued and sent together in one batch request,
+    // so rapid clicks cost a single round-trip
+    let pendingCartOps = [];
+    let cartFlushTimer = null;
+
     // Add item to cart
-    async function addToCart(item) {
+    function addToCart(item) {
+        pendingCartOps.push({ action: 'add', item: item });
+        clearTimeout(cartFlushTimer);
+        cartFlushTimer = setTimeout(flushCart, 300);
+    }
+
+    // Send queued cart operations
+    async function flushCart() {
+        clearTimeout(cartFlushTimer);
+        if (pendingCartOps.length === 0) return;
+        
+        const ops = pendingCartOps;
+        pendingCartOps = [];
+        
         try {
             const response = await fetch('/api/cart', {
                 method: 'POST',
@@ -136,8 +154,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
-                    action: 'add',
-                    item: item
+                    action: 'batch',
+                    ops: ops
                 })
             });
             
@@ -179,6 +197,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function placeOrder() {
         // Get cart items
         try {
+            await flushCart();
             const cartResponse = await fetch('/api/cart');
             const cartData = await cartResponse.json();
             
@@ -0,0 +1,555 @@
+"""
+Standalone server for the Gupta's Sweets app
+
+Usage:
+    python serve.py [--bind 127.0.0.1:8000] [--workers 1] [--threads 16]
+                    [--mode sync|async] [--timeout 5] [--access-log]
+
+In production, run the app under a standard WSGI server and put it behind
+a reverse proxy, for example:
+
+    gunicorn -w 4 --threads 16 --bind 127.0.0.1:8000 app:app
+    waitress-serve --threads 16 --listen 127.0.0.1:8000 app:app
+
+Importing app.py builds the front end when it is missing or stale (see
+assets.py), so these need no separate build step; run `flask build-assets`
+beforehand when the checkout is read-only at runtime. Several workers need a
+store they can share (STORE_URL=sqlite:///path/to/guptas.db); an in-memory
+store is per process. Behind a reverse proxy set TRUSTED_PROXIES to the
+number of proxies in front of the app, so rate limits see client
+addresses, not the proxy's.
+
+This module is a fallback for hosts where no such server is installed: it
+needs only the standard library and werkzeug. It runs app.app on a socket
+bound once by a supervisor process, which builds the front end, then forks
+--workers worker processes and restarts any that die. Each worker imports
+the app only after the fork, so it gets its own store connections, mailer
+and hasher threads.
+
+--mode picks how a worker handles connections:
+
+  sync   werkzeug's request handler on a fixed pool of --threads threads,
+         one connection per request. A thread is held for the whole
+         exchange: while it reads a slow request, writes to a slow client or
+         feeds an open event stream, it serves nobody else.
+
+  async  a small asyncio HTTP/1.1 front end written here. Reading requests,
+         keep-alive waits and writing responses happen on the event loop,
+         and only the Flask view itself runs on one of the --threads pool
+         threads. Event streams (/api/events) are fed from the loop as well
+         (see EventBus.stream_async), so a dashboard left open holds no
+         thread. Its request parser is far less exercised than a standard
+         server's, so keep it behind a reverse proxy that normalises
+         requests.
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import unquote_to_bytes
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import assets
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODES = ('sync', 'async')
+MAX_HEADER = 64 * 1024
+MAX_BODY = 16 * 1024 * 1024
+
+log = logging.getLogger('serve')
+
+
+def parse_bind(bind):
+    """Split host:port (or [v6-host]:port, or :port for every interface)"""
+    host, _, port = bind.rpartition(':')
+    host = host.strip('[]') or '0.0.0.0'
+    try:
+        return host, int(port)
+    except ValueError:
+        raise ValueError(f"Invalid bind address {bind!r} (expected host:port)") from None
+
+
+def listen(host, port, backlog=2048):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    return socket.create_server((host, port), family=family, backlog=backlog)
+
+
+def build_assets():
+    """
+    Build the front end if a source changed since the last build. Runs in
+    the supervisor before any worker imports the app, which reads the
+    manifest and serves the built templates and static files.
+    """
+    built = assets.ensure_built(ROOT, os.path.join(ROOT, 'static'), os.path.join(ROOT, 'templates'))
+    if built is not None:
+        log.info("Built %d front-end assets into static/", len(built))
+
+
+def load_app():
+    # Imported here, never in the supervisor: the app starts threads and
+    # opens the store, and neither survives a fork
+    from app import app
+    return app
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    access_log = False
+
+    def log_request(self, *args, **kwargs):
+        if self.access_log:
+            super().log_request(*args, **kwargs)
+
+    def log_error(self, format, *args):
+        # A client going quiet for --timeout seconds is routine, not an error
+        if not format.startswith("Request timed out"):
+            super().log_error(format, *args)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    werkzeug's WSGI server with connections handled by a fixed pool of
+    threads. Like werkzeug's threaded server the threads are daemons, so an
+    event stream still open at shutdown does not keep the process alive.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None, handler=PooledRequestHandler):
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.connections = queue.SimpleQueue()
+        self.threads = [threading.Thread(target=self._work, daemon=True, name=f"http-{i}") for i in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def process_request(self, request, client_address):
+        self.connections.put((request, client_address))
+
+    def _work(self):
+        while True:
+            request, client_address = self.connections.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+class BadRequest(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class AsyncWSGIServer:
+    """
+    Minimal asyncio HTTP/1.1 server running a WSGI app on a thread pool.
+
+    The loop parses requests (Content-Length or chunked bodies, keep-alive,
+    Expect: 100-continue) and writes responses; the app is called on the
+    pool with the whole body already read, so a view never waits on the
+    network. A response with a Content-Length is produced in that same
+    pool call. Other bodies are streams: one the app marks as iterable on
+    the loop (an async iterator, see the 'serve.async' environ key) is
+    iterated there, anything else is pulled from the pool chunk by chunk.
+    """
+
+    def __init__(self, app, threads, keep_alive=5, max_body=MAX_BODY, access_log=False, multiprocess=False):
+        self.app = app
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='app')
+        self.keep_alive = keep_alive
+        self.max_body = max_body
+        self.access_log = access_log
+        self.multiprocess = multiprocess
+
+    async def serve(self, sock, stop_signals=(signal.SIGTERM,)):
+        """Serve connections on the listening socket sock until one of stop_signals arrives"""
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.connection, sock=sock, limit=MAX_HEADER)
+        stop = asyncio.Event()
+        for signum in stop_signals:
+            self.loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+
+    async def connection(self, reader, writer):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        local = writer.get_extra_info('sockname') or ('', 0)
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            # Streamed responses go out as a header write then one per chunk;
+            # don't let Nagle hold those back waiting for the client's ACK
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keep_alive)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.error(writer, BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE))
+                    break
+                try:
+                    environ = self.environ(head, peer, local)
+                    environ['wsgi.input'] = io.BytesIO(await self.body(environ, reader, writer))
+                except BadRequest as e:
+                    await self.error(writer, e)
+                    break
+                if not await self.respond(environ, writer):
+                    break
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # Shutting down; ending quietly keeps asyncio from logging every
+            # connection that was still open (event streams, idle keep-alives)
+            pass
+        finally:
+            writer.close()
+
+    def environ(self, head, peer, local):
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        try:
+            method, target, protocol = lines[0].split(' ')
+        except ValueError:
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed request line") from None
+        if protocol not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise BadRequest(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+        if '://' in target:
+            target = '/' + target.split('://', 1)[1].partition('/')[2]
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': target,
+            'RAW_URI': target,
+            'SERVER_PROTOCOL': protocol,
+            'SERVER_NAME': str(local[0]),
+            'SERVER_PORT': str(local[1]),
+            'REMOTE_ADDR': str(peer[0]),
+            'REMOTE_PORT': str(peer[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.multiprocess,
+            'wsgi.run_once': False,
+            'wsgi.input_terminated': True,
+            # Bodies with __aiter__ are iterated on this server's event loop
+            'serve.async': True,
+        }
+        for line in lines[1:]:
+            name, colon, value = line.partition(':')
+            if not colon or not name or name != name.strip():
+                raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed header")
+            if '_' in name:
+                continue  # would be indistinguishable from the dash form in the environ
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            value = value.strip()
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+        return environ
+
+    async def body(self, environ, reader, writer):
+        encoding = environ.get('HTTP_TRANSFER_ENCODING', '').lower()
+        if encoding not in ('', 'chunked'):
+            raise BadRequest(HTTPStatus.NOT_IMPLEMENTED, f"Unsupported Transfer-Encoding {encoding!r}")
+        chunked = encoding == 'chunked'
+        length = environ.get('CONTENT_LENGTH')
+        if chunked and length is not None:
+            # Proxies may disagree on which one frames the body; refuse both
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "Both Content-Length and Transfer-Encoding given")
+        if not chunked and not length:
+            return b''
+        if not chunked:
+            if not length.isdigit():
+                raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+            length = int(length)
+            if length > self.max_body:
+                raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        if environ.get('HTTP_EXPECT', '').lower() == '100-continue' and environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        try:
+            if not chunked:
+                return await reader.readexactly(length)
+            parts = []
+            size = 0
+            while True:
+                line = await reader.readuntil(b'\r\n')
+                chunk = int(line.split(b';', 1)[0], 16)
+                if chunk == 0:
+                    # Skip any trailer fields up to the closing blank line
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                size += chunk
+                if size > self.max_body:
+                    raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+                parts.append(await reader.readexactly(chunk))
+                await reader.readexactly(2)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "Incomplete or malformed body") from None
+        body = b''.join(parts)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_TRANSFER_ENCODING']
+        return body
+
+    def call_app(self, environ):
+        """
+        Run the app on a pool thread; returns (status, headers, body, stream)
+        where body is the whole response, or None if stream must be sent
+        """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+            return written.append
+
+        written = []
+        iterable = self.app(environ, start_response)
+        if hasattr(iterable, '__aiter__'):
+            return started[0], started[1], None, iterable
+        if not started or not any(name.lower() == 'content-length' for name, _ in started[1]):
+            chunks = iter(iterable)
+            first = next(chunks, b'')  # a generator app only starts the response here
+            return started[0], started[1], None, (iterable, chunks, written + [first])
+        try:
+            return started[0], started[1], b''.join(written + list(iterable)), None
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    async def respond(self, environ, writer):
+        """Run the app and send its response; returns whether to keep the connection"""
+        try:
+            status, headers, body, stream = await self.loop.run_in_executor(self.pool, self.call_app, environ)
+        except Exception:
+            log.exception("Error handling %s %s", environ['REQUEST_METHOD'], environ['PATH_INFO'])
+            await self.error(writer, BadRequest(HTTPStatus.INTERNAL_SERVER_ERROR))
+            return False
+
+        protocol = environ['SERVER_PROTOCOL']
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        keep_alive = connection != 'close' if protocol == 'HTTP/1.1' else connection == 'keep-alive'
+        names = {name.lower() for name, _ in headers}
+        code = int(status[:3])
+        bodiless = code < 200 or code in (204, 304)
+        send_body = environ['REQUEST_METHOD'] != 'HEAD' and not bodiless
+        chunked = False
+        if body is not None:
+            if 'content-length' not in names and not bodiless:
+                headers.append(('Content-Length', str(len(body))))
+        elif 'content-length' not in names and send_body:
+            chunked = protocol == 'HTTP/1.1'
+            if chunked:
+                headers.append(('Transfer-Encoding', 'chunked'))
+            else:
+                keep_alive = False  # the end of the body is the end of the connection
+        if 'date' not in names:
+            headers.append(('Date', formatdate(usegmt=True)))
+        if not keep_alive:
+            headers.append(('Connection', 'close'))
+        elif protocol == 'HTTP/1.0':
+            headers.append(('Connection', 'keep-alive'))
+
+        head = [f"HTTP/1.1 {status}\r\n"]
+        head.extend(f"{name}: {value}\r\n" for name, value in headers)
+        head.append('\r\n')
+        head = ''.join(head).encode('latin-1')
+        if body is not None:
+            # One write, so the response leaves in as few packets as possible
+            writer.write(head + body if send_body else head)
+            await writer.drain()
+        else:
+            keep_alive = await self.send_stream(stream, writer, head, chunked, send_body) and keep_alive
+        if self.access_log:
+            log.info('%s - - [%s] "%s %s %s" %s -', environ['REMOTE_ADDR'], time.strftime('%d/%b/%Y %H:%M:%S'),
+                     environ['REQUEST_METHOD'], environ['REQUEST_URI'], protocol, status.split(' ', 1)[0])
+        return keep_alive
+
+    async def send_stream(self, stream, writer, head, chunked, send_body):
+        """
+        Write the response head and a streamed body; returns False if the
+        client went away first. The head goes out with the first chunk, so
+        a short stream is one packet rather than two.
+        """
+        def frame(chunk):
+            return b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk
+
+        unsent = [head]
+        finished = False
+        try:
+            if not send_body:
+                writer.write(head)
+                if hasattr(stream, '__aiter__'):
+                    await stream.aclose()
+                elif hasattr(stream[0], 'close'):
+                    await self.loop.run_in_executor(self.pool, stream[0].close)
+                await writer.drain()
+                return True
+            if hasattr(stream, '__aiter__'):
+                try:
+                    async for chunk in stream:
+                        if chunk:
+                            unsent.append(frame(chunk))
+                            writer.write(b''.join(unsent))
+                            unsent.clear()
+                            await writer.drain()
+                finally:
+                    await stream.aclose()
+            else:
+                iterable, chunks, pending = stream
+                try:
+                    while True:
+                        unsent.extend(frame(chunk) for chunk in pending if chunk)
+                        if unsent:
+                            writer.write(b''.join(unsent))
+                            unsent.clear()
+                            await writer.drain()
+                        chunk = await self.loop.run_in_executor(self.pool, next, chunks, None)
+                        if chunk is None:
+                            break
+                        pending = [chunk]
+                finally:
+                    if hasattr(iterable, 'close'):
+                        await self.loop.run_in_executor(self.pool, iterable.close)
+            if chunked:
+                unsent.append(b'0\r\n\r\n')
+            writer.write(b''.join(unsent))
+            await writer.drain()
+            finished = True
+        except ConnectionError:
+            pass
+        return finished
+
+    async def error(self, writer, error):
+        body = f"{error.status.value} {error.status.phrase}: {error}\n".encode('utf-8')
+        writer.write(f"HTTP/1.1 {error.status.value} {error.status.phrase}\r\n"
+                     f"Content-Type: text/plain; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def run_worker(sock, args, multiprocess):
+    """Serve the app on the listening socket sock until stopped"""
+    app = load_app()
+    if args.mode == 'sync':
+        handler = type('Handler', (PooledRequestHandler,), {'timeout': args.timeout,
+                                                            'access_log': args.access_log})
+        host, port = sock.getsockname()[:2]
+        server = PooledWSGIServer(host, port, app, args.threads, fd=sock.fileno(), handler=handler)
+        server.multiprocess = multiprocess
+        # Workers share the socket: the one that loses a race to accept should
+        # go back to waiting, not block in accept()
+        server.socket.setblocking(False)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+    else:
+        server = AsyncWSGIServer(app, args.threads, keep_alive=args.timeout,
+                                 access_log=args.access_log, multiprocess=multiprocess)
+        asyncio.run(server.serve(sock))
+
+
+def supervise(sock, args):
+    """Fork args.workers workers on sock, replacing any that exit until told to stop"""
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # The supervisor forwards Ctrl-C as SIGTERM; exit cleanly on that
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+            run_worker(sock, args, multiprocess=True)
+            sys.exit(0)
+        workers[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+    log.info("Serving on %s with %d %s workers of %d threads", args.bind, args.workers, args.mode, args.threads)
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        log.warning("Worker %d exited with status %d; starting another", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < 1:
+            time.sleep(1)  # don't spin on a worker that cannot start
+        spawn()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Gupta's Sweets app")
+    parser.add_argument('--bind', default=os.environ.get('BIND', '127.0.0.1:8000'), help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', 1)),
+                        help='worker processes (more than one needs a sqlite:// STORE_URL)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 16)),
+                        help='threads per worker running requests')
+    parser.add_argument('--mode', choices=MODES, default=os.environ.get('SERVE_MODE', 'sync'))
+    parser.add_argument('--timeout', type=float, default=5,
+                        help='seconds to wait on a silent client, or on an idle keep-alive connection')
+    parser.add_argument('--access-log', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.threads < 1:
+        parser.error("--workers and --threads must be at least 1")
+    if args.workers > 1 and not os.environ.get('STORE_URL', '').startswith('sqlite:'):
+        parser.error("several workers need a shared store: set STORE_URL=sqlite:///path/to/guptas.db")
+    try:
+        host, port = parse_bind(args.bind)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    build_assets()
+    sock = listen(host, port)
+    if args.workers == 1:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        log.info("Serving on %s with %d %s threads", args.bind, args.threads, args.mode)
+        try:
+            run_worker(sock, args, multiprocess=False)
+        except KeyboardInterrupt:
+            pass
+    else:
+        supervise(sock, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import secrets
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+def shared_secret(table, name='secret_key'):
+    """
+    Return the secret stored under name in table, creating it on first use.
+    Every worker sharing the table (and every restart of a durable store)
+    gets the same value, so sessions signed by one are valid on all.
+    """
+    record = table.get(name)
+    if record is None:
+        try:
+            table.insert({'name': name, 'value': secrets.token_hex(32)})
+        except ValueError:
+            pass  # another worker created it first; use theirs
+        record = table.get(name)
+    return record['value']
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data loaded from the session store; sid is None until first saved"""
+
+    def __init__(self, initial=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.modified = False
+
+
+class StoreSessionInterface(SessionInterface):
+    """
+    Flask sessions kept server-side in a TTLStore (see ttl.py).
+
+    The cookie carries only an unguessable session id; the data lives in a
+    storage table, so every worker sharing the store sees the same sessions
+    and logging out removes the session for good instead of just dropping a
+    cookie. A session is written only when it changes (and then under a new
+    id), and its idle expiry is pushed back at most once per half TTL, so
+    ordinary requests only read. Empty sessions (anonymous visitors) are
+    never stored.
+    """
+
+    def __init__(self, store, ttl=7 * 24 * 3600):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.store.get(sid)
+            if record is not None:
+                return ServerSession(record['data'], sid, record['expires'])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        if session.modified or session.sid is None:
+            # A new id whenever the data changes (in practice, at login), so
+            # an id planted before login never becomes a logged-in session
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            self.store.put({'sid': session.sid, 'data': dict(session)}, ttl=self.ttl)
+        elif session.expires - time.time() < self.ttl / 2:
+            self.store.update(session.sid, {}, ttl=self.ttl)
+        else:
+            return
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
@@ -0,0 +1,895 @@
+import bisect
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from journal import Journal
+from records import Record
+
+
+class BatchError(ValueError):
+    """A batch operation that could not be applied; index is its position in the batch"""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+class Table:
+    """
+    Collection of records keyed by a primary key field.
+
+    Unique indexes map a field value to exactly one record (e.g. email -> user),
+    multi indexes map a field value to all records sharing it (e.g. user_id ->
+    orders). Every index is kept consistent on insert, update and delete, so
+    lookups are O(1) and listings are O(k) in the number of matches.
+
+    Keys, and the keys inside each multi index bucket, are kept sorted so
+    scan() can resume from a cursor with a binary search. Ordered fields are
+    multi indexes whose distinct values are kept sorted too, so scan_range()
+    can walk a range of values (e.g. order dates) without visiting the rest.
+
+    With a record_type (see records.py) inserted dicts are stored as that
+    compact slotted type instead. With a journal (see journal.py) every
+    change is also appended to it, under the table lock so the journal
+    order matches the order the changes were applied in.
+    """
+
+    SCAN_CHUNK = 500
+
+    def __init__(self, name, key='id', unique=(), multi=(), rows=(), record_type=None, journal=None, ordered=()):
+        self.name = name
+        self.key = key
+        self.record_type = record_type
+        self._journal = journal
+        self._rows = {}
+        self._keys = []
+        self._unique = {field: {} for field in unique}
+        self._multi = {field: {} for field in tuple(multi) + tuple(ordered)}
+        self._ordered = {field: [] for field in ordered}
+        self._lock = threading.RLock()
+        for row in rows:
+            self.insert(row)
+
+    def restore(self, rows):
+        """Bulk-load recovered rows without journaling them, building the indexes once"""
+        with self._lock:
+            for row in rows:
+                record = self.record_type.from_dict(row) if self.record_type is not None else row
+                self._rows[record[self.key]] = record
+            self._keys = sorted(self._rows)
+            for index in list(self._unique.values()) + list(self._multi.values()) + list(self._ordered.values()):
+                index.clear()
+            for pk in self._keys:
+                self._index(pk, self._rows[pk])
+
+    def dump_chunks(self, size):
+        """Yield plain-dict copies of every record, size at a time, for snapshots"""
+        after = None
+        while True:
+            with self._lock:
+                lo = 0 if after is None else bisect.bisect_right(self._keys, after)
+                chunk = self._keys[lo:lo + size]
+                rows = [_plain(self._rows[pk]) for pk in chunk]
+            if not rows:
+                return
+            yield rows
+            after = chunk[-1]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __contains__(self, pk):
+        return pk in self._rows
+
+    def all(self):
+        """Return every record in insertion order"""
+        with self._lock:
+            return list(self._rows.values())
+
+    def get(self, pk):
+        """Return the record with the given primary key, or None"""
+        return self._rows.get(pk)
+
+    def get_by(self, field, value):
+        """Return the record whose unique field equals value, or None"""
+        pk = self._unique[field].get(value)
+        if pk is None:
+            return None
+        return self._rows.get(pk)
+
+    def find(self, field, value):
+        """Return all records whose indexed field equals value, in key order"""
+        with self._lock:
+            if field in self._unique:
+                record = self.get_by(field, value)
+                return [record] if record is not None else []
+            pks = self._multi[field].get(value, ())
+            return [self._rows[pk] for pk in pks]
+
+    def count(self, field, value):
+        """Return how many records have the indexed field equal to value"""
+        if field in self._unique:
+            return int(value in self._unique[field])
+        return len(self._multi[field].get(value, ()))
+
+    def scan(self, field=None, value=None, after=None, descending=False):
+        """
+        Yield records in key order, optionally only those whose multi-indexed
+        field equals value, starting just past the key after.
+
+        Keys are copied out a chunk at a time, so a long scan holds the lock
+        only briefly and never materialises the whole table.
+        """
+        while True:
+            with self._lock:
+                keys = self._keys if field is None else self._multi[field].get(value, [])
+                if descending:
+                    hi = len(keys) if after is None else bisect.bisect_left(keys, after)
+                    chunk = keys[max(0, hi - self.SCAN_CHUNK):hi][::-1]
+                else:
+                    lo = 0 if after is None else bisect.bisect_right(keys, after)
+                    chunk = keys[lo:lo + self.SCAN_CHUNK]
+                records = [self._rows[pk] for pk in chunk]
+            if not records:
+                return
+            yield from records
+            after = chunk[-1]
+
+    def scan_range(self, field, low=None, high=None, after=None, descending=False):
+        """
+        Yield records whose ordered field lies between low and high (inclusive;
+        None leaves that end open) in (value, key) order, starting just past
+        the (value, key) position after. Records with no value are skipped.
+        """
+        while True:
+            with self._lock:
+                values = self._ordered[field]
+                index = self._multi[field]
+                chunk = []
+                if descending:
+                    i = len(values) if high is None else bisect.bisect_right(values, high)
+                    if after is not None:
+                        i = min(i, bisect.bisect_right(values, after[0]))
+                    while i > 0 and len(chunk) < self.SCAN_CHUNK:
+                        i -= 1
+                        value = values[i]
+                        if low is not None and value < low:
+                            break
+                        keys = index[value]
+                        hi = len(keys)
+                        if after is not None and value == after[0]:
+                            hi = bisect.bisect_left(keys, after[1])
+                        chunk.extend((value, pk) for pk in keys[max(0, hi - self.SCAN_CHUNK):hi][::-1])
+                else:
+                    i = 0 if low is None else bisect.bisect_left(values, low)
+                    if after is not None:
+                        i = max(i, bisect.bisect_left(values, after[0]))
+                    while i < len(values) and len(chunk) < self.SCAN_CHUNK:
+                        value = values[i]
+                        i += 1
+                        if high is not None and value > high:
+                            break
+                        keys = index[value]
+                        lo = 0
+                        if after is not None and value == after[0]:
+                            lo = bisect.bisect_right(keys, after[1])
+                        chunk.extend((value, pk) for pk in keys[lo:lo + self.SCAN_CHUNK])
+                chunk = chunk[:self.SCAN_CHUNK]
+                records = [self._rows[pk] for _, pk in chunk]
+            if not records:
+                return
+            yield from records
+            after = chunk[-1]
+
+    def insert(self, record):
+        """Add a record, raising ValueError if its key or a unique field is taken"""
+        if self.record_type is not None:
+            record = self.record_type.from_dict(record)
+        with self._lock:
+            pk = record[self.key]
+            if pk in self._rows:
+                raise ValueError(f"{self.name}: duplicate {self.key} {pk!r}")
+            for field, index in self._unique.items():
+                value = record.get(field)
+                if value is not None and value in index:
+                    raise ValueError(f"{self.name}: duplicate {field} {value!r}")
+            self._rows[pk] = record
+            _insort(self._keys, pk)
+            self._index(pk, record)
+            if self._journal is not None:
+                self._journal.append('put', self.name, pk, _plain(record))
+            return record
+
+    def update(self, pk, changes):
+        """Apply changes to a record in place and reindex it; returns the record or None"""
+        with self._lock:
+            record = self._rows.get(pk)
+            if record is None:
+                return None
+            for field, index in self._unique.items():
+                if field in changes and changes[field] != record.get(field):
+                    other = index.get(changes[field])
+                    if other is not None and other != pk:
+                        raise ValueError(f"{self.name}: duplicate {field} {changes[field]!r}")
+            self._unindex(pk, record)
+            record.update(changes)
+            self._index(pk, record)
+            if self._journal is not None:
+                self._journal.append('set', self.name, pk, _plain(changes))
+            return record
+
+    def modify(self, pks, fn):
+        """
+        Atomically read-modify-write several records.
+
+        fn receives {pk: record or None} and returns {pk: changes}; it runs
+        under the table lock, so no other write interleaves, and if it raises
+        nothing is written. Returns the updated records.
+        """
+        with self._lock:
+            changes = fn({pk: self._rows.get(pk) for pk in pks})
+            return [self.update(pk, fields) for pk, fields in changes.items() if pk in self._rows]
+
+    def delete(self, pk):
+        """Remove a record by primary key; returns the removed record or None"""
+        with self._lock:
+            record = self._rows.pop(pk, None)
+            if record is not None:
+                _remove_sorted(self._keys, pk)
+                self._unindex(pk, record)
+                if self._journal is not None:
+                    self._journal.append('del', self.name, pk)
+            return record
+
+    def apply(self, ops):
+        """
+        Apply a batch of ('insert', record), ('update', pk, changes) and
+        ('delete', pk) operations atomically; returns the inserted, updated
+        or deleted record for each.
+
+        Either every operation is applied or, if one fails (a duplicate key,
+        a missing record), none is and BatchError says which. The batch is
+        journaled as a single entry, so recovery never sees half of it.
+        """
+        ops = list(ops)
+        with self._lock:
+            # The operations journal as one entry below, not one each
+            journal, self._journal = self._journal, None
+            undo = []
+            results = []
+            try:
+                for i, op in enumerate(ops):
+                    results.append(self._apply_op(op, undo))
+            except Exception as e:
+                for step in reversed(undo):
+                    self._undo(step)
+                if isinstance(e, ValueError):
+                    raise BatchError(i, str(e)) from None
+                raise
+            finally:
+                self._journal = journal
+            if journal is not None and undo:
+                journal.append('batch', self.name, [_journal_entry(op, step) for op, step in zip(ops, undo)])
+            return results
+
+    def _apply_op(self, op, undo):
+        kind = op[0]
+        if kind == 'insert':
+            record = self.insert(op[1])
+            undo.append(('insert', record[self.key], None, record))
+            return record
+        pk = op[1]
+        record = self._rows.get(pk)
+        if record is None:
+            raise ValueError(f"{self.name}: no {self.key} {pk!r}")
+        if kind == 'update':
+            before = _clone(record)
+            self.update(pk, op[2])
+            undo.append(('update', pk, before, record))
+            return record
+        if kind == 'delete':
+            self.delete(pk)
+            undo.append(('delete', pk, record, None))
+            return record
+        raise ValueError(f"Unknown batch operation {kind!r}")
+
+    def _undo(self, step):
+        _, pk, before, after = step
+        if after is not None:
+            self._rows.pop(pk)
+            _remove_sorted(self._keys, pk)
+            self._unindex(pk, after)
+        if before is not None:
+            self._rows[pk] = before
+            _insort(self._keys, pk)
+            self._index(pk, before)
+
+    def _index(self, pk, record):
+        for field, index in self._unique.items():
+            value = record.get(field)
+            if value is not None:
+                index[value] = pk
+        for field, index in self._multi.items():
+            value = record.get(field)
+            bucket = index.get(value)
+            if bucket is None:
+                bucket = index[value] = []
+                if field in self._ordered and value is not None:
+                    _insort(self._ordered[field], value)
+            _insort(bucket, pk)
+
+    def _unindex(self, pk, record):
+        for field, index in self._unique.items():
+            value = record.get(field)
+            if index.get(value) == pk:
+                del index[value]
+        for field, index in self._multi.items():
+            value = record.get(field)
+            bucket = index.get(value)
+            if bucket is not None:
+                _remove_sorted(bucket, pk)
+                if not bucket:
+                    del index[value]
+                    if field in self._ordered and value is not None:
+                        _remove_sorted(self._ordered[field], value)
+
+
+def _clone(record):
+    return type(record)(record.to_dict()) if isinstance(record, Record) else dict(record)
+
+
+def _journal_entry(op, step):
+    # Updates journal the changed fields, like Table.update does
+    kind, pk, _, after = step
+    if kind == 'delete':
+        return ('del', pk)
+    return ('put', pk, _plain(after)) if kind == 'insert' else ('set', pk, _plain(op[2]))
+
+
+def _plain(record):
+    # Journal entries and snapshots hold plain dicts, never slotted records
+    return record.to_dict() if isinstance(record, Record) else dict(record)
+
+
+def _insort(keys, pk):
+    # Sequence-allocated keys almost always arrive in order, so append is the fast path
+    if not keys or keys[-1] < pk:
+        keys.append(pk)
+    else:
+        bisect.insort(keys, pk)
+
+
+def _remove_sorted(keys, pk):
+    i = bisect.bisect_left(keys, pk)
+    if i < len(keys) and keys[i] == pk:
+        del keys[i]
+
+
+class MemoryStore:
+    """
+    Backend that keeps every table in process memory (the default, and what tests use).
+
+    Given a Journal, tables are recovered from it at startup and every change
+    is journaled; sync() waits until the calling thread's changes are on disk.
+    """
+
+    shared = False
+
+    def __init__(self, journal=None):
+        self.journal = journal
+
+    def table(self, name, key='id', unique=(), multi=(), rows=(), record_type=None, ordered=()):
+        if self.journal is None:
+            return Table(name, key=key, unique=unique, multi=multi, rows=rows, record_type=record_type,
+                         ordered=ordered)
+        # Seed rows only go into a table the journal has never seen
+        recovered = self.journal.recovered(name)
+        table = Table(name, key=key, unique=unique, multi=multi, record_type=record_type, journal=self.journal,
+                      rows=rows if recovered is None else (), ordered=ordered)
+        if recovered is not None:
+            table.restore(recovered)
+        self.journal.attach(table)
+        return table
+
+    def sequence(self, name, start=0):
+        return MemorySequence(name, start, self.journal)
+
+    def sync(self):
+        if self.journal is not None:
+            self.journal.wait()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+
+class MemorySequence:
+    """
+    Monotonic ID allocator for one entity.
+
+    next() on an itertools.count is a single C call, so allocation is atomic
+    under the GIL without taking a lock. Values are never handed out twice,
+    even after the record holding them is deleted.
+
+    With a journal, blocks of values are leased by journaling the block's
+    end, so a restarted process resumes past anything it may have issued.
+    """
+
+    def __init__(self, name, start=0, journal=None, block=1000):
+        self.name = name
+        self._journal = journal
+        self._block = block
+        if journal is not None:
+            start = max(start, journal.sequences.get(name, 0))
+        self._leased = start
+        self._lock = threading.Lock()
+        self._counter = itertools.count(start + 1)
+
+    def next(self):
+        value = next(self._counter)
+        if self._journal is not None and value > self._leased:
+            with self._lock:
+                if value > self._leased:
+                    # Journal the lease before publishing it, so no value is
+                    # handed out ahead of its lease
+                    self._journal.lease(self.name, value + self._block)
+                    self._leased = value + self._block
+        return value
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_object(obj):
+    if len(obj) == 1 and '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    return obj
+
+
+def _dumps(record):
+    return json.dumps(record, default=_encode_value, separators=(',', ':'))
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_decode_object)
+
+
+class SQLiteStore:
+    """
+    Backend that keeps every table in one SQLite database file.
+
+    The database runs in WAL mode so several worker processes can read while
+    one writes. Connections are pooled per process and every statement is a
+    fixed parameterised string, so sqlite3's per-connection statement cache
+    reuses the compiled form.
+    """
+
+    shared = True
+    journal = None
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+    )
+
+    def __init__(self, path, pool_size=8):
+        self.path = path
+        self.pool_size = pool_size
+        self._pid = None
+        self._pool = None
+        self._created = 0
+        self._pool_lock = threading.Lock()
+
+    def table(self, name, key='id', unique=(), multi=(), rows=(), record_type=None, ordered=()):
+        return SQLiteTable(self, name, key=key, unique=unique, multi=multi, rows=rows, record_type=record_type,
+                           ordered=ordered)
+
+    def sequence(self, name, start=0, block=20):
+        return SQLiteSequence(self, name, start, block)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _checkout(self):
+        with self._pool_lock:
+            # A forked worker must never reuse its parent's connections
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = queue.LifoQueue()
+                self._created = 0
+            try:
+                return self._pool.get_nowait()
+            except queue.Empty:
+                if self._created < self.pool_size:
+                    self._created += 1
+                    return self._connect()
+            pool = self._pool
+        return pool.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection in autocommit mode"""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a pooled connection inside a write transaction"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def sync(self):
+        # Every write already committed its own transaction
+        pass
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is None or self._pid != os.getpid():
+                return
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+class SQLiteTable:
+    """
+    Table with the same interface as Table, stored in SQLite.
+
+    Each record is kept as a JSON document next to one column per indexed
+    field; unique fields get a UNIQUE constraint and multi fields a plain
+    index. Returned records are copies, so all changes go through update();
+    with a record_type they are decoded into that record type.
+    """
+
+    def __init__(self, store, name, key='id', unique=(), multi=(), rows=(), record_type=None, ordered=()):
+        self.store = store
+        self.name = name
+        self.key = key
+        self.record_type = record_type
+        self._unique = tuple(unique)
+        # The (field, pk) index on a multi field already serves range scans
+        self._multi = tuple(multi) + tuple(ordered)
+        self._fields = self._unique + self._multi
+        columns = ''.join(f', "{field}"' for field in self._fields)
+        params = ', ?' * len(self._fields)
+        assignments = ''.join(f', "{field}" = ?' for field in self._fields)
+        self._sql_insert = f'INSERT INTO "{name}" (pk, data{columns}) VALUES (?, ?{params})'
+        self._sql_update = f'UPDATE "{name}" SET data = ?{assignments} WHERE pk = ?'
+        self._sql_get = f'SELECT data FROM "{name}" WHERE pk = ?'
+        self._sql_delete = f'DELETE FROM "{name}" WHERE pk = ?'
+        self._sql_all = f'SELECT data FROM "{name}" ORDER BY rowid'
+        self._sql_count = f'SELECT COUNT(*) FROM "{name}"'
+        self._sql_find = {
+            field: f'SELECT data FROM "{name}" WHERE "{field}" = ? ORDER BY rowid'
+            for field in self._fields
+        }
+        self._sql_count_by = {field: f'SELECT COUNT(*) FROM "{name}" WHERE "{field}" = ?' for field in self._fields}
+        self._create(rows)
+
+    def _create(self, rows):
+        columns = ''.join(
+            f', "{field}" UNIQUE' if field in self._unique else f', "{field}"'
+            for field in self._fields
+        )
+        with self.store.transaction() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.name}" (pk PRIMARY KEY, data TEXT NOT NULL{columns})')
+            for field in self._multi:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_{field}" ON "{self.name}" ("{field}", pk)')
+            # Seed rows only go into a brand new table
+            if conn.execute(self._sql_count).fetchone()[0] == 0:
+                for row in rows:
+                    self._insert(conn, row)
+
+    def _decode(self, data):
+        record = _loads(data)
+        return self.record_type(record) if self.record_type is not None else record
+
+    def _values(self, record):
+        return [record.get(field) for field in self._fields]
+
+    def _insert(self, conn, record):
+        try:
+            conn.execute(self._sql_insert, [record[self.key], _dumps(record)] + self._values(record))
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"{self.name}: {e}") from None
+
+    def __len__(self):
+        with self.store.connection() as conn:
+            return conn.execute(self._sql_count).fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __contains__(self, pk):
+        return self.get(pk) is not None
+
+    def all(self):
+        """Return every record in insertion order"""
+        with self.store.connection() as conn:
+            return [self._decode(data) for (data,) in conn.execute(self._sql_all)]
+
+    def get(self, pk):
+        """Return the record with the given primary key, or None"""
+        with self.store.connection() as conn:
+            row = conn.execute(self._sql_get, (pk,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def get_by(self, field, value):
+        """Return the record whose unique field equals value, or None"""
+        if field not in self._unique:
+            raise KeyError(field)
+        with self.store.connection() as conn:
+            row = conn.execute(self._sql_find[field], (value,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def find(self, field, value):
+        """Return all records whose indexed field equals value"""
+        with self.store.connection() as conn:
+            return [self._decode(data) for (data,) in conn.execute(self._sql_find[field], (value,))]
+
+    def count(self, field, value):
+        """Return how many records have the indexed field equal to value"""
+        with self.store.connection() as conn:
+            return conn.execute(self._sql_count_by[field], (value,)).fetchone()[0]
+
+    def scan(self, field=None, value=None, after=None, descending=False):
+        """
+        Yield records in key order, optionally only those whose multi-indexed
+        field equals value, starting just past the key after.
+
+        Rows are fetched a chunk at a time with keyset pagination, so a long
+        scan never holds a connection or the whole table at once.
+        """
+        while True:
+            conditions, params = [], []
+            if field is not None:
+                conditions.append(f'"{field}" = ?')
+                params.append(value)
+            if after is not None:
+                conditions.append('pk < ?' if descending else 'pk > ?')
+                params.append(after)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+            sql = f'SELECT pk, data FROM "{self.name}"{where} ORDER BY pk{" DESC" if descending else ""} LIMIT ?'
+            with self.store.connection() as conn:
+                rows = conn.execute(sql, params + [Table.SCAN_CHUNK]).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield self._decode(data)
+            after = rows[-1][0]
+
+    def scan_range(self, field, low=None, high=None, after=None, descending=False):
+        """
+        Yield records whose field lies between low and high (inclusive; None
+        leaves that end open) in (value, key) order, starting just past the
+        (value, key) position after. Records with no value are skipped.
+        """
+        while True:
+            conditions, params = [f'"{field}" IS NOT NULL'], []
+            if low is not None:
+                conditions.append(f'"{field}" >= ?')
+                params.append(low)
+            if high is not None:
+                conditions.append(f'"{field}" <= ?')
+                params.append(high)
+            if after is not None:
+                op = '<' if descending else '>'
+                conditions.append(f'("{field}" {op} ? OR ("{field}" = ? AND pk {op} ?))')
+                params.extend([after[0], after[0], after[1]])
+            order = ' DESC' if descending else ''
+            sql = (f'SELECT "{field}", pk, data FROM "{self.name}" WHERE {" AND ".join(conditions)} '
+                   f'ORDER BY "{field}"{order}, pk{order} LIMIT ?')
+            with self.store.connection() as conn:
+                rows = conn.execute(sql, params + [Table.SCAN_CHUNK]).fetchall()
+            if not rows:
+                return
+            for _, _, data in rows:
+                yield self._decode(data)
+            after = rows[-1][:2]
+
+    def insert(self, record):
+        """Add a record, raising ValueError if its key or a unique field is taken"""
+        with self.store.transaction() as conn:
+            self._insert(conn, record)
+        return record
+
+    def update(self, pk, changes):
+        """Apply changes to a record and reindex it; returns the updated record or None"""
+        with self.store.transaction() as conn:
+            row = conn.execute(self._sql_get, (pk,)).fetchone()
+            if row is None:
+                return None
+            record = self._decode(row[0])
+            record.update(changes)
+            try:
+                conn.execute(self._sql_update, [_dumps(record)] + self._values(record) + [pk])
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"{self.name}: {e}") from None
+            return record
+
+    def modify(self, pks, fn):
+        """
+        Atomically read-modify-write several records.
+
+        fn receives {pk: record or None} and returns {pk: changes}; it runs
+        inside one write transaction, so no other process interleaves, and if
+        it raises the transaction is rolled back. Returns the updated records.
+        """
+        pks = list(pks)
+        with self.store.transaction() as conn:
+            records = dict.fromkeys(pks)
+            for i in range(0, len(pks), Table.SCAN_CHUNK):
+                chunk = pks[i:i + Table.SCAN_CHUNK]
+                sql = f'SELECT pk, data FROM "{self.name}" WHERE pk IN ({", ".join("?" * len(chunk))})'
+                for pk, data in conn.execute(sql, chunk):
+                    records[pk] = self._decode(data)
+            updated = []
+            for pk, fields in fn(records).items():
+                record = records.get(pk)
+                if record is None:
+                    continue
+                record.update(fields)
+                try:
+                    conn.execute(self._sql_update, [_dumps(record)] + self._values(record) + [pk])
+                except sqlite3.IntegrityError as e:
+                    raise ValueError(f"{self.name}: {e}") from None
+                updated.append(record)
+            return updated
+
+    def delete(self, pk):
+        """Remove a record by primary key; returns the removed record or None"""
+        with self.store.transaction() as conn:
+            row = conn.execute(self._sql_get, (pk,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(self._sql_delete, (pk,))
+            return self._decode(row[0])
+
+    def apply(self, ops):
+        """
+        Apply a batch of ('insert', record), ('update', pk, changes) and
+        ('delete', pk) operations in one write transaction; returns the
+        inserted, updated or deleted record for each.
+
+        If one fails the transaction is rolled back and BatchError says which.
+        """
+        results = []
+        with self.store.transaction() as conn:
+            for i, op in enumerate(ops):
+                try:
+                    results.append(self._apply_op(conn, op))
+                except ValueError as e:
+                    raise BatchError(i, str(e)) from None
+        return results
+
+    def _apply_op(self, conn, op):
+        kind = op[0]
+        if kind == 'insert':
+            self._insert(conn, op[1])
+            return op[1]
+        pk = op[1]
+        row = conn.execute(self._sql_get, (pk,)).fetchone()
+        if row is None:
+            raise ValueError(f"{self.name}: no {self.key} {pk!r}")
+        record = self._decode(row[0])
+        if kind == 'update':
+            record.update(op[2])
+            try:
+                conn.execute(self._sql_update, [_dumps(record)] + self._values(record) + [pk])
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"{self.name}: {e}") from None
+        elif kind == 'delete':
+            conn.execute(self._sql_delete, (pk,))
+        else:
+            raise ValueError(f"Unknown batch operation {kind!r}")
+        return record
+
+
+class SQLiteSequence:
+    """
+    ID allocator shared by every process using the same database.
+
+    Each process leases a block of IDs with one write transaction and hands
+    them out locally, so workers only contend on the database once per block.
+    IDs stay unique across processes but are not strictly ordered between them.
+    """
+
+    def __init__(self, store, name, start=0, block=20):
+        self.store = store
+        self.name = name
+        self.block = block
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        with store.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS _sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO _sequences (name, value) VALUES (?, ?)", (name, start))
+
+    def next(self):
+        with self._lock:
+            if self._next >= self._end:
+                with self.store.transaction() as conn:
+                    conn.execute("UPDATE _sequences SET value = value + ? WHERE name = ?", (self.block, self.name))
+                    end = conn.execute("SELECT value FROM _sequences WHERE name = ?", (self.name,)).fetchone()[0]
+                self._next, self._end = end - self.block, end
+            self._next += 1
+            return self._next
+
+
+def open_store(url):
+    """
+    Open a storage backend from a URL:
+    memory:// keeps everything in process, memory:///path/to/dir does too but
+    journals it to that directory, sqlite:///path/to/file.db shares one database file
+    """
+    if url in ('memory', 'memory://'):
+        return MemoryStore()
+    if url.startswith('memory:///'):
+        return MemoryStore(Journal(url[len('memory://'):]))
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported store URL: {url}")
+
+
+def modify_or_insert(table, pk, change, create, attempts=3):
+    """
+    Change the record pk atomically, creating it if it does not exist yet,
+    and return the result the chosen callback computed.
+
+    change(record) returns (changes, result) and runs inside table.modify();
+    if there is no record, create() returns (record, result) and the record
+    is inserted. When another worker inserts pk first, the insert fails as a
+    duplicate and change is applied to their record instead.
+    """
+    outcome = []
+
+    def modify(records):
+        record = records.get(pk)
+        if record is None:
+            return {}
+        changes, result = change(record)
+        outcome.append(result)
+        return {pk: changes} if changes else {}
+
+    for _ in range(attempts):
+        table.modify([pk], modify)
+        if outcome:
+            return outcome[0]
+        record, result = create()
+        try:
+            table.insert(record)
+            return result
+        except ValueError:
+            # Another worker created it first; change theirs
+            continue
+    raise RuntimeError(f"{table.name} record {pk!r} kept appearing and disappearing; giving up")
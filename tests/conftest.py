@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Cheap password hashing and a private in-memory store for the whole run
+os.environ.setdefault('PASSWORD_HASH_COST', '10')
+os.environ['STORE_URL'] = 'memory://'
+# As if deployed behind one reverse proxy
+os.environ['TRUSTED_PROXIES'] = '1'
+
+DEMO_USER = {'user_type': 'user', 'email': 'john.doe@email.com', 'password': 'password123'}
+DEMO_ADMIN = {'user_type': 'admin', 'username': 'admin', 'password': 'admin123', 'pin': '1234'}
+
+
+@pytest.fixture(scope='session')
+def shop():
+    """The app module, imported once; tests share its store"""
+    import app
+    return app
+
+
+@pytest.fixture(autouse=True)
+def no_throttles(shop):
+    # Every test logs in from the same address; rate limit tests re-enable them
+    shop.ip_limiter.enabled = shop.account_limiter.enabled = False
+    yield
+    shop.ip_limiter.enabled = shop.account_limiter.enabled = True
+
+
+@pytest.fixture
+def client(shop):
+    return shop.app.test_client()
+
+
+def login(shop, credentials):
+    client = shop.app.test_client()
+    response = client.post('/api/login', json=credentials)
+    assert response.status_code == 200, response.get_json()
+    return client
+
+
+@pytest.fixture
+def user_client(shop):
+    return login(shop, DEMO_USER)
+
+
+@pytest.fixture
+def admin_client(shop):
+    return login(shop, DEMO_ADMIN)
+
+
+@pytest.fixture
+def stocked_product(shop):
+    """Give product 2 a stock count of 3 for one test, restoring it afterwards"""
+    original = shop.products.get(2).to_dict()
+    changed = shop.products.update(2, {'stock': 3, 'in_stock': True})
+    shop.catalog_index.upsert(changed)
+    shop.catalog.invalidate()
+    yield 2
+    shop.products.delete(2)
+    shop.products.insert(original)
+    shop.catalog_index.upsert(shop.products.get(2))
+    shop.catalog.invalidate()
@@ -0,0 +1,72 @@
+import pytest
+
+
+@pytest.fixture
+def dated_orders(shop):
+    """Twelve orders spread over four days of 2031, removed afterwards"""
+    ids = []
+    for n in range(12):
+        order_id = shop.order_ids.next()
+        shop.orders.insert({'id': order_id, 'order_number': f'ORDT{order_id}', 'user_id': 1, 'items': [],
+                            'total': 1.0, 'status': 'pending' if n % 3 else 'shipped',
+                            'date': f'2031-02-0{4 - n % 4}', 'address': 'x'})
+        ids.append(order_id)
+    yield [shop.orders.get(order_id) for order_id in ids]
+    for order_id in ids:
+        shop.orders.delete(order_id)
+
+
+def listing(client, **args):
+    """Follow next_cursor through /api/admin/orders, returning the order ids in page order"""
+    ids, cursor = [], None
+    while True:
+        query = dict(args, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/admin/orders', query_string=query)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        ids.extend(order['id'] for order in body['orders'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_date_range_pages_in_date_order(admin_client, dated_orders, order):
+    matches = [o for o in dated_orders if '2031-02-02' <= o['date'] <= '2031-02-03']
+    expected = sorted(matches, key=lambda o: (o['date'], o['id']), reverse=order == 'desc')
+    ids = listing(admin_client, date_from='2031-02-02', date_to='2031-02-03', order=order, limit=2)
+    assert ids == [o['id'] for o in expected]
+
+
+def test_date_range_combines_with_status(admin_client, dated_orders):
+    ids = listing(admin_client, date_from='2031-02-01', status='shipped', order='asc', limit=1)
+    expected = sorted((o for o in dated_orders if o['status'] == 'shipped'), key=lambda o: (o['date'], o['id']))
+    assert ids == [o['id'] for o in expected]
+
+
+def test_user_listing_keeps_id_order_and_cursors(admin_client, dated_orders):
+    ids = listing(admin_client, user_id=1, date_from='2031-01-01', order='asc', limit=5)
+    assert ids == sorted(o['id'] for o in dated_orders)
+
+
+@pytest.mark.parametrize('args', [
+    {'cursor': 'abc'},
+    {'cursor': '2031-02-02:7'},
+    {'cursor': '17', 'date_from': '2031-02-01'},
+    {'cursor': '2031-02-02:x', 'date_from': '2031-02-01'},
+    {'cursor': 'abc', 'format': 'ndjson'},
+])
+def test_undecodable_cursor_is_rejected(admin_client, args):
+    response = admin_client.get('/api/admin/orders', query_string=args)
+    assert response.status_code == 400 and response.get_json()['error'] == 'Invalid cursor'
+
+
+@pytest.mark.parametrize('user_id', ['abc', '1.5', ''])
+def test_non_numeric_user_id_is_rejected(admin_client, user_id):
+    for export in ({}, {'format': 'ndjson'}):
+        response = admin_client.get('/api/admin/orders', query_string={'user_id': user_id, **export})
+        assert response.status_code == 400 and response.get_json()['error'] == 'user_id must be a number'
+
+
+def test_listing_needs_an_admin(user_client):
+    assert user_client.get('/api/admin/orders').status_code == 401
@@ -0,0 +1,54 @@
+import pytest
+
+NEW_PRODUCT = {'name': 'Test Sock', 'description': 'For tests', 'price': 9.5, 'category': 'classic'}
+
+
+@pytest.mark.parametrize('changes, error', [
+    ({'price': 'cheap'}, 'Invalid price: must be a number'),
+    ({'price': -1}, 'Invalid price: must be zero or more'),
+    ({'price': True}, 'Invalid price: must be a number'),
+    ({'price': [1]}, 'Invalid price'),
+    ({'stock': 'lots'}, 'Invalid stock: must be a whole number'),
+    ({'stock': 1.5}, 'Invalid stock: must be a whole number'),
+    ({'stock': -2}, 'Invalid stock: must be zero or more'),
+    ({'price': None}, 'A new product needs price'),
+])
+def test_add_product_rejects_bad_numbers(shop, admin_client, changes, error):
+    count = len(list(shop.products.scan()))
+    response = admin_client.post('/api/admin/products', json={**NEW_PRODUCT, **changes})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith(error)
+    assert len(list(shop.products.scan())) == count
+
+
+def test_add_product_normalises_numbers_and_indexes_it(shop, admin_client):
+    response = admin_client.post('/api/admin/products', json={**NEW_PRODUCT, 'price': '7.499', 'stock': '0'})
+    assert response.status_code == 200
+    product = response.get_json()['product']
+    try:
+        assert product['price'] == 7.5 and product['stock'] == 0 and product['in_stock'] is False
+        assert shop.catalog_index.prices()[product['id']].price_cents == 750
+    finally:
+        admin_client.delete(f"/api/admin/products/{product['id']}")
+
+
+@pytest.mark.parametrize('changes', [{'price': 'cheap'}, {'price': -3}, {'stock': 'x'}])
+def test_update_product_rejects_bad_numbers_and_keeps_the_index_usable(shop, admin_client, changes):
+    before = shop.products.get(1).to_dict()
+    response = admin_client.put('/api/admin/products/1', json=changes)
+    assert response.status_code == 400
+    assert shop.products.get(1).to_dict() == before
+    shop.catalog_index.rebuild()
+    assert shop.catalog_index.prices()[1].price_cents == round(before['price'] * 100)
+
+
+def test_update_product_keeps_omitted_price(shop, admin_client):
+    before = shop.products.get(1).to_dict()
+    response = admin_client.put('/api/admin/products/1', json={'description': before['description']})
+    assert response.status_code == 200
+    assert response.get_json()['product']['price'] == before['price']
+
+
+def test_product_routes_need_a_json_object(admin_client):
+    assert admin_client.post('/api/admin/products', data='nope').status_code == 400
+    assert admin_client.put('/api/admin/products/1', json=[1]).status_code == 400
@@ -0,0 +1,73 @@
+import time
+
+from analytics import SalesStats
+
+
+def order(total, status='pending', date='2031-01-01', **item):
+    return {'total': total, 'status': status, 'date': date,
+            'items': [dict({'product_id': 1, 'name': 'Sock', 'quantity': 1}, **item)]}
+
+
+def test_record_and_status_changes_update_the_counters():
+    stats = SalesStats()
+    stats.record(order(12.99, quantity=2))
+    stats.record(order(0.01, product_id=2, name='Cheap'))
+    stats.status_changed('pending', 'shipped')
+    snapshot = stats.snapshot()
+    assert snapshot['total_orders'] == 2 and snapshot['total_revenue'] == 13.0
+    assert snapshot['orders_by_status'] == {'pending': 1, 'shipped': 1}
+    assert snapshot['top_products'][0] == {'product_id': 1, 'name': 'Sock', 'units': 2}
+
+
+def test_refresher_rebuilds_in_the_background():
+    history = [order(5)]
+    stats = SalesStats()
+    stats.rebuild(history)
+    stats.start_refresher(lambda: list(history), 0.01)
+    try:
+        # Another worker's order, which this one never record()ed
+        history.append(order(7))
+        deadline = time.monotonic() + 5
+        while stats.snapshot()['total_orders'] != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stats.snapshot()['total_revenue'] == 12.0
+    finally:
+        stats.stop_refresher()
+
+
+def test_refresher_survives_a_failed_load():
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("store unavailable")
+        return [order(3)]
+
+    stats = SalesStats().start_refresher(load, 0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while stats.snapshot()['total_orders'] != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stats.snapshot()['total_orders'] == 1
+    finally:
+        stats.stop_refresher()
+
+
+def test_cancelled_orders_earn_nothing():
+    stats = SalesStats()
+    kept = order(10, date='2031-01-01', quantity=1)
+    dropped = order(5, date='2031-01-02', product_id=2, name='Other', quantity=3)
+    stats.record(kept)
+    stats.record(dropped)
+    stats.status_changed('pending', 'cancelled')
+    stats.cancelled(dropped)
+    live = stats.snapshot()
+    assert live['total_revenue'] == 10.0
+    assert live['revenue_by_day'] == [{'date': '2031-01-01', 'revenue': 10.0}]
+    assert [p['product_id'] for p in live['top_products']] == [1]
+    assert live['total_orders'] == 2 and live['orders_by_status'] == {'pending': 1, 'cancelled': 1}
+
+    rebuilt = SalesStats()
+    rebuilt.rebuild([kept, dict(dropped, status='cancelled')])
+    assert rebuilt.snapshot() == live
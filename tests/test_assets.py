@@ -0,0 +1,107 @@
+import gzip
+import json
+
+import pytest
+
+import assets
+
+
+def test_minify_js_drops_comments_indentation_and_blank_lines():
+    source = "// header\n\n  /* block\n     comment */\n  const a = 1;  \n    // note\n  call(a);\n"
+    assert assets.minify_js(source) == "const a = 1;\ncall(a);\n"
+
+
+@pytest.mark.parametrize('line', [
+    "// wrap names in `backticks`",
+    "// a stray ` in a comment",
+    "/* a stray ` in a block comment */",
+    "const tick = '`';",
+    'const tick = "`"; // and one more `',
+    "x(); /* ` */ y();",
+])
+def test_backticks_outside_code_do_not_open_a_template(line):
+    source = f"{line}\n    indented();\n"
+    assert assets.minify_js(source).splitlines()[-1] == "indented();"
+
+
+def test_multiline_block_comment_with_backticks():
+    source = "/*\n  use `x`\n  and ` alone\n*/\n    after();\n"
+    assert assets.minify_js(source) == "after();\n"
+
+
+def test_template_literal_lines_are_kept_verbatim():
+    source = ("    const html = `  \n"
+              "        <p>${name}</p>\n"
+              "        // not a comment here\n"
+              "    `;\n"
+              "    const escaped = `a\\`b`;\n"
+              "        done();\n")
+    assert assets.minify_js(source) == ("const html = `  \n"
+                                        "        <p>${name}</p>\n"
+                                        "        // not a comment here\n"
+                                        "    `;\n"
+                                        "const escaped = `a\\`b`;\n"
+                                        "done();\n")
+
+
+def test_code_after_a_closing_block_comment_is_kept():
+    assert assets.minify_js("/* start\nend */ go();\n") == "end */ go();\n"
+
+
+def test_build_writes_hashed_assets_and_manifest(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'templates').mkdir(parents=True)
+    (source / 'script.js').write_text("// c\n  run();\n")
+    (source / 'style.css').write_text("a {\n  color: red;\n}\n")
+    (source / 'index.html').write_text('<link href="style.css"><script src="/static/js/script.js"></script>')
+    static = tmp_path / 'static'
+    manifest = assets.build(str(source), str(static), str(tmp_path / 'templates'))
+    assert json.loads((static / assets.MANIFEST).read_text()) == manifest
+    script = static / manifest['script.js']
+    assert script.read_bytes() == b"run();\n"
+    assert gzip.decompress((static / (manifest['script.js'] + '.gz')).read_bytes()) == b"run();\n"
+    page = (tmp_path / 'templates' / 'index.html').read_text()
+    assert f"/static/{manifest['style.css']}" in page and f"/static/{manifest['script.js']}" in page
+    assert not assets.is_stale(str(source), str(static))
+
+
+def sources(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'script.js').write_text("run();\n")
+    (source / 'index.html').write_text('<script src="script.js"></script>')
+    (source / 'register.html').write_text('<p>register</p>')
+    return source
+
+
+def test_ensure_built_builds_a_fresh_checkout_once(tmp_path):
+    source = sources(tmp_path)
+    static, templates = tmp_path / 'static', tmp_path / 'templates'
+    manifest = assets.ensure_built(str(source), str(static), str(templates))
+    assert set(manifest) == {'script.js'}
+    assert sorted(p.name for p in templates.iterdir()) == ['index.html', 'register.html']
+    assert assets.ensure_built(str(source), str(static), str(templates)) is None
+    assert not list(tmp_path.rglob('*.tmp'))
+
+
+def test_a_missing_page_makes_the_build_stale(tmp_path):
+    source = sources(tmp_path)
+    static, templates = tmp_path / 'static', tmp_path / 'templates'
+    assets.ensure_built(str(source), str(static), str(templates))
+    (templates / 'register.html').unlink()
+    assert assets.is_stale(str(source), str(static), str(templates))
+    assets.ensure_built(str(source), str(static), str(templates))
+    assert (templates / 'register.html').exists()
+
+
+def test_unbuildable_front_end_fails_with_a_clear_error(tmp_path):
+    source = sources(tmp_path)
+    blocked = tmp_path / 'static'
+    blocked.write_text("not a directory")
+    with pytest.raises(RuntimeError, match='flask build-assets'):
+        assets.ensure_built(str(source), str(blocked), str(tmp_path / 'templates'))
+
+
+def test_every_page_renders(client):
+    for path in ('/', '/login', '/register', '/forgot-password'):
+        assert client.get(path).status_code == 200, path
@@ -0,0 +1,102 @@
+import pytest
+
+import bulk
+from store import Table
+
+
+@pytest.fixture
+def catalog(shop):
+    """Restore the catalog exactly as it was once the test is done"""
+    original = {product['id']: product.to_dict() for product in shop.products.scan()}
+    yield shop.products
+    for product in list(shop.products.scan()):
+        shop.products.delete(product['id'])
+    for product in original.values():
+        shop.products.insert(product)
+    shop.catalog_index.rebuild()
+    shop.catalog.invalidate()
+
+
+def snapshot(products):
+    return [product.to_dict() for product in products.scan()]
+
+
+def import_csv(client, body, **args):
+    query = '&'.join(f'{key}={value}' for key, value in args.items())
+    return client.post(f'/api/admin/products/bulk?{query}', data=body, content_type='text/csv')
+
+
+def test_every_bad_row_is_reported_and_nothing_is_applied(catalog, admin_client):
+    before = snapshot(catalog)
+    body = ('id,name,description,price,category,stock,colour\n'
+            ',New Sock,Warm,4.5,classic,,\n'
+            '1,,,cheap,,,\n'
+            '999,,,5,,,\n'
+            '2,,,,,-1,\n'
+            '3,,,,,,red\n')
+    response = import_csv(admin_client, body)
+    assert response.status_code == 422
+    report = response.get_json()
+    assert report['success'] is False and report['applied'] is False
+    assert [(error['row'], error['error']) for error in report['errors']] == [
+        (2, 'Invalid price: must be a number'),
+        (3, 'Unknown product 999 (leave id empty to add a product)'),
+        (4, 'Invalid stock: must be zero or more'),
+        (5, 'Unknown column colour'),
+    ]
+    assert snapshot(catalog) == before
+
+
+def test_rows_naming_one_product_twice_are_rejected(catalog, admin_client):
+    response = admin_client.post('/api/admin/products/bulk', json={'rows': [
+        {'id': 1, 'price': 6}, {'id': 1, 'op': 'delete'}, 'not a row']})
+    assert response.status_code == 422
+    assert response.get_json()['errors'] == [
+        {'row': 2, 'error': 'Product 1 already changed by row 1'},
+        {'row': 3, 'error': 'Each row must be an object'},
+    ]
+
+
+def test_a_batch_the_store_rejects_leaves_the_table_untouched():
+    products = Table('products', rows=[{'id': 1, 'price': 1.0}, {'id': 2, 'price': 2.0}])
+    index = type('Index', (), {'prices': lambda self: {1: None, 2: None, 3: None}})()
+    importer = bulk.ProductImport(products, index, iter(range(10, 20)).__next__)
+    rows = [(1, {'id': 1, 'price': 9}, None),
+            (2, {'name': 'New', 'description': 'x', 'price': 1, 'category': 'c'}, None),
+            (3, {'id': 3, 'op': 'delete'}, None)]
+
+    report, changed, removed = importer.run(rows)
+    assert report['applied'] is False and (changed, removed) == ([], [])
+    assert report['errors'][0]['row'] == 3
+    assert [dict(p) for p in products.scan()] == [{'id': 1, 'price': 1.0}, {'id': 2, 'price': 2.0}]
+
+
+def test_dry_run_reports_without_changing_anything(shop, catalog, admin_client):
+    before = snapshot(catalog)
+    body = 'id,name,description,price,category\n,New Sock,Warm,4.5,classic\n1,,,7.25,\n'
+    response = import_csv(admin_client, body, dry_run=1)
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['inserted'], report['updated'], report['applied']) == (1, 1, False)
+    assert snapshot(catalog) == before
+    assert shop.catalog_index.prices()[1].price_cents == round(before[0]['price'] * 100)
+
+
+@pytest.mark.parametrize('fmt', bulk.FORMATS)
+def test_export_imports_back_unchanged_and_edits_round_trip(shop, catalog, admin_client, fmt):
+    before = snapshot(catalog)
+    exported = admin_client.get(f'/api/admin/products/export?format={fmt}').data
+    response = admin_client.post(f'/api/admin/products/bulk?format={fmt}', data=exported,
+                                 content_type='application/octet-stream')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['updated'], report['inserted'], report['deleted']) == (len(before), 0, 0)
+    assert snapshot(catalog) == before
+    assert admin_client.get(f'/api/admin/products/export?format={fmt}').data == exported
+
+    body = 'id,price,op\n1,3.5,\n2,,delete\n'
+    assert import_csv(admin_client, body).status_code == 200
+    assert catalog.get(1)['price'] == 3.5 and catalog.get(2) is None
+    assert shop.catalog_index.prices()[1].price_cents == 350 and 2 not in shop.catalog_index.prices()
+    listed = {product['id'] for product in admin_client.get('/api/products').get_json()}
+    assert 2 not in listed
@@ -0,0 +1,79 @@
+import pytest
+
+from cart import CartEngine
+from catalog import PriceEntry
+from store import open_store
+
+PRICES = {
+    1: PriceEntry(1299, 'Classic Sock', True, None),
+    2: PriceEntry(1499, 'Premium Sock', True, 4),
+}
+
+
+@pytest.fixture(params=['memory', 'shared'])
+def engine(request, tmp_path):
+    table = None
+    if request.param == 'shared':
+        table = open_store(f"sqlite:///{tmp_path / 'carts.db'}").table('carts', key='user_id')
+    return CartEngine(lambda: PRICES, table=table, max_ops=5)
+
+
+def add(product_id, quantity=1, **fields):
+    return {'action': 'add', 'item': dict(fields, id=product_id, quantity=quantity)}
+
+
+def test_added_items_take_name_and_price_from_the_catalog(engine):
+    cart = engine.apply(7, [add(1, 2, name='Free Sock', price=0.01), add('2', price='nope')])
+    assert cart['items'] == [
+        {'id': 1, 'name': 'Classic Sock', 'price': 12.99, 'quantity': 2},
+        {'id': 2, 'name': 'Premium Sock', 'price': 14.99, 'quantity': 1},
+    ]
+    assert cart['total'] == 40.97
+
+
+def test_updates_and_removes_keep_the_total(engine):
+    engine.apply(7, [add(1, 3), add(2)])
+    cart = engine.apply(7, [{'action': 'update', 'item': {'id': 1, 'quantity': 1}},
+                            {'action': 'remove', 'item': {'id': '2'}}])
+    assert cart['count'] == 1 and cart['total'] == 12.99
+    assert engine.get(7) == cart
+
+
+@pytest.mark.parametrize('ops, error', [
+    ([add(99)], 'Unknown product 99'),
+    ([add(True)], 'must be numbers'),
+    ([add(1, 'lots')], 'must be numbers'),
+    ([{'action': 'update', 'item': {'id': 1}}], 'need a quantity'),
+    ({'action': 'add'}, 'must be a list'),
+    ([add(1)] * 6, 'limited to 5 operations'),
+    ([add(2, 1001)], 'limited to 1000'),
+    ([{'action': 'update', 'item': {'id': 1, 'quantity': 1001}}], 'limited to 1000'),
+    ([add(2), add(1, 1000)], 'At most 1000 of Classic Sock per cart'),
+])
+def test_bad_batches_change_nothing(engine, ops, error):
+    engine.apply(7, [add(1)])
+    with pytest.raises(ValueError, match=error):
+        engine.apply(7, ops)
+    assert engine.get(7)['total'] == 12.99
+
+
+def test_clear_empties_the_cart(engine):
+    engine.apply(7, [add(1)])
+    engine.clear(7)
+    assert engine.get(7) == {'items': [], 'count': 0, 'total': 0}
+
+
+def test_cart_route_ignores_client_prices_and_order_clears_it(shop, user_client):
+    response = user_client.post('/api/cart', json={'action': 'add', 'item': {'id': 1, 'name': 'x', 'price': 0}})
+    assert response.status_code == 200
+    assert response.get_json()['total'] == shop.products.get(1)['price']
+
+    ops = [{'action': 'add', 'item': {'id': 1}}] * (shop.carts.max_ops + 1)
+    response = user_client.post('/api/cart', json={'action': 'batch', 'ops': ops})
+    assert response.status_code == 400
+    response = user_client.post('/api/cart', json={'action': 'add', 'item': {'id': 1, 'quantity': 1000}})
+    assert response.status_code == 400 and 'At most 1000' in response.get_json()['error']
+
+    response = user_client.post('/api/order', json={'items': [{'product_id': 1}], 'address': '1 Test Lane'})
+    assert response.status_code == 200
+    assert user_client.get('/api/cart').get_json()['count'] == 0
@@ -0,0 +1,170 @@
+import base64
+import gzip
+import json
+
+import pytest
+from werkzeug.wrappers import Request
+
+import catalog
+from catalog import CatalogCache, CatalogIndex
+
+PRODUCTS = [
+    {'id': i, 'name': f'Sock {chr(ord("a") + (i * 7) % 26)}', 'price': round(5 + (i * 37) % 23 * 0.5, 2),
+     'category': 'classic' if i % 2 else 'premium', 'in_stock': i % 3 != 0,
+     'description': 'wool' if i % 4 == 0 else 'cotton'}
+    for i in range(1, 41)
+]
+
+
+@pytest.fixture
+def index():
+    return CatalogIndex(lambda: PRODUCTS)
+
+
+def pages(index, **query):
+    """Follow next_cursor to the end, returning every page"""
+    result, cursor = [], None
+    while True:
+        items, cursor = index.query(cursor=cursor, **query)
+        result.append(items)
+        if cursor is None:
+            return result
+
+
+def raw_cursor(*fields):
+    return base64.urlsafe_b64encode(json.dumps(list(fields)).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('sort, key', [
+    ('id', lambda p: p['id']),
+    ('price', lambda p: p['price']),
+    ('name', lambda p: p['name'].lower()),
+])
+@pytest.mark.parametrize('descending', [False, True])
+def test_cursor_pages_cover_every_match_once_in_order(index, sort, key, descending):
+    result = pages(index, sort=sort, descending=descending, limit=7)
+    assert [len(items) for items in result] == [7] * 5 + [5]
+    ids = [p['id'] for items in result for p in items]
+    expected = sorted(PRODUCTS, key=lambda p: (key(p), p['id']), reverse=descending)
+    assert ids == [p['id'] for p in expected]
+
+
+def test_cursor_pages_respect_filters(index):
+    query = {'category': 'classic', 'in_stock': True, 'min_price': 8, 'max_price': 14, 'sort': 'price'}
+    ids = [p['id'] for items in pages(index, limit=3, **query) for p in items]
+    expected = [p for p in PRODUCTS if p['category'] == 'classic' and p['in_stock'] and 8 <= p['price'] <= 14]
+    assert ids == [p['id'] for p in sorted(expected, key=lambda p: (p['price'], p['id']))]
+
+
+def test_cursor_resumes_after_a_product_is_removed(index):
+    first, cursor = index.query(sort='price', limit=5)
+    index.remove(first[-1]['id'])
+    rest, _ = index.query(sort='price', limit=100, cursor=cursor)
+    assert len(first) + len(rest) == len(PRODUCTS)
+    assert not {p['id'] for p in first} & {p['id'] for p in rest}
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    raw_cursor('id', False, 3),
+    raw_cursor('price', False, None, 1),
+    raw_cursor('price', False, 'cheap', 1),
+    raw_cursor('price', False, True, 1),
+    raw_cursor('price', False, 5.5, '1'),
+    raw_cursor('price', 'no', 5.5, 1),
+])
+def test_malformed_cursor_is_rejected(index, cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        index.query(sort='price', cursor=cursor)
+
+
+def test_cursor_is_tied_to_its_sort_key_and_direction(index):
+    _, cursor = index.query(sort='name', limit=5)
+    index.query(sort='name', limit=5, cursor=cursor)
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        index.query(sort='price', cursor=cursor)
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        index.query(sort='name', descending=True, cursor=cursor)
+
+
+def test_products_route_rejects_a_mismatched_cursor(client):
+    response = client.get('/api/products?sort=name&limit=1')
+    cursor = response.get_json()['next_cursor']
+    assert cursor
+    assert client.get(f'/api/products?sort=name&limit=1&cursor={cursor}').status_code == 200
+    response = client.get(f'/api/products?sort=price&cursor={cursor}')
+    assert response.status_code == 400 and response.get_json()['error'] == 'Invalid cursor'
+    response = client.get(f'/api/products?cursor={raw_cursor("id", False, None, 1)}')
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def products():
+    return list(PRODUCTS)
+
+
+@pytest.fixture
+def cache(monkeypatch, products):
+    # Without brotli, so gzip is the only compressed variant whatever is installed
+    monkeypatch.setattr(catalog, 'brotli', None)
+    return CatalogCache(lambda: products)
+
+
+def serve(cache, encoding=None, etag=None):
+    headers = {}
+    if encoding:
+        headers['Accept-Encoding'] = encoding
+    if etag:
+        headers['If-None-Match'] = etag
+    return cache.serve(Request.from_values(headers=headers))
+
+
+def test_cached_catalog_serves_identity_and_gzip_with_their_own_etags(cache):
+    plain = serve(cache)
+    assert 'Content-Encoding' not in plain.headers
+    assert json.loads(plain.get_data()) == PRODUCTS
+
+    zipped = serve(cache, 'gzip, deflate')
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    assert zipped.get_etag() == (plain.get_etag()[0] + '-gzip', False)
+
+    for response in (plain, zipped):
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_matching_etag_gets_a_bodyless_304_for_that_encoding_only(cache):
+    plain_tag = serve(cache).headers['ETag']
+    gzip_tag = serve(cache, 'gzip').headers['ETag']
+
+    response = serve(cache, etag=plain_tag)
+    assert response.status_code == 304 and response.get_data() == b''
+    assert response.headers['ETag'] == plain_tag and response.headers['Vary'] == 'Accept-Encoding'
+    assert serve(cache, 'gzip', etag=gzip_tag).status_code == 304
+    # The identity tag does not validate the gzip representation, nor the reverse
+    assert serve(cache, 'gzip', etag=plain_tag).status_code == 200
+    assert serve(cache, etag=gzip_tag).status_code == 200
+
+
+def test_invalidate_rebuilds_the_body_and_etag(cache, products):
+    before = serve(cache)
+    products.pop()
+    assert serve(cache).headers['ETag'] == before.headers['ETag']
+    cache.invalidate()
+    after = serve(cache, etag=before.headers['ETag'])
+    assert after.status_code == 200 and after.headers['ETag'] != before.headers['ETag']
+    assert len(json.loads(after.get_data())) == len(PRODUCTS) - 1
+
+
+def test_small_catalog_is_not_served_compressed(monkeypatch):
+    monkeypatch.setattr(catalog, 'brotli', None)
+    response = serve(CatalogCache(lambda: []), 'gzip')
+    assert 'Content-Encoding' not in response.headers and response.get_data() == b'[]'
+
+
+def test_products_route_serves_the_cached_catalog(client):
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    again = client.get('/api/products', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,84 @@
+def order(client, body):
+    response = client.post('/api/order', json=body)
+    return response.status_code, response.get_json()
+
+
+def test_order_is_repriced_from_the_catalog(shop, user_client):
+    status, body = order(user_client, {'items': [{'product_id': 1, 'quantity': 2, 'price': 0.01}],
+                                       'total': 0.02, 'address': '1 Test Lane'})
+    assert status == 200
+    placed = next(o for o in shop.orders.find('user_id', 1) if o['order_number'] == body['order_id'])
+    assert placed['total'] == body['total'] == round(2 * shop.products.get(1)['price'], 2)
+    assert placed['items'][0]['price'] == shop.products.get(1)['price']
+
+
+def test_stock_is_reserved_and_never_oversold(shop, user_client, stocked_product):
+    status, _ = order(user_client, {'items': [{'product_id': stocked_product, 'quantity': 2}], 'address': 'x'})
+    assert status == 200
+    assert shop.products.get(stocked_product)['stock'] == 1
+
+    status, body = order(user_client, {'items': [{'product_id': stocked_product, 'quantity': 2}], 'address': 'x'})
+    assert status == 409 and 'left' in body['error']
+    assert shop.products.get(stocked_product)['stock'] == 1
+
+    status, _ = order(user_client, {'items': [{'product_id': stocked_product, 'quantity': 1}], 'address': 'x'})
+    assert status == 200
+    product = shop.products.get(stocked_product)
+    assert product['stock'] == 0 and product['in_stock'] is False
+
+
+def test_invalid_body_takes_no_stock(shop, user_client, stocked_product):
+    orders_before = len(shop.orders)
+    for body in ({'items': [{'product_id': stocked_product, 'quantity': 1}]},
+                 {'items': [{'product_id': stocked_product, 'quantity': 1}], 'address': '   '},
+                 {'items': [{'product_id': stocked_product, 'quantity': 1}], 'address': 42},
+                 ['not', 'an', 'object']):
+        status, _ = order(user_client, body)
+        assert status == 400
+    product = shop.products.get(stocked_product)
+    assert product['stock'] == 3 and product['in_stock'] is True
+    assert len(shop.orders) == orders_before
+
+
+def test_failed_insert_releases_the_reservation(shop, user_client, stocked_product, monkeypatch):
+    def broken_insert(record):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(shop.orders, 'insert', broken_insert)
+    shop.app.testing = False  # answer 500 instead of re-raising in the test client
+    try:
+        status, _ = order(user_client, {'items': [{'product_id': stocked_product, 'quantity': 2}], 'address': 'x'})
+    finally:
+        shop.app.testing = True
+    assert status == 500
+    assert shop.products.get(stocked_product)['stock'] == 3
+
+
+def test_release_puts_stock_back(shop, stocked_product):
+    lines, _ = shop.checkout.quote([{'product_id': stocked_product, 'quantity': 3}])
+    shop.checkout.reserve(lines)
+    assert shop.products.get(stocked_product)['in_stock'] is False
+    shop.checkout.release(lines)
+    product = shop.products.get(stocked_product)
+    assert product['stock'] == 3 and product['in_stock'] is True
+
+
+def test_unknown_products_and_bad_quantities_are_rejected(user_client):
+    for items in ([], [{'product_id': 999}], [{'product_id': 1, 'quantity': 0}], [{'product_id': 'x'}]):
+        status, _ = order(user_client, {'items': items, 'address': 'x'})
+        assert status == 400
+
+
+def test_cached_listing_follows_stock_counts(shop, client, user_client, stocked_product):
+    def listed():
+        response = client.get('/api/products')
+        product = next(p for p in response.get_json() if p['id'] == stocked_product)
+        return response.headers['ETag'], product['stock']
+
+    etag, stock = listed()
+    assert stock == 3
+    status, _ = order(user_client, {'items': [{'product_id': stocked_product, 'quantity': 2}], 'address': 'x'})
+    assert status == 200
+    new_etag, stock = listed()
+    assert stock == 1 and new_etag != etag
+    assert client.get('/api/products', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from events import RESYNC, EventBus, TooManySubscribers
+
+
+def test_head_request_leaves_no_subscriber(shop, admin_client):
+    before = len(shop.events)
+    for _ in range(5):
+        response = admin_client.head('/api/events')
+        assert response.status_code == 200
+        response.close()
+    assert len(shop.events) == before
+
+
+def test_stream_closed_before_first_chunk_unsubscribes(shop, admin_client):
+    before = len(shop.events)
+    response = admin_client.get('/api/events', buffered=False)
+    assert len(shop.events) == before + 1
+    response.close()
+    assert len(shop.events) == before
+
+
+def test_stream_delivers_events_then_unsubscribes(shop, admin_client, user_client):
+    before = len(shop.events)
+    response = admin_client.get('/api/events', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    user_client.post('/api/order', json={'items': [{'product_id': 1}], 'address': 'x'})
+    assert b'event: order.created' in next(chunks)
+    response.close()
+    assert len(shop.events) == before
+
+
+def test_events_need_a_session(client):
+    assert client.get('/api/events').status_code == 401
+
+
+def test_full_bus_answers_503(shop, admin_client, monkeypatch):
+    monkeypatch.setattr(shop.events, 'max_subscribers', len(shop.events))
+    response = admin_client.get('/api/events')
+    assert response.status_code == 503 and response.headers['Retry-After']
+
+
+def test_publish_reaches_only_subscribed_topics():
+    bus = EventBus()
+    admin = bus.subscribe(['admin'])
+    user = bus.subscribe(['user:1'])
+    bus.publish(['admin', 'user:2'], 'order.created', {'id': 1})
+    assert b'event: order.created' in b''.join(admin.next(0))
+    assert user.next(0) == []
+
+
+def test_slow_subscriber_gets_a_resync_instead_of_a_backlog():
+    bus = EventBus(buffer_size=2)
+    subscription = bus.subscribe(['admin'])
+    for i in range(5):
+        bus.publish(['admin'], 'order.created', {'id': i})
+    assert subscription.next(0)[0] == RESYNC
+    assert subscription.dropped == 5
+
+
+def test_reconnect_replays_missed_events_or_resyncs():
+    bus = EventBus(history=2)
+    first = bus.publish(['admin'], 'a', {})
+    bus.publish(['admin'], 'b', {})
+    bus.publish(['admin'], 'c', {})
+    replayed = bus.subscribe(['admin'], last_event_id=first + 1).next(0)
+    assert len(replayed) == 1 and b'event: c' in replayed[0]
+    assert bus.subscribe(['admin'], last_event_id=0).next(0) == [RESYNC]
+
+
+def test_max_subscribers():
+    bus = EventBus(max_subscribers=1)
+    bus.subscribe(['admin'])
+    with pytest.raises(TooManySubscribers):
+        bus.subscribe(['admin'])
+
+
+def test_unstarted_streams_unsubscribe_on_close():
+    bus = EventBus()
+    bus.stream(bus.subscribe(['admin'])).close()
+    asyncio.run(bus.stream_async(bus.subscribe(['admin'])).aclose())
+    assert len(bus) == 0
+
+
+def test_async_stream_wakes_on_publish_from_another_thread():
+    bus = EventBus()
+
+    async def read():
+        stream = bus.stream_async(bus.subscribe(['admin']), heartbeat=5)
+        try:
+            assert (await stream.__anext__()).startswith(b'retry:')
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.05, lambda: loop.run_in_executor(None, bus.publish, ['admin'], 'ping', {}))
+            return await asyncio.wait_for(stream.__anext__(), 2)
+        finally:
+            await stream.aclose()
+
+    assert b'event: ping' in asyncio.run(read())
+    assert len(bus) == 0
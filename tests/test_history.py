@@ -0,0 +1,73 @@
+import json
+
+from history import OrderHistoryCache
+
+ORDER = {'items': [{'product_id': 1, 'quantity': 1}], 'address': '1 Test Lane'}
+
+
+def make_cache(orders, **kwargs):
+    loads = []
+
+    def load(user_id):
+        loads.append(user_id)
+        return [order for order in orders if order['user_id'] == user_id]
+
+    cache = OrderHistoryCache(load, lambda value: json.dumps(value).encode(), **kwargs)
+    return cache, loads
+
+
+def test_invalidate_drops_only_that_users_entry():
+    orders = [{'id': 1, 'user_id': 7}, {'id': 2, 'user_id': 8}]
+    cache, loads = make_cache(orders)
+    cache.get(7), cache.get(8), cache.get(7)
+    assert loads == [7, 8] and cache.stats()['hits'] == 1
+
+    orders.append({'id': 3, 'user_id': 7})
+    cache.invalidate(7)
+    assert [order['id'] for order in json.loads(cache.get(7))] == [1, 3]
+    cache.get(8)
+    assert loads == [7, 8, 7]
+
+
+def test_fill_that_raced_an_invalidation_is_not_stored():
+    orders = [{'id': 1, 'user_id': 7}]
+    cache = None
+
+    def load(user_id):
+        rows = [dict(order) for order in orders if order['user_id'] == user_id]
+        # Another request changes the order while this one is encoding
+        orders[0]['status'] = 'shipped'
+        cache.invalidate(user_id)
+        return rows
+
+    cache = OrderHistoryCache(load, lambda value: json.dumps(value).encode())
+    stale = json.loads(cache.get(7))
+    assert 'status' not in stale[0]
+    assert len(cache) == 0
+    assert json.loads(cache.get(7))[0]['status'] == 'shipped'
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache, loads = make_cache([], capacity=2)
+    cache.get(1), cache.get(2), cache.get(1), cache.get(3)
+    assert len(cache) == 2
+    cache.get(1)
+    cache.get(2)
+    assert loads == [1, 2, 3, 2]
+
+
+def test_history_follows_new_orders_and_status_changes(shop, user_client, admin_client):
+    before = user_client.get('/api/user/orders').get_json()
+    assert user_client.get('/api/user/orders').get_json() == before
+
+    response = user_client.post('/api/order', json=ORDER)
+    assert response.status_code == 200
+    history = user_client.get('/api/user/orders').get_json()
+    assert len(history) == len(before) + 1
+    placed = next(order for order in history if order['id'] not in {o['id'] for o in before})
+    assert placed['status'] == 'pending'
+
+    response = admin_client.post(f"/api/admin/orders/{placed['id']}/status", json={'status': 'processing'})
+    assert response.status_code == 200
+    history = user_client.get('/api/user/orders').get_json()
+    assert next(order for order in history if order['id'] == placed['id'])['status'] == 'processing'
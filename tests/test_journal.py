@@ -0,0 +1,147 @@
+import os
+import shutil
+
+import pytest
+
+from journal import Journal
+from store import open_store
+
+
+@pytest.fixture
+def opened():
+    """Open journaled stores and close whatever is still open at teardown"""
+    stores = []
+
+    def open_dir(path):
+        store = open_store(f'memory://{path}')
+        stores.append(store)
+        return store
+
+    yield open_dir
+    for store in stores:
+        if not store.journal._closed:
+            store.close()
+
+
+def crash(store, path, target):
+    """Copy what has reached disk, as a crash would leave it, without closing store"""
+    store.sync()
+    shutil.copytree(path, target)
+    return target
+
+
+def segments(path):
+    return sorted(name for name in os.listdir(path) if name.startswith('journal.'))
+
+
+def rows(table):
+    return {row['id']: dict(row) for row in table.scan()}
+
+
+def test_replay_after_a_crash_restores_every_synced_change(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    users = store.table('users', unique=('email',))
+    for i in range(1, 6):
+        users.insert({'id': i, 'email': f'u{i}@example.com', 'name': f'User {i}'})
+    users.update(2, {'name': 'Renamed'})
+    users.delete(4)
+    expected = rows(users)
+
+    copy = crash(store, tmp_path / 'live', tmp_path / 'crashed')
+    recovered = opened(copy).table('users', unique=('email',), rows=[{'id': 99, 'email': 'seed@example.com'}])
+    assert rows(recovered) == expected
+    assert recovered.get_by('email', 'u2@example.com')['name'] == 'Renamed'
+
+
+def test_torn_tail_is_truncated_and_replay_stops_before_it(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    table = store.table('items')
+    table.insert({'id': 1, 'name': 'kept'})
+    copy = crash(store, tmp_path / 'live', tmp_path / 'crashed')
+
+    last = os.path.join(copy, segments(copy)[-1])
+    intact = os.path.getsize(last)
+    with open(last, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x01\x02\x03\x04partial')
+
+    recovered = opened(copy).table('items')
+    assert rows(recovered) == {1: {'id': 1, 'name': 'kept'}}
+    assert os.path.getsize(last) == intact
+
+
+def test_corruption_before_the_last_segment_is_an_error(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    table = store.table('items')
+    table.insert({'id': 1})
+    store.close()
+    store = opened(tmp_path / 'live')
+    store.table('items').insert({'id': 2})
+    store.close()
+
+    first = os.path.join(tmp_path / 'live', segments(tmp_path / 'live')[0])
+    with open(first, 'r+b') as f:
+        f.truncate(os.path.getsize(first) - 1)
+    with pytest.raises(ValueError, match='corrupt'):
+        Journal(str(tmp_path / 'live'))
+
+
+def test_snapshot_plus_later_segments_replay_to_the_same_state(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    table = store.table('items')
+    emptied = store.table('emptied')
+    for i in range(1, 2501):
+        table.insert({'id': i, 'n': i})
+    emptied.insert({'id': 1})
+    emptied.delete(1)
+    store.sync()
+    before = segments(tmp_path / 'live')
+    assert store.journal.snapshot()
+    assert not set(before) & set(segments(tmp_path / 'live'))
+
+    table.update(1, {'n': -1})
+    table.delete(2)
+    table.insert({'id': 2501, 'n': 2501})
+    expected = rows(table)
+
+    copy = crash(store, tmp_path / 'live', tmp_path / 'crashed')
+    reopened = opened(copy)
+    assert rows(reopened.table('items')) == expected
+    # The emptied table is known to the snapshot, so its seed rows stay out
+    assert rows(reopened.table('emptied', rows=[{'id': 7}])) == {}
+
+
+def test_sequence_leases_survive_a_restart(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    sequence = store.sequence('orders', start=10)
+    issued = [sequence.next() for _ in range(3)]
+    assert issued == [11, 12, 13]
+
+    copy = crash(store, tmp_path / 'live', tmp_path / 'crashed')
+    resumed = opened(copy).sequence('orders', start=10)
+    assert resumed.next() > max(issued)
+
+
+def test_batch_is_replayed_whole_or_not_at_all(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    table = store.table('items')
+    table.insert({'id': 1, 'n': 0})
+    store.sync()
+    path = tmp_path / 'live'
+    single = os.path.getsize(os.path.join(path, segments(path)[-1]))
+    table.apply([('insert', {'id': 2}), ('update', 1, {'n': 5}), ('delete', 2)])
+    copy = crash(store, path, tmp_path / 'whole')
+    torn = shutil.copytree(copy, tmp_path / 'torn')
+    assert rows(opened(copy).table('items')) == {1: {'id': 1, 'n': 5}}
+
+    # Cut the batch's frame short: none of its operations come back
+    last = os.path.join(torn, segments(torn)[-1])
+    os.truncate(last, single + (os.path.getsize(last) - single) // 2)
+    assert rows(opened(torn).table('items')) == {1: {'id': 1, 'n': 0}}
+
+
+def test_lock_file_rejects_a_second_writer(opened, tmp_path):
+    store = opened(tmp_path / 'live')
+    with pytest.raises(RuntimeError, match='in use'):
+        Journal(str(tmp_path / 'live'))
+    store.close()
+    Journal(str(tmp_path / 'live')).close()
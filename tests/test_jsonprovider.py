@@ -0,0 +1,54 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from jsonprovider import FastJSONProvider, compress_responses
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    compress_responses(app, min_size=1024)
+
+    @app.route('/sized/<int:size>')
+    def sized(size):
+        # Two quotes and a newline around the string make a body of exactly size bytes
+        return jsonify('x' * (size - 3))
+
+    return app
+
+
+def test_profile_and_user_listings_never_carry_the_password(shop, user_client):
+    profile = user_client.get('/api/user/profile').get_json()
+    assert profile['email'] == 'john.doe@email.com'
+    assert 'password' not in profile
+
+    with shop.app.app_context():
+        listing = json.loads(shop.app.json.response(list(shop.users.scan())).get_data())
+    assert listing and all('password' not in user for user in listing)
+    assert all(user['password'] for user in shop.users.scan())
+
+
+def test_integers_beyond_64_bits_fall_back_to_the_stdlib(app):
+    with app.app_context():
+        big = {'id': 2 ** 70, 'small': -(2 ** 65)}
+        assert json.loads(app.json.dumps_bytes(big)) == big
+        assert app.json.dumps({'n': 2 ** 64}) == '{"n":18446744073709551616}'
+
+
+@pytest.mark.parametrize('size, encoding', [(1023, None), (1024, 'gzip'), (4096, 'gzip')])
+def test_only_bodies_past_the_threshold_are_compressed(app, size, encoding):
+    response = app.test_client().get(f'/sized/{size}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers.get('Content-Encoding') == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = gzip.decompress(response.data) if encoding else response.data
+    assert len(body) == size
+
+
+def test_clients_without_gzip_get_the_plain_body(app):
+    response = app.test_client().get('/sized/4096', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.data) == 4096
@@ -0,0 +1,74 @@
+import email
+
+import pytest
+
+from mailer import Mailer, SMTPSink, SMTPTransport
+
+
+@pytest.fixture
+def sink():
+    server = SMTPSink().start()
+    yield server
+    server.stop()
+
+
+def smtp_mailer(sink, **options):
+    config = {'smtp_server': '127.0.0.1', 'smtp_port': sink.port, 'email': 'shop@example.com', 'use_tls': False}
+    return Mailer('shop@example.com', transport_factory=lambda: SMTPTransport(config), **options)
+
+
+def test_mail_is_delivered_over_smtp(sink):
+    mailer = smtp_mailer(sink, workers=1)
+    try:
+        mailer.send('john@example.com', 'Your code', 'Your code is 123456\n.\nThanks')
+        mailer.flush()
+    finally:
+        mailer.close()
+    assert mailer.sent == 1 and mailer.failed == 0
+    [delivered] = sink.messages
+    assert delivered['from'] == 'shop@example.com' and delivered['to'] == ['john@example.com']
+    message = email.message_from_string(delivered['data'])
+    assert message['Subject'] == 'Your code' and message['To'] == 'john@example.com'
+    # A line holding just a dot survives SMTP dot-stuffing
+    assert message.get_payload(decode=True).decode().splitlines() == ['Your code is 123456', '.', 'Thanks']
+
+
+def test_one_connection_carries_many_messages_and_reopens_after_idle(sink):
+    connections = []
+    config = {'smtp_server': '127.0.0.1', 'smtp_port': sink.port, 'email': 'shop@example.com', 'use_tls': False}
+
+    class CountingTransport(SMTPTransport):
+        def open(self):
+            if self._smtp is None:
+                connections.append(1)
+            super().open()
+
+    mailer = Mailer('shop@example.com', transport_factory=lambda: CountingTransport(config), workers=1,
+                    idle_timeout=0.05)
+    try:
+        for n in range(5):
+            mailer.send(f'user{n}@example.com', 'Hello', 'Hi')
+        mailer.flush()
+        assert len(connections) == 1
+        # The idle worker drops its connection and the next message opens a new one
+        mailer._workers[0].join(0.2)
+        mailer.send('late@example.com', 'Hello', 'Hi')
+        mailer.flush()
+    finally:
+        mailer.close()
+    assert len(connections) == 2
+    assert [m['to'] for m in sink.messages] == [[f'user{n}@example.com'] for n in range(5)] + [['late@example.com']]
+
+
+def test_unreachable_server_counts_a_failure(sink):
+    port = sink.port
+    sink.stop()
+    config = {'smtp_server': '127.0.0.1', 'smtp_port': port, 'email': 'shop@example.com', 'use_tls': False}
+    mailer = Mailer('shop@example.com', transport_factory=lambda: SMTPTransport(config), workers=1,
+                    max_retries=1, backoff=0.01)
+    try:
+        mailer.send('john@example.com', 'Hello', 'Hi')
+        mailer.flush()
+    finally:
+        mailer.close()
+    assert mailer.sent == 0 and mailer.failed == 1
@@ -0,0 +1,34 @@
+from metrics import RequestMetrics
+
+
+def samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+
+def test_gauge_group_reports_each_number_once_per_scrape():
+    calls = []
+
+    def stats():
+        calls.append(1)
+        return {'size': 3, 'hit_rate': 0.5, 'enabled': True, 'limit': None, 'name': 'x'}
+
+    metrics = RequestMetrics()
+    metrics.gauges('cache', 'Test cache', stats)
+    text = metrics.render()
+    assert len(calls) == 1
+    assert '# HELP cache_hit_rate Test cache: hit rate.' in text
+    values = samples(text)
+    assert values['cache_size'] == '3' and values['cache_hit_rate'] == '0.5'
+    assert not {'cache_enabled', 'cache_limit', 'cache_name'} & set(values)
+
+
+def test_runtime_stats_are_scraped_from_metrics(client, admin_client):
+    values = samples(client.get('/metrics').text)
+    for name in ('event_subscribers', 'password_hashes_in_flight', 'rate_limit_ip_limited',
+                 'order_history_cache_hits', 'otp_store_expired', 'session_store_size'):
+        assert name in values
+    # Every sample name appears once, as the text format requires
+    text = client.get('/metrics').text
+    names = [line.split(' ', 1)[0] for line in text.splitlines() if line and not line.startswith('#')]
+    assert len(names) == len(set(names))
+    assert admin_client.get('/api/admin/token-stores').status_code == 404
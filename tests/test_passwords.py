@@ -0,0 +1,88 @@
+import hashlib
+import threading
+
+import pytest
+
+from passwords import HasherBusy, PasswordHasher, check_password, hash_password
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(n=2 ** 10, workers=2)
+
+
+def test_hash_round_trip_and_salting():
+    stored = hash_password('s3cret', n=2 ** 10)
+    assert stored.startswith('scrypt$1024$8$1$')
+    assert check_password('s3cret', stored) == (True, (1024, 8, 1))
+    assert check_password('S3cret', stored)[0] is False
+    assert hash_password('s3cret', n=2 ** 10) != stored
+
+
+def test_legacy_sha256_hash_is_upgraded_on_a_match(hasher):
+    legacy = hashlib.sha256(b'password123').hexdigest()
+    assert hasher.verify('wrong', legacy) == (False, None)
+    matches, upgraded = hasher.verify('password123', legacy)
+    assert matches and upgraded.startswith('scrypt$1024$')
+    assert hasher.verify('password123', upgraded) == (True, None)
+
+
+def test_hash_is_redone_after_a_cost_change(hasher):
+    old = hash_password('s3cret', n=2 ** 9)
+    matches, rehashed = hasher.verify('s3cret', old)
+    assert matches and check_password('s3cret', rehashed) == (True, (1024, 8, 1))
+    assert hasher.verify('wrong', old) == (False, None)
+
+
+def test_reject_costs_a_hash_and_never_matches(hasher):
+    assert hasher.reject('') == (False, None)
+    completed = hasher.stats()['completed']
+    assert hasher.reject('anything') == (False, None)
+    assert hasher.stats()['completed'] == completed + 1
+
+
+def test_saturated_hasher_sheds_load():
+    busy = PasswordHasher(n=2 ** 10, workers=1, max_pending=1, wait=0.05)
+    release = threading.Event()
+    holder = threading.Thread(target=busy._run, args=(release.wait,))
+    holder.start()
+    try:
+        while busy.stats()['in_flight'] == 0:
+            release.wait(0.001)
+        with pytest.raises(HasherBusy):
+            busy.hash('s3cret')
+        assert busy.stats()['rejected'] == 1
+    finally:
+        release.set()
+        holder.join()
+    assert busy.verify('s3cret', busy.hash('s3cret')) == (True, None)
+
+
+def test_login_answers_503_while_the_hasher_is_busy(shop, client, monkeypatch):
+    def saturated(*args):
+        raise HasherBusy("Password hashing is saturated")
+
+    monkeypatch.setattr(shop.hasher, 'verify', saturated)
+    response = client.post('/api/login', json={'user_type': 'user', 'email': 'john.doe@email.com', 'password': 'x'})
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+
+
+@pytest.mark.parametrize('body', [
+    {'user_type': 'user', 'email': 'john.doe@email.com'},
+    {'user_type': 'user', 'email': 'john.doe@email.com', 'password': None},
+    {'user_type': 'admin', 'username': 'admin', 'password': 'admin123'},
+    ['not', 'an', 'object'],
+])
+def test_login_without_a_password_is_a_bad_request(client, body):
+    assert client.post('/api/login', json=body).status_code == 400
+
+
+@pytest.mark.parametrize('body', [
+    {'user_type': 'user', 'email': 'nobody@example.com', 'password': 'x'},
+    {'user_type': 'admin', 'username': 'nobody', 'password': 'x', 'pin': '0000'},
+])
+def test_unknown_accounts_still_cost_a_hash(shop, client, body):
+    shop.hasher.reject('')  # the dummy hash itself is made once, up front
+    completed = shop.hasher.stats()['completed']
+    assert client.post('/api/login', json=body).status_code == 401
+    assert shop.hasher.stats()['completed'] == completed + 1
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.fixture
+def ip_limits(shop):
+    shop.ip_limiter.enabled = True
+    return shop.ip_limiter
+
+
+def attempt(client, forwarded_for):
+    response = client.post('/api/login', json={'user_type': 'user', 'email': 'nobody@example.com', 'password': 'x'},
+                           headers={'X-Forwarded-For': forwarded_for})
+    return response.status_code
+
+
+def test_clients_behind_the_proxy_get_their_own_buckets(client, ip_limits):
+    statuses = [attempt(client, '203.0.113.1') for _ in range(ip_limits.burst + 1)]
+    assert 429 not in statuses[:-1] and statuses[-1] == 429
+    assert attempt(client, '203.0.113.2') != 429
+
+
+def test_spoofed_forwarded_entries_are_not_trusted(client, ip_limits):
+    for _ in range(ip_limits.burst):
+        attempt(client, '203.0.113.3')
+    # Only the entry our proxy appended counts; anything the client put before it is ignored
+    assert attempt(client, '198.51.100.7, 203.0.113.3') == 429
+
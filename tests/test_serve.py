@@ -0,0 +1,342 @@
+import asyncio
+import contextlib
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from serve import AsyncWSGIServer, PooledWSGIServer, parse_bind
+
+
+def echo_app(environ, start_response):
+    """Answer with the request as JSON, or with the response a test asks for"""
+    path = environ['PATH_INFO']
+    if path == '/stream':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (b'chunk%d;' % i for i in range(3))
+    if path == '/async':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return AsyncBody()
+    if path == '/empty':
+        start_response('204 No Content', [])
+        return []
+    if path == '/crash':
+        raise RuntimeError("boom")
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    data = json.dumps({
+        'method': environ['REQUEST_METHOD'],
+        'path': path,
+        'query': environ['QUERY_STRING'],
+        'body': body.decode('latin-1'),
+        'length': environ.get('CONTENT_LENGTH'),
+        'headers': {key: value for key, value in environ.items() if key.startswith('HTTP_')},
+        'async': environ.get('serve.async', False),
+    }).encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(data)))])
+    return [data]
+
+
+class AsyncBody:
+    closed = []
+
+    def __init__(self):
+        self.parts = [b'async1;', b'async2;']
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        if not self.parts:
+            raise StopAsyncIteration
+        return self.parts.pop(0)
+
+    async def aclose(self):
+        AsyncBody.closed.append(self)
+
+
+@contextlib.contextmanager
+def running(app, **options):
+    """Run an AsyncWSGIServer for app on its own loop thread; yields its port"""
+    sock = socket.create_server(('127.0.0.1', 0))
+    server = AsyncWSGIServer(app, **options)
+    started = threading.Event()
+    state = {}
+
+    async def main():
+        state['loop'], state['task'] = asyncio.get_running_loop(), asyncio.current_task()
+        started.set()
+        try:
+            await server.serve(sock, stop_signals=())
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True)
+    thread.start()
+    started.wait(5)
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        state['loop'].call_soon_threadsafe(state['task'].cancel)
+        thread.join(5)
+        server.pool.shutdown()
+        sock.close()
+
+
+@pytest.fixture(scope='module')
+def async_server():
+    with running(echo_app, threads=4, keep_alive=1, max_body=1024) as port:
+        yield port
+
+
+def exchange(port, raw, responses=1, timeout=3):
+    """Send raw bytes and return (responses parsed so far, whether the server closed)"""
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+        sock.sendall(raw)
+        data = b''
+        closed = False
+        parsed = []
+        deadline = time.monotonic() + timeout
+        while len(parsed) < responses and time.monotonic() < deadline:
+            try:
+                chunk = sock.recv(65536)
+            except socket.timeout:
+                break
+            if not chunk:
+                closed = True
+                break
+            data += chunk
+            parsed, _ = parse_responses(data)
+        if len(parsed) == responses and not closed:
+            sock.settimeout(0.3)
+            try:
+                closed = sock.recv(1) == b''
+            except socket.timeout:
+                pass
+        return parse_responses(data)[0], closed
+
+
+def parse_responses(data):
+    """Split raw HTTP/1.1 responses into (status, headers, body) tuples"""
+    responses = []
+    while b'\r\n\r\n' in data:
+        head, rest = data.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:])}
+        if status == 100:
+            data = rest
+            continue
+        if status in (204, 304):
+            body = b''
+        elif headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            while True:
+                if b'\r\n' not in rest:
+                    return responses, data
+                size_line, rest = rest.split(b'\r\n', 1)
+                size = int(size_line, 16)
+                if len(rest) < size + 2:
+                    return responses, data
+                body, rest = body + rest[:size], rest[size + 2:]
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if len(rest) < length:
+                return responses, data
+            body, rest = rest[:length], rest[length:]
+        else:
+            body, rest = rest, b''
+        responses.append((status, headers, body))
+        data = rest
+    return responses, data
+
+
+def test_get_with_keep_alive(async_server):
+    responses, closed = exchange(async_server, b'GET /a?x=1 HTTP/1.1\r\nHost: t\r\n\r\n'
+                                               b'GET /b HTTP/1.1\r\nHost: t\r\n\r\n', responses=2)
+    assert [r[0] for r in responses] == [200, 200]
+    first = json.loads(responses[0][2])
+    assert first['path'] == '/a' and first['query'] == 'x=1' and first['async'] is True
+    assert json.loads(responses[1][2])['path'] == '/b'
+    assert 'date' in responses[0][1] and not closed
+
+
+def test_pipelined_requests_with_bodies(async_server):
+    raw = (b'POST /one HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc'
+           b'POST /two HTTP/1.1\r\nContent-Length: 2\r\n\r\nde'
+           b'GET /three HTTP/1.1\r\n\r\n')
+    responses, _ = exchange(async_server, raw, responses=3)
+    assert [json.loads(body)['body'] for _, _, body in responses] == ['abc', 'de', '']
+
+
+def test_chunked_request_body(async_server):
+    raw = (b'POST /c HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+           b'3;ext=1\r\nabc\r\n2\r\nde\r\n0\r\nTrailer: x\r\n\r\n')
+    responses, _ = exchange(async_server, raw)
+    echoed = json.loads(responses[0][2])
+    assert echoed['body'] == 'abcde' and echoed['length'] == '5'
+    assert 'HTTP_TRANSFER_ENCODING' not in echoed['headers']
+
+
+def test_expect_continue(async_server):
+    with socket.create_connection(('127.0.0.1', async_server), timeout=3) as sock:
+        sock.sendall(b'POST /e HTTP/1.1\r\nContent-Length: 2\r\nExpect: 100-continue\r\n\r\n')
+        assert sock.recv(1024).startswith(b'HTTP/1.1 100 Continue')
+        sock.sendall(b'ok')
+        status, _, body = parse_responses(sock.recv(65536))[0][0]
+        assert status == 200 and json.loads(body)['body'] == 'ok'
+
+
+def test_repeated_headers_are_joined_and_underscores_dropped(async_server):
+    raw = (b'GET /h HTTP/1.1\r\nAccept: a\r\nAccept: b\r\nCookie: x=1\r\nCookie: y=2\r\n'
+           b'X_Forwarded_For: 6.6.6.6\r\n\r\n')
+    headers = json.loads(exchange(async_server, raw)[0][0][2])['headers']
+    assert headers['HTTP_ACCEPT'] == 'a,b' and headers['HTTP_COOKIE'] == 'x=1; y=2'
+    assert 'HTTP_X_FORWARDED_FOR' not in headers
+
+
+@pytest.mark.parametrize('raw, status', [
+    (b'GARBAGE\r\n\r\n', 400),
+    (b'GET / HTTP/2.0\r\n\r\n', 505),
+    (b'GET / HTTP/1.1\r\nNo colon here\r\n\r\n', 400),
+    (b'GET / HTTP/1.1\r\nBad Name : x\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: 1\r\nContent-Length: 2\r\n\r\nx', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: 2048\r\n\r\n', 413),
+    (b'POST / HTTP/1.1\r\nContent-Length: 5\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n', 501),
+    (b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n', 400),
+    (b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n800\r\n', 413),
+    (b'GET / HTTP/1.1\r\nX-Big: ' + b'a' * 70000 + b'\r\n\r\n', 431),
+])
+def test_malformed_requests_are_rejected_and_closed(async_server, raw, status):
+    responses, closed = exchange(async_server, raw)
+    assert responses[0][0] == status
+    assert responses[0][1]['connection'] == 'close' and closed
+
+
+def test_http_10_closes_unless_asked_to_keep_alive(async_server):
+    responses, closed = exchange(async_server, b'GET /x HTTP/1.0\r\n\r\n')
+    assert responses[0][0] == 200 and closed
+    responses, closed = exchange(async_server, b'GET /x HTTP/1.0\r\nConnection: keep-alive\r\n\r\n')
+    assert responses[0][1]['connection'] == 'keep-alive' and not closed
+
+
+def test_connection_close_is_honoured(async_server):
+    responses, closed = exchange(async_server, b'GET /x HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert responses[0][0] == 200 and closed
+
+
+def test_head_sends_no_body(async_server):
+    with socket.create_connection(('127.0.0.1', async_server), timeout=3) as sock:
+        sock.sendall(b'HEAD /x HTTP/1.1\r\n\r\n')
+        time.sleep(0.3)
+        data = sock.recv(65536)
+        head, _, rest = data.partition(b'\r\n\r\n')
+        # Content-Length describes the GET body, but none follows
+        assert head.startswith(b'HTTP/1.1 200') and b'Content-Length: ' in head
+        assert rest == b''
+        sock.sendall(b'GET /x HTTP/1.1\r\n\r\n')
+        assert sock.recv(65536).startswith(b'HTTP/1.1 200')
+
+
+def test_streamed_bodies_are_chunked(async_server):
+    responses, _ = exchange(async_server, b'GET /stream HTTP/1.1\r\n\r\nGET /async HTTP/1.1\r\n\r\n', responses=2)
+    assert responses[0][1]['transfer-encoding'] == 'chunked'
+    assert responses[0][2] == b'chunk0;chunk1;chunk2;'
+    assert responses[1][2] == b'async1;async2;'
+    assert AsyncBody.closed
+
+
+def test_streamed_body_over_http_10_ends_with_the_connection(async_server):
+    with socket.create_connection(('127.0.0.1', async_server), timeout=3) as sock:
+        sock.sendall(b'GET /stream HTTP/1.0\r\n\r\n')
+        data = b''
+        while chunk := sock.recv(65536):
+            data += chunk
+    head, _, body = data.partition(b'\r\n\r\n')
+    assert b'Transfer-Encoding' not in head and b'Connection: close' in head
+    assert body == b'chunk0;chunk1;chunk2;'
+
+
+def test_no_content_has_no_length_or_chunks(async_server):
+    responses, closed = exchange(async_server, b'GET /empty HTTP/1.1\r\n\r\nGET /x HTTP/1.1\r\n\r\n', responses=2)
+    assert responses[0][0] == 204 and 'content-length' not in responses[0][1]
+    assert 'transfer-encoding' not in responses[0][1]
+    assert responses[1][0] == 200 and not closed
+
+
+def test_app_error_answers_500(async_server):
+    responses, closed = exchange(async_server, b'GET /crash HTTP/1.1\r\n\r\n')
+    assert responses[0][0] == 500 and closed
+
+
+def test_idle_connection_times_out(async_server):
+    with socket.create_connection(('127.0.0.1', async_server), timeout=3) as sock:
+        started = time.monotonic()
+        assert sock.recv(1) == b''
+        assert time.monotonic() - started < 2.5
+
+
+def test_event_stream_holds_no_thread(shop, admin_client):
+    """Through the real app, /api/events is iterated on the loop and released on disconnect"""
+    cookie = admin_client.get_cookie(shop.app.config['SESSION_COOKIE_NAME']).value
+    before = len(shop.events)
+    with running(shop.app, threads=1, keep_alive=1) as port:
+        streams = []
+        for _ in range(3):
+            stream = socket.create_connection(('127.0.0.1', port), timeout=3)
+            stream.sendall(f"GET /api/events HTTP/1.1\r\nCookie: session={cookie}\r\n\r\n".encode())
+            received = b''
+            while b'retry: 3000' not in received:
+                received += stream.recv(4096)
+            streams.append(stream)
+        # Three open streams and a single app thread, yet requests still get through
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=3)
+        conn.request('GET', '/api/products/1')
+        assert conn.getresponse().status == 200
+        conn.close()
+        assert len(shop.events) == before + 3
+
+        for stream in streams:
+            stream.close()
+        # The next write to a closed stream fails and releases its subscription
+        deadline = time.monotonic() + 3
+        while len(shop.events) > before and time.monotonic() < deadline:
+            shop.publish_order('order.created', shop.orders.get(1))
+            time.sleep(0.05)
+        assert len(shop.events) == before
+
+
+def test_pooled_sync_server_serves_on_a_passed_socket():
+    sock = socket.create_server(('127.0.0.1', 0))
+    host, port = sock.getsockname()
+    server = PooledWSGIServer(host, port, echo_app, threads=2, fd=sock.fileno())
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection(host, port, timeout=3)
+        conn.request('POST', '/p', body=b'xyz')
+        response = conn.getresponse()
+        assert response.status == 200 and json.loads(response.read())['body'] == 'xyz'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('bind, expected', [
+    ('127.0.0.1:8000', ('127.0.0.1', 8000)),
+    (':9000', ('0.0.0.0', 9000)),
+    ('[::1]:8080', ('::1', 8080)),
+])
+def test_parse_bind(bind, expected):
+    assert parse_bind(bind) == expected
+
+
+def test_parse_bind_rejects_missing_port():
+    with pytest.raises(ValueError):
+        parse_bind('localhost')
@@ -0,0 +1,110 @@
+import pytest
+from flask import Flask, jsonify, session
+
+from cart import CartEngine
+from catalog import PriceEntry
+from ratelimit import RateLimited, RateLimiter
+from sessions import StoreSessionInterface, shared_secret
+from store import open_store
+from ttl import TTLStore
+
+
+@pytest.fixture
+def store_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'shared.db'}"
+
+
+def worker(store_url):
+    """One worker process's view of the app: its own store connection, sessions and signing key"""
+    db = open_store(store_url)
+    app = Flask(__name__)
+    app.secret_key = shared_secret(db.table('settings', key='name'))
+    sessions = TTLStore(db.table('sessions', key='sid'), ttl=60)
+    app.session_interface = StoreSessionInterface(sessions, ttl=60)
+
+    @app.route('/login/<name>')
+    def login(name):
+        session['user'] = name
+        return jsonify(ok=True)
+
+    @app.route('/whoami')
+    def whoami():
+        return jsonify(user=session.get('user'))
+
+    @app.route('/logout')
+    def logout():
+        session.pop('user', None)
+        return jsonify(ok=True)
+
+    app.sessions = sessions
+    return app
+
+
+def cookie(response):
+    return response.headers['Set-Cookie'].split(';', 1)[0].split('=', 1)[1]
+
+
+def whoami(app, sid):
+    client = app.test_client()
+    client.set_cookie('session', sid)
+    return client.get('/whoami').get_json()['user']
+
+
+def test_workers_share_the_signing_key(store_url):
+    assert worker(store_url).secret_key == worker(store_url).secret_key
+
+
+def test_a_session_started_on_one_worker_is_seen_and_revoked_on_another(store_url):
+    first, second = worker(store_url), worker(store_url)
+    sid = cookie(first.test_client().get('/login/ana'))
+    assert whoami(second, sid) == 'ana'
+
+    client = second.test_client()
+    client.set_cookie('session', sid)
+    client.get('/logout')
+    assert whoami(first, sid) is None
+    assert first.sessions.get(sid) is None
+
+
+def test_session_id_changes_when_the_data_does(store_url):
+    app = worker(store_url)
+    client = app.test_client()
+    client.set_cookie('session', 'planted-before-login')
+    sid = cookie(client.get('/login/ana'))
+    assert sid != 'planted-before-login'
+    renewed = cookie(client.get('/login/bo'))
+    assert renewed != sid and app.sessions.get(sid) is None
+    assert whoami(app, renewed) == 'bo'
+
+
+def test_anonymous_visits_store_nothing(store_url):
+    app = worker(store_url)
+    response = app.test_client().get('/whoami')
+    assert 'Set-Cookie' not in response.headers
+    assert len(app.sessions.table) == 0
+
+
+def test_workers_share_carts(store_url):
+    prices = {1: PriceEntry(250, 'Sock', True, None)}
+    carts = [CartEngine(lambda: prices, table=open_store(store_url).table('carts', key='user_id')) for _ in range(2)]
+    carts[0].apply(5, [{'action': 'add', 'item': {'id': 1}}])
+    carts[1].apply(5, [{'action': 'add', 'item': {'id': 1, 'quantity': 2}}])
+    assert carts[0].get(5)['items'][0]['quantity'] == 3
+    carts[1].clear(5)
+    assert carts[0].get(5)['count'] == 0
+
+
+def test_workers_share_rate_limit_buckets(store_url):
+    limiters = [RateLimiter(burst=3, per=60, table=open_store(store_url).table('limits', key='key')) for _ in range(2)]
+    for n in range(3):
+        limiters[n % 2].check('login:203.0.113.1')
+    with pytest.raises(RateLimited):
+        limiters[1].check('login:203.0.113.1')
+
+
+def test_app_logout_revokes_the_stored_session(shop, user_client):
+    sid = user_client.get_cookie('session').value
+    assert shop.sessions.get(sid)['data']['user']['email'] == 'john.doe@email.com'
+    user_client.post('/api/logout')
+    assert shop.sessions.get(sid) is None
+    assert user_client.get('/api/user/orders').status_code == 401
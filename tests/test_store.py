@@ -0,0 +1,108 @@
+import random
+import threading
+
+import pytest
+
+from store import Table, modify_or_insert, open_store
+
+DATES = ['2024-01-0%d' % day for day in range(1, 10)]
+
+
+def order_rows(count=60, seed=7):
+    chooser = random.Random(seed)
+    return [{'id': i, 'date': chooser.choice(DATES + [None]), 'status': 'pending'} for i in range(1, count + 1)]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def table(request, tmp_path, monkeypatch):
+    # Small chunks so scans cross chunk and bucket boundaries
+    monkeypatch.setattr(Table, 'SCAN_CHUNK', 4)
+    url = 'memory://' if request.param == 'memory' else f"sqlite:///{tmp_path / 'store.db'}"
+    return open_store(url).table('orders', multi=('status',), ordered=('date',), rows=order_rows())
+
+
+def expected(rows, low, high, descending):
+    matches = [(r['date'], r['id']) for r in rows
+               if r['date'] is not None and (low is None or r['date'] >= low) and (high is None or r['date'] <= high)]
+    return [pk for _, pk in sorted(matches, reverse=descending)]
+
+
+@pytest.mark.parametrize('low, high', [(None, None), ('2024-01-03', '2024-01-05'), ('2024-01-04', None),
+                                       (None, '2024-01-02'), ('2024-01-05', '2024-01-05'), ('2025', None)])
+@pytest.mark.parametrize('descending', [False, True])
+def test_scan_range_walks_the_range_in_value_order(table, low, high, descending):
+    ids = [r['id'] for r in table.scan_range('date', low, high, descending=descending)]
+    assert ids == expected(order_rows(), low, high, descending)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_scan_range_resumes_after_a_position(table, descending):
+    full = [(r['date'], r['id']) for r in table.scan_range('date', '2024-01-02', '2024-01-08', descending=descending)]
+    for cut in (0, 5, len(full) - 1):
+        rest = [(r['date'], r['id']) for r in
+                table.scan_range('date', '2024-01-02', '2024-01-08', after=full[cut], descending=descending)]
+        assert rest == full[cut + 1:]
+
+
+def test_scan_range_follows_updates_and_deletes(table):
+    moved = next(r['id'] for r in table.scan_range('date', '2024-01-01', '2024-01-01'))
+    table.update(moved, {'date': '2030-01-01'})
+    assert [r['id'] for r in table.scan_range('date', '2030-01-01')] == [moved]
+    table.delete(moved)
+    assert list(table.scan_range('date', '2030-01-01')) == []
+    for row in table.find('date', '2024-01-09'):
+        table.delete(row['id'])
+    assert '2024-01-09' not in {r['date'] for r in table.scan_range('date')}
+
+
+def test_restored_table_rebuilds_the_ordered_index():
+    table = Table('orders', ordered=('date',))
+    table.restore(order_rows())
+    assert [r['id'] for r in table.scan_range('date')] == expected(order_rows(), None, None, False)
+
+
+def allocate(sequences, threads=8, each=250):
+    """Draw ids from the given sequences on several threads at once"""
+    results = [[] for _ in range(threads)]
+
+    def draw(n):
+        sequence = sequences[n % len(sequences)]
+        results[n].extend(sequence.next() for _ in range(each))
+
+    workers = [threading.Thread(target=draw, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return [value for chunk in results for value in chunk]
+
+
+def test_memory_sequence_never_repeats_under_threads():
+    ids = allocate([open_store('memory://').sequence('orders', start=100)])
+    assert sorted(ids) == list(range(101, 101 + len(ids)))
+
+
+def test_sqlite_sequences_in_several_workers_never_collide(tmp_path):
+    url = f"sqlite:///{tmp_path / 'ids.db'}"
+    ids = allocate([open_store(url).sequence('orders', start=100, block=7) for _ in range(3)])
+    assert len(set(ids)) == len(ids) and min(ids) > 100
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_modify_or_insert_creates_then_changes_and_survives_an_insert_race(tmp_path, backend):
+    url = 'memory://' if backend == 'memory' else f"sqlite:///{tmp_path / 'store.db'}"
+    counters = open_store(url).table('counters', key='name')
+
+    def bump(record):
+        return {'hits': record['hits'] + 1}, record['hits'] + 1
+
+    assert modify_or_insert(counters, 'a', bump, lambda: ({'name': 'a', 'hits': 1}, 1)) == 1
+    assert modify_or_insert(counters, 'a', bump, lambda: ({'name': 'a', 'hits': 1}, 1)) == 2
+
+    def create_after_another_worker():
+        # Another worker inserts the record between the missed modify and this insert
+        counters.insert({'name': 'b', 'hits': 5})
+        return {'name': 'b', 'hits': 1}, 1
+
+    assert modify_or_insert(counters, 'b', bump, create_after_another_worker) == 6
+    assert counters.get('b')['hits'] == 6
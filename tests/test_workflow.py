@@ -0,0 +1,127 @@
+import pytest
+
+from store import Table
+from workflow import OrderWorkflow, TransitionError
+
+
+@pytest.fixture
+def workflow():
+    orders = Table('orders', multi=('status',), rows=[
+        {'id': 1, 'status': 'pending'},
+        {'id': 2, 'status': 'pending'},
+        {'id': 3, 'status': 'processing'},
+        {'id': 4, 'status': 'delivered'},
+    ])
+    return OrderWorkflow(orders, max_batch=3)
+
+
+@pytest.mark.parametrize('path', [
+    ['processing', 'shipped', 'delivered'],
+    ['processing', 'cancelled'],
+    ['cancelled'],
+])
+def test_allowed_paths_move_an_order_to_the_end(workflow, path):
+    for status in path:
+        changed, errors, moved = workflow.transition([1], status)
+        assert not errors and changed[0]['status'] == status
+    assert workflow.orders.get(1)['status'] == path[-1]
+
+
+@pytest.mark.parametrize('order_id, status, error', [
+    (1, 'shipped', 'Cannot move a pending order to shipped'),
+    (4, 'cancelled', 'Cannot move a delivered order to cancelled'),
+    (99, 'processing', 'Order not found'),
+])
+def test_disallowed_moves_are_reported_and_left_alone(workflow, order_id, status, error):
+    changed, errors, _ = workflow.transition([order_id], status)
+    assert changed == [] and errors == {order_id: error}
+
+
+def test_batch_moves_what_it_can_and_counts_by_old_status(workflow):
+    changed, errors, moved = workflow.transition([1, 3, 4], 'cancelled')
+    assert sorted(order['id'] for order in changed) == [1, 3]
+    assert set(errors) == {4}
+    assert moved == {'pending': 1, 'processing': 1}
+    assert workflow.counts() == {'pending': 1, 'processing': 0, 'shipped': 0, 'delivered': 1, 'cancelled': 2}
+
+
+def test_expected_status_guards_against_stale_clients(workflow):
+    changed, errors, _ = workflow.transition([1, 3], 'cancelled', expected='pending')
+    assert [order['id'] for order in changed] == [1]
+    assert errors == {3: 'Order is processing, not pending'}
+
+
+@pytest.mark.parametrize('ids, status, expected, http_status', [
+    ([1], 'lost', None, 400),
+    ([1], 'processing', 'lost', 400),
+    ([], 'processing', None, 400),
+    ([1, 2, 3, 4], 'cancelled', None, 400),
+])
+def test_bad_requests_raise(workflow, ids, status, expected, http_status):
+    with pytest.raises(TransitionError) as raised:
+        workflow.transition(ids, status, expected)
+    assert raised.value.status == http_status
+    assert workflow.orders.get(1)['status'] == 'pending'
+
+
+def place(client, product_id, quantity=1):
+    response = client.post('/api/order', json={'items': [{'product_id': product_id, 'quantity': quantity}],
+                                                'address': '1 Test Lane'})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['order_id']
+
+
+def order_id(shop, order_number):
+    return next(o['id'] for o in shop.orders.find('user_id', 1) if o['order_number'] == order_number)
+
+
+def test_status_route_walks_the_workflow(shop, admin_client, user_client):
+    placed = order_id(shop, place(user_client, 1))
+    url = f'/api/admin/orders/{placed}/status'
+    assert admin_client.post(url, json={'status': 'shipped'}).status_code == 409
+    response = admin_client.post(url, json={'status': 'processing', 'from': 'pending'})
+    assert response.status_code == 200 and response.get_json()['order']['status'] == 'processing'
+    assert admin_client.post(url, json={'status': 'processing', 'from': 'pending'}).status_code == 409
+    assert admin_client.post(url, json={'status': 'nowhere'}).status_code == 400
+    assert admin_client.post('/api/admin/orders/999999/status', json={'status': 'processing'}).status_code == 404
+    assert user_client.post(url, json={'status': 'shipped'}).status_code == 401
+    admin_client.post(url, json={'status': 'cancelled'})
+
+
+def test_cancelling_returns_counted_stock(shop, admin_client, user_client, stocked_product):
+    placed = order_id(shop, place(user_client, stocked_product, 2))
+    assert shop.products.get(stocked_product)['stock'] == 1
+    response = admin_client.post(f'/api/admin/orders/{placed}/status', json={'status': 'cancelled'})
+    assert response.status_code == 200
+    assert shop.products.get(stocked_product)['stock'] == 3
+    assert shop.catalog_index.prices()[stocked_product].stock == 3
+
+
+def test_bulk_route_drains_a_queue(shop, admin_client, user_client):
+    placed = {order_id(shop, place(user_client, 1)) for _ in range(3)}
+    pending_before = shop.order_workflow.counts()['pending']
+    response = admin_client.post('/api/admin/orders/status', json={'from': 'pending', 'status': 'processing',
+                                                                   'limit': pending_before})
+    assert response.status_code == 200 and response.get_json()['changed'] == pending_before
+    assert all(shop.orders.get(i)['status'] == 'processing' for i in placed)
+    assert shop.order_workflow.counts()['pending'] == 0
+    assert shop.sales_stats.snapshot()['orders_by_status'].get('pending', 0) == 0
+
+    response = admin_client.post('/api/admin/orders/status', json={'ids': sorted(placed) + [999999],
+                                                                   'status': 'cancelled'})
+    body = response.get_json()
+    assert body['changed'] == 3 and body['errors'] == {'999999': 'Order not found'} and not body['success']
+    assert admin_client.post('/api/admin/orders/status', json={'ids': 'all', 'status': 'cancelled'}).status_code == 400
+    assert admin_client.post('/api/admin/orders/status',
+                             json={'from': 'pending', 'status': 'processing', 'limit': 'x'}).status_code == 400
+
+
+def test_cancelling_takes_the_order_out_of_the_sales_stats(shop, admin_client, user_client):
+    before = shop.sales_stats.snapshot()
+    placed = order_id(shop, place(user_client, 1, 2))
+    assert shop.sales_stats.snapshot()['total_revenue'] > before['total_revenue']
+    admin_client.post(f'/api/admin/orders/{placed}/status', json={'status': 'cancelled'})
+    after = admin_client.get('/api/admin/stats').get_json()
+    assert after['total_revenue'] == before['total_revenue']
+    assert after['top_products'] == before['top_products']
+    assert after['orders_by_status']['cancelled'] == before['orders_by_status'].get('cancelled', 0) + 1
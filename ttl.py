@@ -0,0 +1,148 @@
+import heapq
+import sys
+import threading
+import time
+
+
+class TTLStore:
+    """
+    Self-expiring records on top of a storage table.
+
+    Each record carries an absolute 'expires' timestamp. Reads treat expired
+    records as missing, a min-heap of (expires, key) lets the sweeper drop
+    expired records in O(log n) each without scanning, and a hard capacity
+    evicts the records closest to expiry first. Lookups by any unique field
+    of the table (e.g. token -> reset entry) go through its index.
+    """
+
+    def __init__(self, table, ttl, capacity=10000, sweep_interval=30, purge_every=10):
+        self.table = table
+        self.ttl = ttl
+        self.capacity = capacity
+        self.sweep_interval = sweep_interval
+        self.purge_every = purge_every
+        self.expired_count = 0
+        self.evicted_count = 0
+        self._heap = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._sweeper = None
+        for record in table.scan():
+            self._heap.append((record['expires'], record[table.key]))
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def _live(self, record, include_expired=False):
+        if record is None or include_expired or record['expires'] > time.time():
+            return record
+        with self._lock:
+            if self.table.delete(record[self.table.key]) is not None:
+                self.expired_count += 1
+        return None
+
+    def get(self, key, include_expired=False):
+        """Return the live record for key, or None once it has expired"""
+        return self._live(self.table.get(key), include_expired)
+
+    def get_by(self, field, value, include_expired=False):
+        """Return the live record whose unique field equals value"""
+        return self._live(self.table.get_by(field, value), include_expired)
+
+    def expired(self, record):
+        return record['expires'] <= time.time()
+
+    def put(self, record, ttl=None):
+        """Insert or replace a record that expires ttl seconds from now"""
+        key = record[self.table.key]
+        record = dict(record, expires=time.time() + (ttl or self.ttl))
+        with self._lock:
+            self.table.delete(key)
+            while len(self.table) >= self.capacity and self._evict_one():
+                pass
+            self.table.insert(record)
+            heapq.heappush(self._heap, (record['expires'], key))
+        return record
+
+    def update(self, key, changes, ttl=None):
+        """Apply changes to a record, restarting its TTL when ttl is given"""
+        with self._lock:
+            if ttl is not None:
+                changes = dict(changes, expires=time.time() + ttl)
+            record = self.table.update(key, changes)
+            if record is not None and ttl is not None:
+                heapq.heappush(self._heap, (record['expires'], key))
+            return record
+
+    def delete(self, key):
+        return self.table.delete(key)
+
+    def _evict_one(self):
+        while self._heap:
+            expires, key = heapq.heappop(self._heap)
+            record = self.table.get(key)
+            # Heap entries left behind by updates or deletes are skipped
+            if record is not None and record['expires'] == expires:
+                self.table.delete(key)
+                self.evicted_count += 1
+                return True
+        return False
+
+    def sweep(self):
+        """Drop every expired record the heap knows about; returns how many"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires, key = heapq.heappop(self._heap)
+                record = self.table.get(key)
+                if record is not None and record['expires'] == expires:
+                    self.table.delete(key)
+                    removed += 1
+            self.expired_count += removed
+        return removed
+
+    def purge(self):
+        """
+        Drop expired records with a full scan, catching records written by
+        other processes sharing the table, which this heap never saw
+        """
+        now = time.time()
+        expired = [r[self.table.key] for r in self.table.scan() if r['expires'] <= now]
+        with self._lock:
+            for key in expired:
+                if self.table.delete(key) is not None:
+                    self.expired_count += 1
+        return len(expired)
+
+    def start_sweeper(self, shared=False):
+        """Run sweep() every sweep_interval seconds (and purge() now and then if shared)"""
+        def run():
+            sweeps = 0
+            while not self._stop.wait(self.sweep_interval):
+                self.sweep()
+                sweeps += 1
+                if shared and sweeps % self.purge_every == 0:
+                    self.purge()
+
+        self._sweeper = threading.Thread(target=run, daemon=True, name=f"sweeper-{self.table.name}")
+        self._sweeper.start()
+        return self
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def stats(self):
+        """Size, capacity and expiry/eviction counters for monitoring"""
+        return {
+            "size": len(self.table),
+            "capacity": self.capacity,
+            "heap_entries": len(self._heap),
+            "heap_bytes": sys.getsizeof(self._heap),
+            "expired": self.expired_count,
+            "evicted": self.evicted_count
+        }
@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Show dashboard by default
     showSection('dashboard');
+    
+    // Listen for changes to this customer's orders
+    connectOrderEvents();
 });
 
 function setupEventListeners() {
@@ -144,6 +147,53 @@ function animateCounter(title, targetValue, prefix = '') {
     }
 }
 
+function connectOrderEvents() {
+    // The server pushes updates to this customer's orders; EventSource
+    // reconnects by itself and resumes after the last event it saw
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource('/api/events');
+    
+    source.addEventListener('order.status', function(e) {
+        const order = JSON.parse(e.data);
+        document.querySelectorAll('.order-item').forEach(item => {
+            const orderId = item.querySelector('.order-id');
+            const badge = item.querySelector('.order-status');
+            if (orderId && badge && orderId.textContent === '#' + order.order_number) {
+                badge.className = 'order-status ' + order.status;
+                badge.textContent = order.status.charAt(0).toUpperCase() + order.status.slice(1);
+            }
+        });
+    });
+    
+    source.addEventListener('order.created', function(e) {
+        const order = JSON.parse(e.data);
+        const list = document.querySelector('.recent-orders .orders-list');
+        if (list) {
+            const item = document.createElement('div');
+            item.className = 'order-item';
+            item.innerHTML = `
+                <div class="order-info">
+                    <p class="order-id"></p>
+                    <p class="order-date"></p>
+                </div>
+                <div class="order-details">
+                    <p class="order-amount"></p>
+                </div>
+                <div class="order-status"></div>
+            `;
+            item.querySelector('.order-id').textContent = '#' + order.order_number;
+            item.querySelector('.order-date').textContent = order.date;
+            item.querySelector('.order-amount').textContent = '$' + order.total.toFixed(2);
+            const badge = item.querySelector('.order-status');
+            badge.className = 'order-status ' + order.status;
+            badge.textContent = order.status.charAt(0).toUpperCase() + order.status.slice(1);
+            list.prepend(item);
+        }
+    });
+}
+
 async function handleProfileUpdate(e) {
     e.preventDefault();
     
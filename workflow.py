@@ -0,0 +1,85 @@
+from collections import Counter
+
+# status -> statuses an order may move to next; the order matters for display
+TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': (),
+    'cancelled': (),
+}
+
+
+class TransitionError(ValueError):
+    """A status change that is not allowed; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.status = status
+
+
+class OrderWorkflow:
+    """
+    Order lifecycle: validates status changes against the TRANSITIONS state
+    machine and applies them in bulk.
+
+    A batch of orders changes with one orders.modify() call - one lock (or
+    one transaction on a shared store) however many orders it moves - and
+    orders that cannot move (unknown, or not in a status that allows it)
+    are reported individually while the rest change. The orders table's
+    status index keeps each queue (e.g. every processing order for the
+    kitchen) listable and countable in O(k).
+    """
+
+    def __init__(self, orders, transitions=TRANSITIONS, max_batch=1000):
+        self.orders = orders
+        self.transitions = transitions
+        self.max_batch = max_batch
+
+    def check_status(self, status):
+        if status not in self.transitions:
+            raise TransitionError(f"Unknown status {status!r} (expected one of {', '.join(self.transitions)})", 400)
+
+    def counts(self):
+        """Return {status: number of orders} read from the status index"""
+        return {status: self.orders.count('status', status) for status in self.transitions}
+
+    def transition(self, order_ids, status, expected=None):
+        """
+        Move the given orders to status; returns (changed, errors, moved).
+
+        changed lists the updated orders, errors maps each order id that was
+        left alone to the reason and moved counts the changed orders by the
+        status they left. With expected set, only orders currently in that
+        status are moved, so a stale client cannot skip a step.
+        """
+        self.check_status(status)
+        if expected is not None:
+            self.check_status(expected)
+        order_ids = list(dict.fromkeys(order_ids))
+        if not order_ids:
+            raise TransitionError("No orders given", 400)
+        if len(order_ids) > self.max_batch:
+            raise TransitionError(f"At most {self.max_batch} orders per request", 400)
+
+        errors = {}
+        moved = Counter()
+
+        def advance(records):
+            changes = {}
+            for order_id, order in records.items():
+                if order is None:
+                    errors[order_id] = "Order not found"
+                    continue
+                current = order['status']
+                if expected is not None and current != expected:
+                    errors[order_id] = f"Order is {current}, not {expected}"
+                elif status not in self.transitions.get(current, ()):
+                    errors[order_id] = f"Cannot move a {current} order to {status}"
+                else:
+                    changes[order_id] = {'status': status}
+                    moved[current] += 1
+            return changes
+
+        changed = self.orders.modify(order_ids, advance)
+        return changed, errors, moved